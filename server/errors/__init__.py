@@ -0,0 +1,3 @@
+from .fingerprint import error_message, fingerprint
+from .ingest import CountFile, RateLimiter, cap_error
+from .store import ErrorRecord, ErrorStore, format_error_context
@@ -0,0 +1,86 @@
+import hashlib
+import re
+from typing import Any, Dict, List
+
+# Frames from the top of the stack that identify an error
+FINGERPRINT_FRAMES = 5
+
+_URL_ORIGIN = re.compile(r"[a-z][a-z0-9+.-]*://[^/\s)]*", re.IGNORECASE)
+_LINE_COLUMN = re.compile(r"(:\d+)+(?=\)?$)")
+_QUERY = re.compile(r"\?[^\s):]*")
+_CHUNK_HASH = re.compile(r"[.-][0-9a-f]{6,}(?=\.[a-z]+\b)", re.IGNORECASE)
+_HEX = re.compile(r"\b0x[0-9a-f]+\b|\b[0-9a-f]{8,}\b", re.IGNORECASE)
+_NUMBER = re.compile(r"\d+")
+
+# Frames from these locations matter less than the app's own code
+LIBRARY_MARKERS = (
+    "node_modules",
+    "webpack",
+    "react-dom",
+    "next/dist",
+    "_next/static/chunks/framework",
+    "_next/static/chunks/main",
+    "<anonymous>",
+    "native",
+)
+
+
+def error_message(error: Dict[str, Any]) -> str:
+    """The message of a reported error, whatever field the client used."""
+    for field in ("message", "error", "msg"):
+        value = error.get(field)
+        if value:
+            return value if isinstance(value, str) else str(value)
+    return ""
+
+
+def normalize_message(message: str) -> str:
+    """Drop numbers and ids that differ between otherwise identical errors."""
+    message = _HEX.sub("<id>", message.strip())
+    return _NUMBER.sub("N", message)
+
+
+def normalize_frame(frame: str) -> str:
+    """Reduce a stack frame to its function and file, without positions.
+
+    Handles both ``at fn (url:line:col)`` and ``fn@url:line:col`` frames and
+    drops origins, query strings and content hashes in chunk file names.
+    """
+    frame = frame.strip()
+    if frame.startswith("at "):
+        frame = frame[3:]
+    frame = frame.replace("webpack-internal:///", "")
+    frame = _URL_ORIGIN.sub("", frame)
+    frame = _QUERY.sub("", frame)
+    frame = _LINE_COLUMN.sub("", frame)
+    frame = _CHUNK_HASH.sub("", frame)
+    return frame
+
+
+def stack_frames(error: Dict[str, Any]) -> List[str]:
+    """Frames of the error's stack, top first, as reported."""
+    stack = error.get("stack")
+    if not isinstance(stack, str):
+        return []
+    frames = []
+    for line in stack.splitlines():
+        line = line.strip()
+        if line.startswith("at ") or "@" in line:
+            frames.append(line)
+    return frames
+
+
+def is_library_frame(frame: str) -> bool:
+    return any(marker in frame for marker in LIBRARY_MARKERS)
+
+
+def fingerprint(error: Dict[str, Any]) -> str:
+    """Identity of an error: its message plus its top normalized frames."""
+    parts = [
+        str(error.get("type") or error.get("name") or ""),
+        normalize_message(error_message(error)),
+    ]
+    parts += [normalize_frame(frame) for frame in stack_frames(error)][
+        :FINGERPRINT_FRAMES
+    ]
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:16]
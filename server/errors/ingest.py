@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+DEFAULT_RATE = 20.0  # errors per second per source
+DEFAULT_BURST = 100
+
+# Longest string kept in any field of a reported error
+MAX_FIELD_CHARS = 8 * 1024
+# Fields kept per reported error
+MAX_FIELDS = 50
+
+DEFAULT_FLUSH_INTERVAL = 0.5  # seconds between count file writes
+
+
+class RateLimiter:
+    """Token bucket per error source.
+
+    Each source may report ``burst`` errors at once and ``rate`` errors per
+    second after that. Buckets of sources that have been quiet long enough
+    to refill are forgotten.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def allow(self, source: str, count: int = 1) -> int:
+        """Take up to ``count`` tokens; returns how many were granted."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(source, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            granted = min(count, int(tokens))
+            self._buckets[source] = [tokens - granted, now]
+            self.limited += count - granted
+            if len(self._buckets) > 1000:
+                self._forget_idle_locked(now)
+            return granted
+
+    def _forget_idle_locked(self, now: float):
+        refill = self.burst / self.rate if self.rate else 0
+        for source, (tokens, updated) in list(self._buckets.items()):
+            if now - updated >= refill:
+                del self._buckets[source]
+
+
+def cap_error(error: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a reported error with long strings and extra fields cut off."""
+    capped = {}
+    for key, value in list(error.items())[:MAX_FIELDS]:
+        if isinstance(value, str) and len(value) > MAX_FIELD_CHARS:
+            value = value[:MAX_FIELD_CHARS] + "... [truncated]"
+        elif not isinstance(value, (str, int, float, bool, type(None))):
+            # Nested values are kept, but not beyond the same size limit
+            text = str(value)
+            if len(text) > MAX_FIELD_CHARS:
+                value = text[:MAX_FIELD_CHARS] + "... [truncated]"
+        capped[str(key)[:200]] = value
+    return capped
+
+
+class CountFile:
+    """Writes the stored error count to a file from a background thread.
+
+    ``set`` only records the new count; the thread writes it at most once
+    per ``interval`` seconds, so a burst of reports costs one write.
+    """
+
+    def __init__(self, path: str, interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._count: Optional[int] = None
+        self._written: Optional[int] = None
+        self._cond = threading.Condition()
+        self._flusher: Optional[threading.Thread] = None
+        self.writes = 0
+
+    def set(self, count: int):
+        with self._cond:
+            self._count = count
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+            self._cond.notify()
+
+    def flush(self):
+        """Write the latest count now, if it hasn't been written yet."""
+        with self._cond:
+            count = self._count
+            if count is None or count == self._written:
+                return
+            self._written = count
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(count))
+            os.replace(tmp_path, self.path)
+            self.writes += 1
+        except OSError as e:
+            print(f"Could not write error count file: {e}")
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while self._count == self._written:
+                    self._cond.wait()
+            self.flush()
+            time.sleep(self.interval)
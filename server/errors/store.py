@@ -0,0 +1,253 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .fingerprint import error_message, fingerprint, is_library_frame, stack_frames
+
+DEFAULT_MAX_ERRORS = 10  # distinct errors kept
+
+# Size budget of the error context added to a prompt, in characters
+# (roughly 4 characters per token)
+DEFAULT_CONTEXT_BUDGET = 6000
+
+CONTEXT_HEADER = (
+    "\n\nImportant: The following errors were detected in the Next.js application. "
+    "Please analyze and fix these errors in your response:\n"
+)
+
+# Appended to an error message cut short to fit the budget
+TRUNCATED_MARKER = "…truncated"
+
+# Fields shown separately or not worth sending to Claude
+_RENDERED_FIELDS = {"message", "error", "msg", "stack", "id", "source", "timestamp"}
+
+
+class ErrorRecord:
+    """A distinct error and how often it has been reported."""
+
+    def __init__(self, key: str, error: Dict[str, Any]):
+        self.fingerprint = key
+        self.error = error
+        self.count = 1
+        self.first_seen = time.time()
+        self.last_seen = self.first_seen
+        self.version = 0  # store version of the last change
+
+    @property
+    def message(self) -> str:
+        return error_message(self.error) or "(no message)"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The latest report, plus the dedup counters."""
+        return {
+            **self.error,
+            "fingerprint": self.fingerprint,
+            "count": self.count,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "version": self.version,
+        }
+
+
+class ErrorStore:
+    """Reported client errors, deduplicated by fingerprint.
+
+    Reports with the same message and top stack frames are merged into one
+    record that counts occurrences. At most ``max_errors`` distinct errors
+    are kept; the one seen least recently is dropped first.
+
+    Every change bumps ``version``, so clients can wait for changes after a
+    version they have seen instead of polling the whole list.
+    """
+
+    def __init__(self, max_errors: int = DEFAULT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self._records: "OrderedDict[str, ErrorRecord]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.version = 0
+        # Version of the last clear; clients behind it must drop their errors
+        self.cleared_version = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def occurrences(self) -> int:
+        with self._lock:
+            return sum(record.count for record in self._records.values())
+
+    def add(self, error: Dict[str, Any]) -> Tuple[ErrorRecord, bool]:
+        """Record a report; returns its record and whether it was new."""
+        key = fingerprint(error)
+        with self._lock:
+            record = self._records.pop(key, None)
+            is_new = record is None
+            if is_new:
+                record = ErrorRecord(key, error)
+            else:
+                record.error = {**error, "id": record.error.get("id", error.get("id"))}
+                record.count += 1
+                record.last_seen = time.time()
+            self._records[key] = record
+            while len(self._records) > self.max_errors:
+                self._records.popitem(last=False)
+            self.version += 1
+            record.version = self.version
+            self._changed.notify_all()
+            return record, is_new
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Distinct errors, oldest first."""
+        with self._lock:
+            return [record.to_dict() for record in self._records.values()]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self.version += 1
+            self.cleared_version = self.version
+            self._changed.notify_all()
+
+    def wait(self, since: int, timeout: float) -> bool:
+        """Block until the version passes ``since``; False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: self.version != since, timeout=timeout
+            )
+
+    def changes(self, since: int) -> Dict[str, Any]:
+        """The current count and the errors changed after version ``since``.
+
+        ``reset`` is set when the client's view can't be updated
+        incrementally: the errors were cleared since, or ``since`` is from
+        before a server restart. The client should then replace its list.
+        """
+        with self._lock:
+            reset = since < self.cleared_version or since > self.version
+            return {
+                "version": self.version,
+                "count": len(self._records),
+                "reset": reset,
+                "errors": [
+                    record.to_dict()
+                    for record in self._records.values()
+                    if reset or record.version > since
+                ],
+            }
+
+    def build_context(self, budget: int = DEFAULT_CONTEXT_BUDGET) -> str:
+        """Error context for a prompt, kept within ``budget`` characters."""
+        with self._lock:
+            records = list(self._records.values())
+        return format_error_context(records, budget)
+
+
+def _clock(timestamp: float) -> str:
+    return time.strftime("%H:%M:%S", time.localtime(timestamp))
+
+
+def _frame_drop_order(frames: List[str]) -> List[int]:
+    """Indexes of frames in the order they should be dropped.
+
+    Library frames go first, then the app's own frames from the bottom of
+    the stack up. The top frame is always kept.
+    """
+    rest = list(range(len(frames) - 1, 0, -1))
+    library = [i for i in rest if is_library_frame(frames[i])]
+    return library + [i for i in rest if i not in library]
+
+
+class _Entry:
+    """One error while the context is being trimmed to fit."""
+
+    def __init__(self, record: ErrorRecord):
+        self.record = record
+        self.message = record.message
+        self.frames = stack_frames(record.error)
+        self.kept = set(range(len(self.frames)))
+        self.drop_order = _frame_drop_order(self.frames)
+        extra = {
+            key: value
+            for key, value in record.error.items()
+            if key not in _RENDERED_FIELDS
+        }
+        self.extra: Optional[str] = json.dumps(extra, default=str) if extra else None
+
+    def render(self, index: int) -> str:
+        record = self.record
+        last = _clock(record.last_seen)
+        if record.count > 1:
+            first = _clock(record.first_seen)
+            seen = f"seen {record.count} times, first at {first}, last at {last}"
+        else:
+            seen = f"at {last}"
+        lines = [self.message]
+        frames = [self.frames[i] for i in sorted(self.kept)]
+        if frames:
+            lines += ["    " + frame.strip() for frame in frames]
+        omitted = len(self.frames) - len(frames)
+        if omitted:
+            lines.append(f"    ... {omitted} more frames")
+        if self.extra:
+            lines.append(self.extra)
+        body = "\n".join(lines)
+        return f"\nError {index} ({seen}):\n```\n{body}\n```\n"
+
+    def trim_one(self) -> bool:
+        """Drop the least relevant remaining frame or field."""
+        while self.drop_order:
+            i = self.drop_order.pop(0)
+            if i in self.kept:
+                self.kept.discard(i)
+                return True
+        if self.extra:
+            self.extra = None
+            return True
+        return False
+
+
+def format_error_context(records: List[ErrorRecord], budget: int) -> str:
+    """Render errors for a prompt within ``budget`` characters.
+
+    The most recently seen errors come first. While the text is over
+    budget, the longest error loses its least relevant frame (library
+    frames, then the bottom of the stack) and then its extra fields; if
+    that is still not enough, the least recently seen errors are left out,
+    and finally the message of the one error left is cut short.
+    """
+    if not records:
+        return ""
+    entries = [
+        _Entry(record)
+        for record in sorted(records, key=lambda r: r.last_seen, reverse=True)
+    ]
+
+    def render() -> str:
+        text = CONTEXT_HEADER + "".join(
+            entry.render(index) for index, entry in enumerate(entries, 1)
+        )
+        omitted = len(records) - len(entries)
+        if omitted:
+            text += f"\n({omitted} older errors omitted)\n"
+        return text
+
+    text = render()
+    while len(text) > budget:
+        lengths = sorted(
+            ((len(entry.render(0)), entry) for entry in entries),
+            key=lambda item: item[0],
+            reverse=True,
+        )
+        if not any(entry.trim_one() for _, entry in lengths):
+            if len(entries) == 1:
+                entry = entries[0]
+                keep = max(0, len(entry.message) - (len(text) - budget))
+                keep = max(0, keep - len(TRUNCATED_MARKER))
+                entry.message = entry.message[:keep] + TRUNCATED_MARKER
+                return render()
+            entries.pop()
+        text = render()
+    return text
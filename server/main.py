@@ -4,12 +4,12 @@ import os
 import json
 from pathlib import Path
 import sys
-from typing import Dict, List, Union, Any, Optional
+from typing import Dict, List, Union, Any, Optional, Tuple
 import time
 import signal
 import threading
+import itertools
 import psutil
-from collections import deque
 
 # Add the parent directory to sys.path to allow imports from the root
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
@@ -17,15 +17,176 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
 # Now import from auth module
 from server.auth import token_required, authenticate_user, create_access_token
 from server.auth.cors_middleware import handle_cors
+from server.errors import CountFile, ErrorStore, RateLimiter, cap_error
+from server.process import (
+    CLAUDE_ARGS,
+    STDERR,
+    STDOUT,
+    EnvironmentResolver,
+    launcher,
+    read_lines,
+)
+from server.prompts import (
+    Batch,
+    BatchManager,
+    Job,
+    JobManager,
+    LifecycleMonitor,
+    QueueFullError,
+    Scheduler,
+    SessionRegistry,
+    FORMAT_CONDENSED,
+    FORMAT_RAW,
+    OUTPUT_FORMATS,
+    PromptCache,
+    StreamJsonParser,
+    TranscriptStore,
+    WorkerError,
+    WorkerPool,
+    format_sse_event,
+    parse_last_event_id,
+    parse_stream_lines,
+    parse_timeouts,
+)
+from server.vcs import (
+    DEFAULT_STATUS_OPTIONS,
+    GIT,
+    CatFileError,
+    CatFilePool,
+    DiffCache,
+    RepoCache,
+    StageError,
+    StatusError,
+    StatusWatchers,
+    WorktreeError,
+    WorktreePool,
+    file_summary,
+    git_order,
+    group_by_directory,
+    iter_file_diffs,
+    iter_status,
+    numstat,
+    paginate,
+    parse_cursor,
+    stage_files,
+    status_options,
+    stream_diff,
+    untracked_diff_lines,
+    worktrees,
+)
 
 app = Flask(__name__)
 # Setup CORS handling
 handle_cors(app)
 
-# Store recent errors for automatic inclusion in Claude prompts
-# Using a deque for a fixed-size FIFO queue
+# Store recent errors for automatic inclusion in Claude prompts; repeats of
+# the same error are merged and counted
 MAX_STORED_ERRORS = 10
-recent_errors = deque(maxlen=MAX_STORED_ERRORS)
+# Characters of error context added to a prompt (about 4 per token)
+ERROR_CONTEXT_BUDGET = 6000
+error_store = ErrorStore(max_errors=MAX_STORED_ERRORS)
+# Longest wait of a GET /errors?since=<version> long poll, in seconds
+ERRORS_POLL_TIMEOUT = 30
+# Seconds between keep-alive comments on an idle /errors/stream
+ERRORS_STREAM_HEARTBEAT = 15
+
+# Limits on /report-error and /report-errors
+MAX_ERROR_REPORT_BYTES = 1024 * 1024
+MAX_ERRORS_PER_REPORT = 100
+# Errors each client may report per second, after a burst of ERROR_BURST
+ERROR_RATE = 20
+ERROR_BURST = 100
+error_rate_limiter = RateLimiter(rate=ERROR_RATE, burst=ERROR_BURST)
+
+# Written in the background with the number of stored errors, so clients can
+# detect errors without polling the server
+error_count_file = CountFile(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "error_count.txt")
+)
+
+# Claude runs allowed at once; runs in the same directory always take turns
+MAX_CONCURRENT_PROMPTS = 4
+# Prompts allowed to wait for a slot before /prompt returns 429
+MAX_QUEUED_PROMPTS = 32
+
+# Warm Claude workers reused by prompts sent with "warm": true
+MAX_WARM_WORKERS = 8
+WARM_WORKER_IDLE_TIMEOUT = 600  # seconds
+WARM_WORKER_MAX_AGE = 3600  # seconds
+
+# Limits enforced by the lifecycle monitor; requests may pass their own
+JOB_TIMEOUT = 1800  # seconds of wall-clock time per prompt
+JOB_IDLE_TIMEOUT = 600  # seconds without any output from Claude
+# How long a /promptstream run survives with no client attached, so a
+# dropped phone can still resume with Last-Event-ID
+STREAM_DISCONNECT_GRACE = 30  # seconds
+
+# Longest a /jobs/<id>/result request may block waiting for a job to finish
+MAX_RESULT_WAIT = 30  # seconds
+
+# Opt-in cache of prompt results, keyed by prompt and working-tree state
+PROMPT_CACHE_MAX_ENTRIES = 200
+PROMPT_CACHE_TTL = 24 * 3600  # seconds
+
+# Claude sessions remembered per client conversation_id for --resume
+SESSION_TTL = 24 * 3600  # seconds a conversation may sit unused
+MAX_SESSIONS = 500
+
+# Idle git worktrees kept ready per repo used by a batch, and how long
+# extra ones may sit unused before they are removed
+WORKTREE_POOL_SIZE = 2
+WORKTREE_IDLE_TIMEOUT = 3600  # seconds
+
+# Seconds repository metadata is cached; watched repos are refreshed sooner
+REPO_CACHE_TTL = 300
+
+# Repos whose git status is kept up to date by a file watcher, how long one
+# may go unused, and how long /git/status waits for a new watcher's first scan
+MAX_STATUS_WATCHERS = 8
+STATUS_WATCHER_IDLE_TIMEOUT = 600  # seconds
+STATUS_WATCHER_READY_TIMEOUT = 60  # seconds
+STATUS_STREAM_HEARTBEAT = 15  # seconds
+
+# Entries per /git/status page when the client paginates
+GIT_STATUS_PAGE_SIZE = 500
+MAX_GIT_STATUS_PAGE = 5000
+
+# Structured /git/diff output: hunk text kept per file and per response
+DIFF_FORMATS = ("raw", "structured", "ndjson", "sse")
+DIFF_MAX_FILE_BYTES = 256 * 1024
+DIFF_MAX_TOTAL_BYTES = 2 * 1024 * 1024
+
+# Single-file git diffs kept in memory, keyed by the file's index blob and
+# worktree stat, so reselecting an unchanged file doesn't run git diff again
+DIFF_CACHE_MAX_BYTES = 32 * 1024 * 1024
+DIFF_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+
+# Files per /git/changes response, and the most paths passed to git as a
+# pathspec; longer lists are filtered from the whole repo's status and diff
+MAX_CHANGES_FILES = 1000
+CHANGES_PATHSPEC_LIMIT = 256
+
+# Persistent git cat-file processes serving /git/file, per repo and in
+# total, and how long one may sit unused
+CAT_FILE_MAX_PER_REPO = 2
+CAT_FILE_MAX_PROCESSES = 32
+CAT_FILE_IDLE_TIMEOUT = 300  # seconds
+# Largest file /git/file returns the content of, and files per request
+MAX_FILE_CONTENT_BYTES = 5 * 1024 * 1024
+MAX_FILE_CONTENT_PATHS = 100
+
+# Job output is also written to ~/.claudecodego/transcripts; the oldest
+# transcripts are deleted beyond this many
+MAX_TRANSCRIPTS = 500
+# Largest slice GET /jobs/<id>/transcript returns at once
+MAX_TRANSCRIPT_READ_BYTES = 1024 * 1024
+MAX_TRANSCRIPT_READ_LINES = 1000
+
+# The user's login-shell environment, captured once and refreshed on a TTL,
+# on SIGHUP, when a shell rc file changes, or via POST /admin/env/refresh
+env_resolver = EnvironmentResolver()
+env_resolver.install_sighup_handler()
+env_resolver.prime()
 
 # Web command process management
 web_process: Optional[subprocess.Popen] = None
@@ -45,38 +206,36 @@ web_command_status = {
 
 
 def get_shell_env() -> Dict[str, str]:
-    """Get the shell environment variables."""
-    env_output = subprocess.check_output(["env"], shell=True).decode("utf-8")
-    return dict(line.split("=", 1) for line in env_output.splitlines() if "=" in line)
+    """Get the shell environment variables from the cached login-shell snapshot."""
+    return env_resolver.get()
 
 
-def output_reader(process, output_list, is_stderr=False):
-    """Read output from a process and append to the output list."""
+def output_reader(process, output_list):
+    """Read stdout and stderr from a process in arrival order into the output list."""
     global web_command_status
-    stream = process.stderr if is_stderr else process.stdout
-    prefix = "ERROR: " if is_stderr else ""
 
-    for line in iter(stream.readline, ""):
-        if line:
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            line_text = f"{prefix}{line.rstrip()}"
-            log_entry = f"[{timestamp}] {line_text}"
+    for line in read_lines(process):
+        is_stderr = line.stream == STDERR
+        prefix = "ERROR: " if is_stderr else ""
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(line.timestamp))
+        line_text = f"{prefix}{line.text.rstrip()}"
+        log_entry = f"[{timestamp}] {line_text}"
 
-            print(log_entry)
-            output_list.append(line_text)
+        print(log_entry)
+        output_list.append(line_text)
 
-            # Add to logs with timestamp for display in UI
-            with web_command_lock:
-                web_command_status["logs"].append(log_entry)
-                # Keep logs within the maximum size
-                if len(web_command_status["logs"]) > web_command_status["max_logs"]:
-                    web_command_status["logs"] = web_command_status["logs"][
-                        -web_command_status["max_logs"] :
-                    ]
+        # Add to logs with timestamp for display in UI
+        with web_command_lock:
+            web_command_status["logs"].append(log_entry)
+            # Keep logs within the maximum size
+            if len(web_command_status["logs"]) > web_command_status["max_logs"]:
+                web_command_status["logs"] = web_command_status["logs"][
+                    -web_command_status["max_logs"] :
+                ]
 
-                # If this is an error, update the last error line
-                if is_stderr:
-                    web_command_status["last_error_line"] = log_entry
+            # If this is an error, update the last error line
+            if is_stderr:
+                web_command_status["last_error_line"] = log_entry
 
 
 def is_process_running(pid):
@@ -138,40 +297,24 @@ def start_web_command(command, directory=None):
             shell_env = get_shell_env()
             env = {**os.environ, **shell_env}
 
-            web_process = subprocess.Popen(
-                command,
-                cwd=directory,
-                env=env,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-            )
+            # The web command is a user-supplied command line, so it keeps its shell
+            web_process = launcher.spawn(command, cwd=directory, env=env, shell=True)
 
             # Save process details
             web_command_status["pid"] = web_process.pid
             web_command_status["running"] = True
 
-            # Start output reader threads
-            stdout_thread = threading.Thread(
+            # Start the output reader thread; it drains stdout and stderr together
+            reader_thread = threading.Thread(
                 target=output_reader,
-                args=(web_process, web_command_status["output"], False),
-                daemon=True,
-            )
-            stderr_thread = threading.Thread(
-                target=output_reader,
-                args=(web_process, web_command_status["output"], True),
+                args=(web_process, web_command_status["output"]),
                 daemon=True,
             )
-
-            stdout_thread.start()
-            stderr_thread.start()
+            reader_thread.start()
 
             # Monitor process status
             def monitor_process():
-                web_process.wait()
+                launcher.wait(web_process)
 
                 timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
                 exit_code = web_process.returncode
@@ -337,12 +480,16 @@ def list_directory():
         return jsonify({"error": "Failed to list directory contents"}), 500
 
 
-@app.route("/report-error", methods=["POST"])
-@token_required
-def report_error():
-    """Endpoint to receive errors from the Next.js application"""
-    try:
-        error_data = request.get_json()
+def ingest_errors(errors: List[Any], source: str) -> Dict[str, Any]:
+    """Store a batch of reported errors, subject to the source's rate limit."""
+    accepted = error_rate_limiter.allow(source, len(errors))
+    stored = []
+    invalid = 0
+    for error_data in errors[:accepted]:
+        if not isinstance(error_data, dict):
+            invalid += 1
+            continue
+        error_data = cap_error(error_data)
 
         # Add timestamp if not provided
         if "timestamp" not in error_data:
@@ -352,40 +499,89 @@ def report_error():
         error_data["source"] = "next-js-app"
 
         # Add a unique ID to the error
-        error_data["id"] = f"error-{time.time()}-{len(recent_errors)}"
+        error_data["id"] = f"error-{time.time()}-{len(error_store)}"
 
-        # Print to console for debugging with highlighting
-        print("\n" + "!" * 80)
-        print(" 🚨 ERROR REPORTED FROM NEXT.JS APP 🚨 ".center(80, "!"))
-        print("!" * 80)
-        print(f"\n{json.dumps(error_data, indent=2)}\n")
-        print("!" * 80 + "\n")
-
-        # Store in our error queue for later inclusion in Claude prompts
-        recent_errors.append(error_data)
+        # Store for later inclusion in Claude prompts, merging repeats
+        record, is_new = error_store.add(error_data)
+        stored.append(record)
+        if is_new:
+            print(
+                f"🚨 Error reported from Next.js app [{record.fingerprint}]: "
+                f"{record.message[:200]}"
+            )
 
-        # Log the count of stored errors
-        error_count = len(recent_errors)
+    # The count file is a flag for clients to detect errors; it is written
+    # in the background so bursts of reports don't block on disk
+    error_count = len(error_store)
+    error_count_file.set(error_count)
+    if stored:
         print(f"Currently storing {error_count} errors for next Claude prompt")
+    return {
+        "records": stored,
+        "accepted": len(stored),
+        "invalid": invalid,
+        "rate_limited": len(errors) - accepted,
+        "error_count": error_count,
+    }
 
-        # Create the error_count file in the same directory as this script
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        error_count_path = os.path.join(script_dir, "error_count.txt")
 
-        # Add a file system flag for clients to detect errors more reliably
-        try:
-            with open(error_count_path, "w") as f:
-                f.write(str(error_count))
-            print(f"Wrote error count to {error_count_path}")
-        except Exception as write_err:
-            print(f"Could not write error count file: {write_err}")
+def error_report_source() -> str:
+    """Rate limiting key for an error report."""
+    return request.headers.get("X-Error-Source") or request.remote_addr or "unknown"
+
+
+def read_error_reports() -> Tuple[Optional[Any], Optional[Tuple[Response, int]]]:
+    """Parse an error report body, enforcing the size limit."""
+    if (request.content_length or 0) > MAX_ERROR_REPORT_BYTES:
+        return None, (
+            jsonify(
+                {
+                    "error": "Error report too large",
+                    "details": f"Limit is {MAX_ERROR_REPORT_BYTES} bytes",
+                }
+            ),
+            413,
+        )
+    data = request.get_json(silent=True)
+    if data is None:
+        return None, (jsonify({"error": "Expected a JSON body"}), 400)
+    return data, None
+
+
+@app.route("/report-error", methods=["POST"])
+@token_required
+def report_error():
+    """Endpoint to receive errors from the Next.js application"""
+    try:
+        data, error_response = read_error_reports()
+        if error_response:
+            return error_response
+        errors = data if isinstance(data, list) else [data]
+        if len(errors) > MAX_ERRORS_PER_REPORT:
+            return (
+                jsonify(
+                    {"error": f"At most {MAX_ERRORS_PER_REPORT} errors per report"}
+                ),
+                413,
+            )
+
+        result = ingest_errors(errors, error_report_source())
+        if not result["records"]:
+            if result["rate_limited"]:
+                return jsonify({"error": "Too many error reports", **result}), 429
+            return jsonify({"error": "Expected an error object"}), 400
 
+        record = result["records"][-1]
         return jsonify(
             {
                 "success": True,
-                "stored_errors": len(recent_errors),
-                "error_count": error_count,
-                "error_count_file": error_count_path,
+                "stored_errors": result["error_count"],
+                "error_count": result["error_count"],
+                "fingerprint": record.fingerprint,
+                "occurrences": record.count,
+                "accepted": result["accepted"],
+                "rate_limited": result["rate_limited"],
+                "error_count_file": error_count_file.path,
             }
         )
     except Exception as e:
@@ -396,6 +592,250 @@ def report_error():
         )
 
 
+@app.route("/report-errors", methods=["POST"])
+@token_required
+def report_errors():
+    """Receive a batch of errors as an array or as {"errors": [...]}"""
+    try:
+        data, error_response = read_error_reports()
+        if error_response:
+            return error_response
+        errors = data.get("errors") if isinstance(data, dict) else data
+        if not isinstance(errors, list):
+            return jsonify({"error": "Expected an array of errors"}), 400
+        if len(errors) > MAX_ERRORS_PER_REPORT:
+            return (
+                jsonify(
+                    {"error": f"At most {MAX_ERRORS_PER_REPORT} errors per report"}
+                ),
+                413,
+            )
+
+        result = ingest_errors(errors, error_report_source())
+        records = result.pop("records")
+        code = 429 if result["rate_limited"] and not records else 200
+        return (
+            jsonify(
+                {
+                    "success": bool(records) or not errors,
+                    **result,
+                    "fingerprints": [record.fingerprint for record in records],
+                }
+            ),
+            code,
+        )
+    except Exception as e:
+        print(f"Error handling error report: {str(e)}")
+        return (
+            jsonify({"error": "Failed to process error report", "details": str(e)}),
+            500,
+        )
+
+
+def build_prompt_with_errors(command: str, include_errors: bool = True) -> str:
+    """Append any stored Next.js errors to the prompt."""
+    if not include_errors or not len(error_store):
+        return command
+
+    error_context = error_store.build_context(ERROR_CONTEXT_BUDGET)
+
+    # Append error context to the original command
+    return f"{command}\n{error_context}"
+
+
+def clear_included_errors():
+    """Clear stored errors once they have been handed to Claude."""
+    error_store.clear()
+
+    # Update the error count file to reflect that errors are now cleared
+    error_count_file.set(0)
+
+    print("\n" + "=" * 80)
+    print(" 🔄 INCLUDING ERROR CONTEXT IN CLAUDE PROMPT 🔄 ".center(80, "="))
+    print(" 🧹 ERRORS CLEARED AFTER INCLUSION 🧹 ".center(80, "="))
+    print("=" * 80 + "\n")
+
+
+def run_prompt_job(job: Job):
+    """Run Claude for a job, recording each output line as it arrives."""
+    if job.warm:
+        run_warm_prompt_job(job)
+        return
+
+    print(f"Job {job.id}: running claude in directory: {job.directory}")
+    print(f"Prompt length: {len(job.prompt)}")
+
+    args = CLAUDE_ARGS
+    if job.resume_session:
+        print(f"Resuming Claude session {job.resume_session}")
+        args = CLAUDE_ARGS + ["--resume", job.resume_session]
+
+    # The prompt goes to claude's stdin directly: no shell, no temp file
+    # Claude gets its own process group so cancelling also stops its tools
+    process = launcher.spawn(
+        args,
+        cwd=job.directory,
+        env=get_combined_env(),
+        stdin_data=job.prompt,
+        start_new_session=True,
+    )
+    job.attach_process(process)
+
+    # Both pipes are drained together so a chatty stderr can't stall stdout
+    for line in read_lines(process):
+        job.add_output(
+            line.text, is_stderr=line.stream == STDERR, timestamp=line.timestamp
+        )
+
+    exit_code = launcher.wait(process)
+    print(f"Job {job.id}: completed with return code {exit_code}")
+    job.finish(exit_code=exit_code)
+
+
+def run_warm_prompt_job(job: Job):
+    """Run a job's prompt on its conversation's long-lived Claude worker."""
+    worker = worker_pool.acquire(job.directory, job.conversation_id)
+    print(f"Job {job.id}: using warm worker {worker.pid} in {job.directory}")
+    job.attach_process(worker.process, reap_orphans=False)
+    healthy = False
+    try:
+        result = worker.run_turn(
+            job.prompt,
+            job.add_output,
+            lambda line: job.add_output(line, is_stderr=True),
+        )
+        healthy = True
+        job.finish(exit_code=1 if result.get("is_error") else 0)
+    except WorkerError as e:
+        job.finish(error=str(e))
+    finally:
+        worker_pool.release(worker, healthy)
+
+
+def get_combined_env() -> Dict[str, str]:
+    """Environment for Claude processes: the server's plus the user's shell."""
+    return {**os.environ, **get_shell_env()}
+
+
+worker_pool = WorkerPool(
+    get_combined_env, WARM_WORKER_IDLE_TIMEOUT, WARM_WORKER_MAX_AGE, MAX_WARM_WORKERS
+)
+
+job_manager = JobManager(
+    run_prompt_job,
+    Scheduler(MAX_CONCURRENT_PROMPTS, MAX_QUEUED_PROMPTS),
+    transcripts=TranscriptStore(max_transcripts=MAX_TRANSCRIPTS),
+    cache=PromptCache(max_entries=PROMPT_CACHE_MAX_ENTRIES, ttl=PROMPT_CACHE_TTL),
+    sessions=SessionRegistry(ttl=SESSION_TTL, max_sessions=MAX_SESSIONS),
+)
+
+# Enforces timeouts, cancels abandoned streams and kills leftover children
+lifecycle_monitor = LifecycleMonitor(
+    job_manager, JOB_TIMEOUT, JOB_IDLE_TIMEOUT, STREAM_DISCONNECT_GRACE
+)
+lifecycle_monitor.start()
+
+# VCS kind, root and default branch per directory, so git endpoints don't
+# spawn sl/git just to find out what they are working with
+repo_cache = RepoCache(ttl=REPO_CACHE_TTL)
+
+# Watches repos used with /git/status and keeps their status current
+status_watchers = StatusWatchers(
+    max_watchers=MAX_STATUS_WATCHERS, idle_timeout=STATUS_WATCHER_IDLE_TIMEOUT
+)
+
+# Recent single-file diffs for the changes tab
+diff_cache = DiffCache(
+    max_bytes=DIFF_CACHE_MAX_BYTES, max_entry_bytes=DIFF_CACHE_MAX_ENTRY_BYTES
+)
+
+# Object readers for file contents at HEAD, the index or any revision
+cat_file_pool = CatFilePool(
+    max_per_repo=CAT_FILE_MAX_PER_REPO,
+    max_processes=CAT_FILE_MAX_PROCESSES,
+    idle_timeout=CAT_FILE_IDLE_TIMEOUT,
+)
+
+# Pre-created git worktrees for parallel runs against the same repo
+worktree_pool = WorktreePool(
+    size=WORKTREE_POOL_SIZE, idle_timeout=WORKTREE_IDLE_TIMEOUT
+)
+
+# Parallel prompt batches; repeated repos lease worktrees from the pool
+batch_manager = BatchManager(job_manager, worktree_pool)
+
+
+def submit_prompt_job(
+    command: str,
+    directory: Optional[str],
+    include_errors: bool = True,
+    job_id=None,
+    warm: bool = False,
+    timeout: Optional[float] = None,
+    idle_timeout: Optional[float] = None,
+    use_cache: bool = False,
+    conversation_id: Optional[str] = None,
+) -> Job:
+    """Build the final prompt for a request and submit it as a job.
+
+    With ``conversation_id`` the prompt continues that conversation's Claude
+    session. With ``use_cache`` an earlier result for the same prompt and
+    working tree may be replayed instead of running Claude. Raises
+    QueueFullError if the scheduler is at capacity, in which case the stored
+    errors are left in place for the next prompt.
+    """
+    if not directory:
+        # Use current directory as fallback
+        directory = str(Path(os.getcwd()))
+        print(f"No directory provided, using current directory: {directory}")
+
+    prompt = build_prompt_with_errors(command, include_errors)
+    job = job_manager.submit(
+        prompt,
+        directory,
+        command=command,
+        job_id=job_id,
+        warm=warm,
+        use_cache=use_cache,
+        conversation_id=conversation_id,
+    )
+    job.timeout = timeout
+    job.idle_timeout = idle_timeout
+    if prompt != command:
+        clear_included_errors()
+    return job
+
+
+def session_id(job: Job) -> Optional[str]:
+    """Claude session a conversation is on now, e.g. after this job ran."""
+    if not job.conversation_id or job.warm:
+        return None
+    session = job_manager.sessions.get(job.conversation_id)
+    return session.session_id if session else None
+
+
+def job_result_payload(job: Job, output_format: str = FORMAT_RAW) -> Dict[str, Any]:
+    """Final output of a job, with stdout parsed into events unless raw."""
+    result = job.result()
+    if output_format != FORMAT_RAW:
+        result["events"] = parse_stream_lines(job.stdout, output_format)
+        del result["stdout"]
+    return result
+
+
+def queue_full_response(error: QueueFullError):
+    """429 response telling the client when to retry."""
+    response = jsonify(
+        {
+            "success": False,
+            "error": "Too many prompts are queued, try again later",
+            "retry_after": error.retry_after,
+        }
+    )
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429
+
+
 @app.route("/prompt", methods=["POST"])
 @token_required
 def execute_command():
@@ -409,96 +849,66 @@ def execute_command():
         command = data.get("command")
         directory = data.get("directory")
         include_errors = data.get("include_errors", True)  # Default to including errors
+        run_async = data.get("async", False)
+        warm = data.get("warm", False)
+        output_format = data.get("format", FORMAT_RAW)
+        use_cache = data.get("cache", False)
+        conversation_id = data.get("conversation_id")
 
         if not command:
             error_msg = "Command is required"
             print(f"Error: {error_msg}")
             return jsonify({"error": error_msg}), 400
 
-        if not directory:
-            # Use current directory as fallback
-            directory = str(Path(os.getcwd()))
-            print(f"No directory provided, using current directory: {directory}")
-
-        # Count errors before processing
-        initial_error_count = len(recent_errors)
+        try:
+            timeout, idle_timeout = parse_timeouts(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # If we have recent errors and they should be included, add them to the command
-        modified_command = command
-        if include_errors and recent_errors:
-            error_context = "\n\nImportant: The following errors were detected in the Next.js application. Please analyze and fix these errors in your response:\n"
-            for i, error in enumerate(recent_errors, 1):
-                error_str = json.dumps(error, indent=2)
-                error_context += f"\nError {i}:\n```\n{error_str}\n```\n"
+        if output_format not in OUTPUT_FORMATS:
+            return jsonify({"error": f"Unknown format: {output_format}"}), 400
 
-            # Append error context to the original command
-            modified_command = f"{command}\n{error_context}"
+        # Count errors before processing
+        initial_error_count = len(error_store)
 
-            # Clear the errors after including them
-            recent_errors.clear()
+        try:
+            job = submit_prompt_job(
+                command,
+                directory,
+                include_errors,
+                warm=warm,
+                timeout=timeout,
+                idle_timeout=idle_timeout,
+                use_cache=use_cache,
+                conversation_id=conversation_id,
+            )
+        except QueueFullError as e:
+            return queue_full_response(e)
 
-            # Update the error count file to reflect that errors are now cleared
-            try:
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                error_count_path = os.path.join(script_dir, "error_count.txt")
-                with open(error_count_path, "w") as f:
-                    f.write("0")
-                print(f"Updated error count file to 0 at {error_count_path}")
-            except Exception as write_err:
-                print(f"Could not update error count file: {write_err}")
-
-            print("\n" + "=" * 80)
-            print(" 🔄 INCLUDING ERROR CONTEXT IN CLAUDE PROMPT 🔄 ".center(80, "="))
-            print(" 🧹 ERRORS CLEARED AFTER INCLUSION 🧹 ".center(80, "="))
-            print("=" * 80 + "\n")
-
-        claude_command = f'claude -p --dangerously-skip-permissions --output-format "stream-json" "{modified_command}"'
-        print(f"Executing command: {claude_command} in directory: {directory}")
-
-        # Get shell environment
-        shell_env = get_shell_env()
-        env = {**os.environ, **shell_env}
-
-        # Create a temporary file with the prompt content
-        import tempfile
-
-        with tempfile.NamedTemporaryFile(
-            mode="w", delete=False, suffix=".txt"
-        ) as temp_file:
-            temp_file.write(modified_command)
-            prompt_file = temp_file.name
-
-        # Use cat to pipe the prompt content to claude
-        claude_command = f'cat "{prompt_file}" | claude -p --dangerously-skip-permissions --output-format "stream-json"'
-        print(f"Using command: {claude_command}")
-        print(f"Prompt length: {len(modified_command)}")
-        print(f"Using temp file: {prompt_file}")
-        print(f"In directory: {directory}")
-
-        result = subprocess.run(
-            claude_command,
-            cwd=directory,
-            env=env,
-            shell=True,
-            capture_output=True,
-            text=True,
-        )
+        if run_async:
+            return jsonify({**job.to_dict(), "success": True}), 202
 
-        print(f"Command completed with return code: {result.returncode}")
-        print(
-            f"stdout length: {len(result.stdout)}, stderr length: {len(result.stderr)}"
-        )
+        job.wait()
+        result = job_result_payload(job, output_format)
+        print(f"stdout lines: {len(job.stdout)}, stderr length: {len(result['stderr'])}")
 
-        if result.returncode != 0:
-            print(f"Error running command: {result.stderr}")
+        if job.error:
+            raise RuntimeError(job.error)
+        if job.exit_code != 0:
+            print(f"Error running command: {result['stderr']}")
 
         # Include the error count in the response
+        output_key = "stdout" if output_format == FORMAT_RAW else "events"
         response_data = {
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "success": result.returncode == 0,
+            output_key: result[output_key],
+            "stderr": result["stderr"],
+            "success": job.exit_code == 0,
+            "job_id": job.id,
+            "cached": job.cached,
+            "conversation_id": job.conversation_id,
+            "session_id": session_id(job),
             "initial_error_count": initial_error_count,
-            "remaining_error_count": len(recent_errors),
+            "remaining_error_count": len(error_store),
         }
         return jsonify(response_data)
     except Exception as e:
@@ -518,148 +928,720 @@ def serve_test_html():
     return send_file("test-sse.html")
 
 
-def generate_sse_response(command: str, directory: str, include_errors: bool = True):
-    """Generator function for SSE responses."""
+def resolve_stream_job(
+    command: Optional[str],
+    directory: Optional[str],
+    include_errors: bool = True,
+    stream_id: Optional[str] = None,
+    warm: bool = False,
+    timeout: Optional[float] = None,
+    idle_timeout: Optional[float] = None,
+    use_cache: bool = False,
+    conversation_id: Optional[str] = None,
+) -> Tuple[Job, bool]:
+    """Find the job a stream request refers to, submitting a new one if needed.
+
+    Returns the job and whether it was newly created. Jobs created for a
+    stream are cancelled if every client stays disconnected for too long.
+    """
+    job = job_manager.get(stream_id)
+    if job is not None:
+        return job, False
+    if not command:
+        raise KeyError(f"Unknown or expired stream: {stream_id}")
+    job = submit_prompt_job(
+        command,
+        directory,
+        include_errors,
+        stream_id,
+        warm,
+        timeout,
+        idle_timeout,
+        use_cache,
+        conversation_id,
+    )
+    job.cancel_on_disconnect = True
+    return job, True
+
+
+def generate_sse_response(
+    job: Job,
+    mode: str = "full",
+    last_event_id: int = 0,
+    output_format: str = FORMAT_RAW,
+):
+    """Generator function for SSE responses.
+
+    In ``full`` mode every event carries ``allOutputs`` for older clients. In
+    ``delta`` mode each event carries only the new line and an ``id:`` so a
+    client can reconnect with Last-Event-ID and the same ``stream_id``.
+    Delta streams in the ``events`` or ``condensed`` format send parsed
+    stream-json events instead of raw lines.
+
+    The job counts this generator as a subscriber until it is closed, which
+    is how a dropped client is noticed.
+    """
+    job.subscribe()
     try:
-        # If we have recent errors and they should be included, add them to the command
-        modified_command = command
-        if include_errors and recent_errors:
-            error_context = "\n\nImportant: The following errors were detected in the Next.js application. Please analyze and fix these errors in your response:\n"
-            for i, error in enumerate(recent_errors, 1):
-                error_str = json.dumps(error, indent=2)
-                error_context += f"\nError {i}:\n```\n{error_str}\n```\n"
+        if mode == "delta" and output_format != FORMAT_RAW:
+            yield from generate_parsed_sse_events(job, last_event_id, output_format)
+            return
 
-            # Append error context to the original command
-            modified_command = f"{command}\n{error_context}"
+        if mode == "delta":
+            _, missed = job.events.since(last_event_id)
+            yield format_sse_event(
+                {
+                    "streamId": job.id,
+                    "jobId": job.id,
+                    "resumed": last_event_id > 0,
+                    "gap": missed,
+                    "queuePosition": job.queue_position,
+                    "cached": job.cached,
+                }
+            )
 
-            # Clear the errors after including them
-            recent_errors.clear()
+        all_outputs = []
+        for event in job.events.iter_from(last_event_id):
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+
+            event_id, payload = event
+            if mode == "delta":
+                yield format_sse_event(
+                    {**payload, "success": "error" not in payload}, event_id
+                )
+            elif "queuePosition" in payload:
+                # Older clients only understand output events
+                continue
+            elif "error" in payload:
+                yield format_sse_event({"error": payload["error"], "success": False})
+            elif "exitCode" in payload:
+                # Send final event
+                yield format_sse_event(
+                    {
+                        "stdout": "",
+                        "stderr": "",
+                        "allOutputs": all_outputs,
+                        "success": True,
+                        "exitCode": payload["exitCode"],
+                        "cached": job.cached,
+                    }
+                )
+            else:
+                line = payload.get("stdout", payload.get("stderr"))
+                all_outputs.append(line)
+                yield format_sse_event(
+                    {**payload, "allOutputs": all_outputs, "success": True}
+                )
+    except Exception as e:
+        yield format_sse_event({"error": str(e), "success": False})
+    finally:
+        job.unsubscribe()
+
+
+def generate_parsed_sse_events(job: Job, last_event_id: int, output_format: str):
+    """Delta SSE stream of typed stream-json events.
+
+    Events parsed from one output line share that line's id, which is only
+    attached to the last of them so a resumed stream never skips any.
+    """
+    parser = StreamJsonParser(condensed=output_format == FORMAT_CONDENSED)
+    _, missed = job.events.since(last_event_id)
+    yield format_sse_event(
+        {
+            "streamId": job.id,
+            "jobId": job.id,
+            "resumed": last_event_id > 0,
+            "gap": missed,
+            "queuePosition": job.queue_position,
+            "cached": job.cached,
+        }
+    )
 
-            print("\n" + "=" * 80)
-            print(
-                " 🔄 INCLUDING ERROR CONTEXT IN CLAUDE PROMPT (SSE) 🔄 ".center(80, "=")
+    for event in job.events.iter_from(last_event_id):
+        if event is None:
+            yield ": keep-alive\n\n"
+            continue
+
+        event_id, payload = event
+        if "stdout" in payload:
+            parsed = [{"event": item} for item in parser.feed(payload["stdout"])]
+        else:
+            # Text waiting to be merged goes out before stderr or the final event
+            parsed = [{"event": item} for item in parser.flush()] + [payload]
+
+        for index, item in enumerate(parsed):
+            is_last = index == len(parsed) - 1
+            yield format_sse_event(
+                {**item, "success": "error" not in item},
+                event_id if is_last else None,
             )
-            print("=" * 80 + "\n")
-
-        claude_command = f'claude -p --dangerously-skip-permissions --output-format "stream-json" "{modified_command}"'
-        print(f"Executing command: {claude_command} in directory: {directory}")
-
-        # Get shell environment
-        shell_env = get_shell_env()
-        env = {**os.environ, **shell_env}
-
-        # Create a temporary file with the prompt content
-        import tempfile
-
-        with tempfile.NamedTemporaryFile(
-            mode="w", delete=False, suffix=".txt"
-        ) as temp_file:
-            temp_file.write(modified_command)
-            prompt_file = temp_file.name
-
-        process = subprocess.Popen(
-            claude_command,
-            cwd=directory,
-            shell=True,
-            env=env,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
+
+
+def stream_response(generator, mimetype: str = "text/event-stream") -> Response:
+    """Wrap an SSE (or NDJSON) generator in a streaming response."""
+    return Response(
+        generator,
+        mimetype=mimetype,
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@app.route("/promptstream", methods=["GET"])
+@token_required
+def prompt_stream_get():
+    command = request.args.get("command")
+    directory = request.args.get("directory")
+    include_errors = request.args.get("include_errors", "true").lower() == "true"
+    mode = request.args.get("mode", "full")
+    output_format = request.args.get("format", FORMAT_RAW)
+    stream_id = request.args.get("stream_id")
+    warm = request.args.get("warm", "false").lower() == "true"
+    use_cache = request.args.get("cache", "false").lower() == "true"
+    conversation_id = request.args.get("conversation_id")
+    last_event_id = parse_last_event_id(
+        request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    )
+
+    if not command and not stream_id:
+        return jsonify({"error": "Command is required"}), 400
+    if output_format not in OUTPUT_FORMATS:
+        return jsonify({"error": f"Unknown format: {output_format}"}), 400
+
+    try:
+        timeout, idle_timeout = parse_timeouts(request.args, query=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job, created = resolve_stream_job(
+            command,
+            directory,
+            include_errors,
+            stream_id,
+            warm,
+            timeout,
+            idle_timeout,
+            use_cache,
+            conversation_id,
         )
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 404
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    if created:
+        last_event_id = 0
+    return stream_response(
+        generate_sse_response(job, mode, last_event_id, output_format)
+    )
 
-        # We'll clean up the temp file after the process completes
-        temp_files_to_clean = [prompt_file]
 
-        all_outputs = []
+@app.route("/promptstream", methods=["POST"])
+@token_required
+def prompt_stream_post():
+    data = request.get_json()
+    command = data.get("command")
+    directory = data.get("directory")
+    include_errors = data.get("include_errors", True)
+    mode = data.get("mode", "full")
+    output_format = data.get("format", FORMAT_RAW)
+    stream_id = data.get("stream_id")
+    warm = data.get("warm", False)
+    use_cache = data.get("cache", False)
+    conversation_id = data.get("conversation_id")
+    last_event_id = parse_last_event_id(
+        request.headers.get("Last-Event-ID") or data.get("last_event_id")
+    )
 
-        while True:
-            output = process.stdout.readline()
-            if output == "" and process.poll() is not None:
-                break
-            if output:
-                all_outputs.append(output)
-                yield f"data: {json.dumps({'stdout': output, 'allOutputs': all_outputs, 'success': True})}\n\n"
+    if not command and not stream_id:
+        return jsonify({"error": "Command is required"}), 400
+    if output_format not in OUTPUT_FORMATS:
+        return jsonify({"error": f"Unknown format: {output_format}"}), 400
 
-        # Check for any remaining stderr
-        for error in process.stderr:
-            all_outputs.append(error)
-            yield f"data: {json.dumps({'stderr': error, 'allOutputs': all_outputs, 'success': True})}\n\n"
+    try:
+        timeout, idle_timeout = parse_timeouts(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job, created = resolve_stream_job(
+            command,
+            directory,
+            include_errors,
+            stream_id,
+            warm,
+            timeout,
+            idle_timeout,
+            use_cache,
+            conversation_id,
+        )
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 404
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    if created:
+        last_event_id = 0
+    return stream_response(
+        generate_sse_response(job, mode, last_event_id, output_format)
+    )
 
-        # Send final event
-        yield f"data: {json.dumps({'stdout': '', 'stderr': '', 'allOutputs': all_outputs, 'success': True, 'exitCode': process.returncode})}\n\n"
 
-        # Clean up the temporary file
+@app.route("/jobs", methods=["POST"])
+@token_required
+def create_job():
+    """Submit a prompt as a background job and return its id immediately."""
+    try:
+        data = request.get_json()
+        command = data.get("command")
+        directory = data.get("directory")
+        include_errors = data.get("include_errors", True)
+        warm = data.get("warm", False)
+        use_cache = data.get("cache", False)
+        conversation_id = data.get("conversation_id")
+
+        if not command:
+            return jsonify({"error": "Command is required"}), 400
+
         try:
-            for temp_file in temp_files_to_clean:
-                os.unlink(temp_file)
-                print(f"Removed temp file: {temp_file}")
-        except Exception as clean_err:
-            print(f"Failed to remove temp file: {clean_err}")
+            timeout, idle_timeout = parse_timeouts(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        job = submit_prompt_job(
+            command,
+            directory,
+            include_errors,
+            warm=warm,
+            timeout=timeout,
+            idle_timeout=idle_timeout,
+            use_cache=use_cache,
+            conversation_id=conversation_id,
+        )
+        return jsonify({**job.to_dict(), "success": True}), 202
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except Exception as e:
+        return jsonify({"error": "Failed to submit job", "details": str(e)}), 500
+
+
+@app.route("/jobs", methods=["GET"])
+@token_required
+def list_jobs():
+    """List known jobs, newest first."""
+    status = request.args.get("status")
+    limit = request.args.get("limit", default=50, type=int)
+
+    jobs = list(reversed(job_manager.list(status)))
+    return jsonify(
+        {"jobs": [job.to_dict() for job in jobs[:limit]], "total": len(jobs)}
+    )
+
+
+@app.route("/jobs/stats", methods=["GET"])
+@token_required
+def get_job_stats():
+    """Scheduler load, lifecycle limits and cancellation counters."""
+    return jsonify(
+        {
+            "scheduler": job_manager.scheduler.stats(),
+            "lifecycle": lifecycle_monitor.stats(),
+        }
+    )
+
+
+def generate_batch_events(batch: Batch, last_event_id: int = 0):
+    """SSE stream of every item's output in a batch, tagged with its index."""
+    _, missed = batch.events.since(last_event_id)
+    yield format_sse_event(
+        {
+            "batchId": batch.id,
+            "resumed": last_event_id > 0,
+            "gap": missed,
+            "items": [item.summary() for item in batch.items],
+        }
+    )
+    for event in batch.events.iter_from(last_event_id):
+        if event is None:
+            yield ": keep-alive\n\n"
+            continue
+        event_id, payload = event
+        yield format_sse_event(
+            {**payload, "success": "error" not in payload}, event_id
+        )
+
+
+@app.route("/batch", methods=["POST"])
+@token_required
+def create_batch():
+    """Run several prompts in parallel and stream their merged progress.
 
+    Body: ``{"items": [{"command": ..., "directory": ...}, ...]}``. With
+    ``"async": true`` the batch id is returned right away instead.
+    """
+    try:
+        data = request.get_json()
+        # Stored errors belong to the app being developed, not to a batch
+        include_errors = data.get("include_errors", False)
+        timeout, idle_timeout = parse_timeouts(data)
+
+        def submit(command, directory):
+            return submit_prompt_job(
+                command,
+                directory,
+                include_errors,
+                timeout=timeout,
+                idle_timeout=idle_timeout,
+            )
+
+        batch = batch_manager.create(data.get("items") or [], submit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except WorktreeError as e:
+        return jsonify({"error": "Failed to create worktree", "details": str(e)}), 500
     except Exception as e:
-        # Try to clean up temp files even on exception
-        try:
-            if "temp_files_to_clean" in locals():
-                for temp_file in temp_files_to_clean:
-                    if os.path.exists(temp_file):
-                        os.unlink(temp_file)
-                        print(f"Removed temp file on error: {temp_file}")
-        except Exception as clean_err:
-            print(f"Failed to remove temp file on error: {clean_err}")
+        return jsonify({"error": "Failed to start batch", "details": str(e)}), 500
 
-        yield f"data: {json.dumps({'error': str(e), 'success': False})}\n\n"
+    if data.get("async", False):
+        return jsonify({**batch.to_dict(), "success": True}), 202
+    return stream_response(generate_batch_events(batch))
 
 
-@app.route("/promptstream", methods=["GET"])
+@app.route("/batch", methods=["GET"])
 @token_required
-def prompt_stream_get():
-    command = request.args.get("command")
-    directory = request.args.get("directory")
-    include_errors = request.args.get("include_errors", "true").lower() == "true"
+def list_batches():
+    """List known batches, newest first."""
+    return jsonify(
+        {"batches": [batch.to_dict() for batch in reversed(batch_manager.list())]}
+    )
 
-    if not command:
-        return jsonify({"error": "Command is required"}), 400
+
+@app.route("/batch/<batch_id>", methods=["GET"])
+@token_required
+def get_batch(batch_id):
+    """Per-item status, duration, changed files and branches of a batch."""
+    batch = batch_manager.get(batch_id)
+    if batch is None:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(batch.to_dict())
+
+
+@app.route("/batch/<batch_id>/stream", methods=["GET"])
+@token_required
+def stream_batch(batch_id):
+    """Stream a batch's merged progress as SSE, resuming from Last-Event-ID."""
+    batch = batch_manager.get(batch_id)
+    if batch is None:
+        return jsonify({"error": "Batch not found"}), 404
+
+    last_event_id = parse_last_event_id(
+        request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    )
+    return stream_response(generate_batch_events(batch, last_event_id))
+
+
+@app.route("/batch/<batch_id>/cancel", methods=["POST"])
+@token_required
+def cancel_batch(batch_id):
+    """Cancel every unfinished item of a batch."""
+    batch = batch_manager.get(batch_id)
+    if batch is None:
+        return jsonify({"error": "Batch not found"}), 404
+    cancelled = batch_manager.cancel(batch)
+    return jsonify({**batch.to_dict(), "cancelled": cancelled, "success": True})
+
+
+@app.route("/cache", methods=["GET"])
+@token_required
+def get_prompt_cache():
+    """Size and hit rate of the prompt result cache."""
+    return jsonify(job_manager.cache.stats())
+
+
+@app.route("/cache/clear", methods=["POST"])
+@token_required
+def clear_prompt_cache():
+    """Delete every cached prompt result."""
+    return jsonify({"success": True, "removed": job_manager.cache.clear()})
+
+
+@app.route("/sessions", methods=["GET"])
+@token_required
+def list_sessions():
+    """Conversations with a resumable Claude session and their token usage."""
+    return jsonify(job_manager.sessions.stats())
+
+
+@app.route("/sessions/<conversation_id>", methods=["GET"])
+@token_required
+def get_session(conversation_id):
+    """Session id, turn count and token usage of one conversation."""
+    session = job_manager.sessions.get(conversation_id)
+    if session is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify(session.to_dict())
+
+
+@app.route("/sessions/<conversation_id>", methods=["DELETE"])
+@token_required
+def forget_session(conversation_id):
+    """Start the conversation's next prompt in a new Claude session."""
+    return jsonify({"success": job_manager.sessions.forget(conversation_id)})
+
+
+@app.route("/worktrees", methods=["GET"])
+@token_required
+def get_worktrees():
+    """List pooled worktrees per repository."""
+    return jsonify(worktree_pool.stats())
+
+
+@app.route("/worktrees/register", methods=["POST"])
+@token_required
+def register_worktrees():
+    """Keep worktrees of a repository ready for parallel runs."""
+    data = request.get_json(silent=True) or {}
+    directory = data.get("directory")
     if not directory:
-        # Use current directory as fallback
-        directory = str(Path(os.getcwd()))
-        print(f"No directory provided, using current directory: {directory}")
+        return jsonify({"error": "Directory path is required"}), 400
 
-    return Response(
-        generate_sse_response(command, directory, include_errors),
-        mimetype="text/event-stream",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
+    root = worktrees.repo_root(directory)
+    if root is None:
+        return jsonify({"error": "Not a git repository"}), 400
+    worktree_pool.register(root, data.get("size"))
+    return jsonify({"success": True, "root": root})
+
+
+@app.route("/worktrees/unregister", methods=["POST"])
+@token_required
+def unregister_worktrees():
+    """Stop pooling a repository and remove its idle worktrees."""
+    data = request.get_json(silent=True) or {}
+    root = worktrees.repo_root(data.get("directory") or "")
+    if root is None:
+        return jsonify({"error": "Not a git repository"}), 400
+    return jsonify({"success": True, "removed": worktree_pool.unregister(root)})
+
+
+@app.route("/worktrees/gc", methods=["POST"])
+@token_required
+def gc_worktrees():
+    """Remove spare worktrees that have been idle too long."""
+    return jsonify({"success": True, "removed": worktree_pool.gc()})
+
+
+@app.route("/workers", methods=["GET"])
+@token_required
+def get_workers():
+    """List warm Claude workers."""
+    return jsonify(worker_pool.stats())
+
+
+@app.route("/workers/reset", methods=["POST"])
+@token_required
+def reset_workers():
+    """Close idle warm workers, for one directory or all of them."""
+    data = request.get_json(silent=True) or {}
+    closed = worker_pool.shutdown(data.get("directory"))
+    return jsonify({"success": True, "closed": closed})
+
+
+@app.route("/processes", methods=["GET"])
+@token_required
+def get_processes():
+    """Spawn and exit timing for processes started by the server."""
+    return jsonify(launcher.stats())
+
+
+@app.route("/admin/env", methods=["GET"])
+@token_required
+def get_env_status():
+    """Describe the cached shell environment snapshot."""
+    return jsonify(env_resolver.stats())
+
+
+@app.route("/admin/env/refresh", methods=["POST"])
+@token_required
+def refresh_env():
+    """Re-capture the login-shell environment now."""
+    try:
+        env_resolver.refresh()
+        return jsonify({"success": True, **env_resolver.stats()})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+@token_required
+def get_job(job_id):
+    """Get the status of a job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        # Jobs from before a restart are still known by their transcript
+        stored = job_manager.stored(job_id)
+        if stored is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(stored)
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+@token_required
+def cancel_job(job_id):
+    """Cancel a queued or running job, killing its process group."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    cancelled = job_manager.cancel(job)
+    return jsonify({**job.to_dict(), "success": cancelled})
+
+
+@app.route("/jobs/<job_id>/stream", methods=["GET"])
+@token_required
+def stream_job(job_id):
+    """Stream a job's output as SSE, resuming from Last-Event-ID."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    mode = request.args.get("mode", "delta")
+    output_format = request.args.get("format", FORMAT_RAW)
+    if output_format not in OUTPUT_FORMATS:
+        return jsonify({"error": f"Unknown format: {output_format}"}), 400
+
+    last_event_id = parse_last_event_id(
+        request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    )
+    return stream_response(
+        generate_sse_response(job, mode, last_event_id, output_format)
     )
 
 
-@app.route("/promptstream", methods=["POST"])
+@app.route("/jobs/<job_id>/result", methods=["GET"])
 @token_required
-def prompt_stream_post():
-    data = request.get_json()
-    command = data.get("command")
-    directory = data.get("directory")
-    include_errors = data.get("include_errors", True)
+def get_job_result(job_id):
+    """Get the final output of a job, optionally waiting for it to finish."""
+    job = job_manager.get(job_id)
+    if job is None:
+        stored = job_manager.stored(job_id)
+        if stored is None:
+            return jsonify({"error": "Job not found"}), 404
+        transcript = job_manager.transcript(job_id)
+        return jsonify(
+            {
+                **stored,
+                "stdout": "".join(transcript.lines(STDOUT)),
+                "stderr": "".join(transcript.lines(STDERR)),
+                "success": stored["status"] == "completed",
+            }
+        )
 
-    if not command:
-        return jsonify({"error": "Command is required"}), 400
-    if not directory:
-        # Use current directory as fallback
-        directory = str(Path(os.getcwd()))
-        print(f"No directory provided, using current directory: {directory}")
+    # Allow a bounded long-poll so clients don't have to spin on /jobs/<id>
+    wait = min(request.args.get("wait", default=0, type=float), MAX_RESULT_WAIT)
+    if wait > 0:
+        job.wait(wait)
 
-    return Response(
-        generate_sse_response(command, directory, include_errors),
-        mimetype="text/event-stream",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
+    if not job.finished:
+        return jsonify(job.to_dict()), 202
+
+    output_format = request.args.get("format", FORMAT_RAW)
+    if output_format not in OUTPUT_FORMATS:
+        return jsonify({"error": f"Unknown format: {output_format}"}), 400
+    return jsonify(job_result_payload(job, output_format))
+
+
+@app.route("/jobs/<job_id>/transcript", methods=["GET"])
+@token_required
+def get_job_transcript(job_id):
+    """Read part of a job's transcript by byte range or line range.
+
+    ``?offset=&length=`` returns raw output bytes; otherwise ``?start=&end=``
+    returns lines with their stream and timestamp. Works while the job is
+    still running and for jobs from before a restart.
+    """
+    transcript = job_manager.transcript(job_id)
+    if transcript is None:
+        return jsonify({"error": "Transcript not found"}), 404
+
+    size = transcript.size
+    line_count = transcript.line_count
+
+    if "offset" in request.args or "length" in request.args:
+        offset = max(0, request.args.get("offset", default=0, type=int))
+        length = request.args.get(
+            "length", default=MAX_TRANSCRIPT_READ_BYTES, type=int
+        )
+        length = max(0, min(length, MAX_TRANSCRIPT_READ_BYTES))
+        data = transcript.read_bytes(offset, length)
+        next_offset = offset + len(data)
+        return jsonify(
+            {
+                "job_id": job_id,
+                "size": size,
+                "line_count": line_count,
+                "offset": offset,
+                "length": len(data),
+                # A range can split a multi-byte character at either end
+                "data": data.decode("utf-8", errors="replace"),
+                "next_offset": next_offset if next_offset < size else None,
+            }
+        )
+
+    start = max(0, request.args.get("start", default=0, type=int))
+    end = request.args.get("end", default=start + MAX_TRANSCRIPT_READ_LINES, type=int)
+    end = min(end, start + MAX_TRANSCRIPT_READ_LINES)
+    lines = transcript.read_lines(start, end)
+    next_start = start + len(lines)
+    return jsonify(
+        {
+            "job_id": job_id,
+            "size": size,
+            "line_count": line_count,
+            "start": start,
+            "lines": lines,
+            "next_start": next_start if next_start < line_count else None,
+        }
     )
 
 
+@app.route("/transcripts", methods=["GET"])
+@token_required
+def list_transcripts():
+    """Jobs with a transcript on disk, newest first, including past runs."""
+    limit = request.args.get("limit", default=50, type=int)
+    store = job_manager.transcripts
+    return jsonify({"transcripts": store.list(limit), **store.stats()})
+
+
 @app.route("/errors", methods=["GET"])
 @token_required
 def get_errors():
-    """Endpoint to retrieve current stored errors"""
-    error_count = len(recent_errors)
+    """Endpoint to retrieve current stored errors
+
+    With ``?since=<version>`` this is a long poll: it waits up to
+    ``timeout`` seconds for the errors to change after that version and
+    returns only the count and the errors that changed.
+    """
+    since = request.args.get("since", type=int)
+    if since is not None:
+        timeout = request.args.get("timeout", default=ERRORS_POLL_TIMEOUT, type=float)
+        error_store.wait(since, max(0.0, min(timeout, ERRORS_POLL_TIMEOUT)))
+        response = jsonify({**error_store.changes(since), "timestamp": time.time()})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        response.headers.add("Access-Control-Allow-Methods", "GET")
+        return response
+
+    error_count = len(error_store)
 
     if error_count > 0:
         print("\n" + "!" * 80)
@@ -672,7 +1654,13 @@ def get_errors():
 
     # Add CORS headers to make sure this endpoint works from any origin
     response = jsonify(
-        {"count": error_count, "errors": list(recent_errors), "timestamp": time.time()}
+        {
+            "count": error_count,
+            "version": error_store.version,
+            "occurrences": error_store.occurrences,
+            "errors": error_store.list(),
+            "timestamp": time.time(),
+        }
     )
     response.headers.add("Access-Control-Allow-Origin", "*")
     response.headers.add("Access-Control-Allow-Headers", "Content-Type")
@@ -680,19 +1668,44 @@ def get_errors():
     return response
 
 
+def generate_error_events(since: int):
+    """SSE stream of changes to the stored errors after version ``since``."""
+    while True:
+        changes = error_store.changes(since)
+        if changes["version"] != since:
+            since = changes["version"]
+            yield format_sse_event(changes, since)
+        elif not error_store.wait(since, ERRORS_STREAM_HEARTBEAT):
+            yield ": keep-alive\n\n"
+
+
+@app.route("/errors/stream", methods=["GET"])
+@token_required
+def stream_errors():
+    """Push the error count and new errors as SSE whenever they change.
+
+    The first event carries every stored error. Event ids are store
+    versions, so a reconnecting client only gets what changed since.
+    """
+    since = parse_last_event_id(
+        request.headers.get("Last-Event-ID") or request.args.get("since")
+    )
+    if since == 0:
+        # Always start a fresh client with the full list
+        since = -1
+    return stream_response(generate_error_events(since))
+
+
 @app.route("/clear-errors", methods=["POST"])
 @token_required
 def clear_errors():
     """Endpoint to manually clear all stored errors"""
     try:
         # Clear all stored errors
-        recent_errors.clear()
+        error_store.clear()
 
         # Update the error count file
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        error_count_path = os.path.join(script_dir, "error_count.txt")
-        with open(error_count_path, "w") as f:
-            f.write("0")
+        error_count_file.set(0)
 
         print("\n" + "=" * 80)
         print(" 🧹 ERRORS MANUALLY CLEARED 🧹 ".center(80, "="))
@@ -713,41 +1726,142 @@ def clear_errors():
 
 def get_git_command():
     """Determine the git command to use (sl or git)."""
-    try:
-        subprocess.run(["sl", "--version"], capture_output=True, check=True)
-        return "sl"
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return "git"
+    return repo_cache.vcs_command()
 
 
 def is_git_repo_dir(directory):
-    """Check if directory is a git or sl repository using proper commands."""
-    git_cmd = get_git_command()
-    
-    if git_cmd == "git":
-        # Use git rev-parse to check if it's a valid git repository
-        repo_check = subprocess.run(
-            f"{git_cmd} rev-parse --is-inside-work-tree",
-            cwd=directory,
-            shell=True,
-            capture_output=True,
-            text=True,
-        )
-        is_git_repo = repo_check.returncode == 0 and repo_check.stdout.strip() == "true"
-        is_sl_repo = False
+    """Check if directory is a git or sl repository, using the repo cache."""
+    info = repo_cache.get(directory)
+    return info.is_git, info.is_sl
+
+
+@app.route("/git/repo", methods=["POST"])
+@token_required
+def git_repo_info():
+    """VCS kind, repository root, control directory and default branch."""
+    try:
+        data = request.get_json()
+        directory = data.get("directory")
+        if not directory:
+            return jsonify({"error": "Directory path is required"}), 400
+        if data.get("refresh"):
+            repo_cache.invalidate(directory)
+        info = repo_cache.get(directory)
+        return jsonify({"success": info.kind is not None, **info.to_dict()})
+    except OSError as e:
+        return jsonify({"error": "Invalid directory", "details": str(e)}), 400
+
+
+@app.route("/git/repo-cache", methods=["GET"])
+@token_required
+def git_repo_cache():
+    """Cached repository metadata and hit counts."""
+    return jsonify(repo_cache.stats())
+
+
+@app.route("/git/repo-cache/clear", methods=["POST"])
+@token_required
+def clear_git_repo_cache():
+    """Forget all cached repository metadata."""
+    return jsonify({"success": True, "cleared": repo_cache.invalidate()})
+
+
+def git_status_payload(directory: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """/git/status response for a git repository.
+
+    Entries come from the repo's status watcher when the request uses the
+    default options, and are streamed from ``git status --porcelain=v2``
+    otherwise. ``limit``/``cursor`` select one page, ``path_prefix`` limits
+    the listing to one directory and ``group_by: "directory"`` returns
+    per-directory counts instead of entries.
+    """
+    options = status_options(data)
+    watcher = None
+    if data.get("watch", True) and options == DEFAULT_STATUS_OPTIONS:
+        watcher = get_status_watcher(directory)
+
+    version = None
+    if watcher is not None:
+        since = data.get("since")
+        if since is not None:
+            changes = watcher.changes(int(since))
+            changes["updated"] = git_order(changes["updated"].values())
+            return {"success": True, **changes}
+        snapshot = watcher.snapshot()
+        version = snapshot["version"]
+        entries = git_order(snapshot["statuses"].values())
     else:
-        # For sl, use 'sl root' command which returns the root of the repo
-        repo_check = subprocess.run(
-            f"{git_cmd} root",
-            cwd=directory,
-            shell=True,
-            capture_output=True,
-            text=True,
+        entries = iter_status(directory, **options)
+
+    prefix = (data.get("path_prefix") or "").strip("/")
+    if prefix:
+        entries = (
+            entry
+            for entry in entries
+            if entry["path"] == prefix or entry["path"].startswith(prefix + "/")
+        )
+
+    meta = {"success": True, "version": version, "watched": watcher is not None}
+    if data.get("group_by") == "directory":
+        groups = group_by_directory(entries, depth=data.get("depth"))
+        total = sum(group["count"] for group in groups)
+        return {**meta, "groups": groups, "total": total}
+
+    if data.get("limit") is None and data.get("cursor") is None:
+        changes = list(entries)
+        raw_output = "".join(
+            f"{entry['status']} {entry['path']}\n" for entry in changes
         )
-        is_sl_repo = repo_check.returncode == 0 and repo_check.stdout.strip() != ""
-        is_git_repo = False
-    
-    return is_git_repo, is_sl_repo
+        return {**meta, "changes": changes, "raw_output": raw_output}
+
+    cursor_version, offset = parse_cursor(data.get("cursor"))
+    limit = int(data.get("limit") or GIT_STATUS_PAGE_SIZE)
+    limit = max(1, min(limit, MAX_GIT_STATUS_PAGE))
+    page, total = paginate(entries, offset, limit)
+    next_offset = offset + len(page)
+    next_cursor = None
+    if next_offset < total:
+        next_cursor = str(next_offset)
+        if version is not None:
+            next_cursor = f"{version}.{next_offset}"
+    return {
+        **meta,
+        "changes": page,
+        "total": total,
+        "next_cursor": next_cursor,
+        # The list changed since the cursor was issued; pages may overlap
+        "stale": cursor_version is not None and cursor_version != version,
+    }
+
+
+def get_status_watcher(directory):
+    """A ready status watcher for a git directory, or None to run git directly."""
+    if not status_watchers.available:
+        return None
+    info = repo_cache.get(directory)
+    if not info.is_git:
+        return None
+    try:
+        watcher = status_watchers.get(info.root, info.control_dir)
+    except OSError:
+        # Out of inotify watches, for example; git status still works
+        return None
+    if not watcher.wait_ready(STATUS_WATCHER_READY_TIMEOUT) or watcher.error:
+        return None
+    # Catch up on commits and resets the file watcher hasn't reported yet
+    watcher.sync()
+    return None if watcher.error else watcher
+
+
+def refresh_status_watcher(directory):
+    """Bring a watched repo's status up to date after changing it ourselves."""
+    try:
+        root = repo_cache.get(directory).root
+    except OSError:
+        return
+    watcher = status_watchers.find(root) if root else None
+    if watcher is not None:
+        watcher.sync(force=True)
 
 
 @app.route("/git/status", methods=["POST"])
@@ -769,93 +1883,82 @@ def git_status():
         if not is_git_repo and not is_sl_repo:
             return jsonify({"error": "Not a git or sl repository"}), 400
 
-        # Use different status command based on git or sl
         if git_cmd == "git":
-            # Git uses --porcelain format
-            status_cmd = f"{git_cmd} status --porcelain"
-        else:
-            # SL doesn't support --porcelain, use regular status
-            status_cmd = f"{git_cmd} status"
-
-        result = subprocess.run(
-            status_cmd,
-            cwd=directory,
-            shell=True,
-            capture_output=True,
-            text=True,
-        )
+            try:
+                return jsonify(git_status_payload(directory, data))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except StatusError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+
+        # SL doesn't support --porcelain, use regular status
+        result = launcher.run([git_cmd, "status"], cwd=directory)
 
         if result.returncode != 0:
             return jsonify({"success": False, "error": result.stderr}), 400
 
         changes = []
-
-        # Parse differently based on git or sl
-        if git_cmd == "git":
-            # Parse the porcelain output (git)
-            for line in result.stdout.splitlines():
-                if not line.strip():
-                    continue
-
-                status = line[:2]
-                file_path = line[3:].strip()
-
-                # Determine the status type
-                status_type = ""
-                if status == "??":
-                    status_type = "untracked"
-                elif status == "MM":
-                    status_type = "modified_staged_and_unstaged"
-                elif status[0] == "M":
-                    status_type = "modified_staged"
-                elif status[1] == "M":
+        # Parse the SL status output
+        current_section = None
+        for line in result.stdout.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+
+            # SL status usually has sections like "Changed:", "Added:", etc.
+            if line.endswith(":"):
+                current_section = line.lower().replace(":", "")
+                continue
+
+            if current_section:
+                file_path = line
+
+                # Map SL sections to our status types
+                status_type = "other"
+                status = "??"
+
+                if "changed" in current_section:
                     status_type = "modified_unstaged"
-                elif status[0] == "A":
+                    status = " M"
+                elif "added" in current_section:
                     status_type = "added"
-                elif status[0] == "D":
+                    status = "A "
+                elif "removed" in current_section or "deleted" in current_section:
                     status_type = "deleted"
-                elif status[1] == "D":
-                    status_type = "deleted_unstaged"
-                elif status == "R":
-                    status_type = "renamed"
-                else:
-                    status_type = "other"
+                    status = "D "
+                elif "untracked" in current_section:
+                    status_type = "untracked"
+                    status = "??"
 
                 changes.append(
-                    {"status": status, "status_type": status_type, "path": file_path}
+                    {
+                        "status": status,
+                        "status_type": status_type,
+                        "path": file_path,
+                    }
                 )
-        else:
-            # Parse the SL status output
-            current_section = None
+
+        # If we didn't parse any changes but have output, try a simpler approach
+        if not changes and result.stdout:
+            # Try to find file mentions in the output
             for line in result.stdout.splitlines():
                 line = line.strip()
-                if not line:
-                    continue
-
-                # SL status usually has sections like "Changed:", "Added:", etc.
-                if line.endswith(":"):
-                    current_section = line.lower().replace(":", "")
+                if not line or line.endswith(":"):
                     continue
 
-                if current_section:
-                    file_path = line
-
-                    # Map SL sections to our status types
-                    status_type = "other"
-                    status = "??"
+                # Try to extract filenames
+                parts = line.split()
+                if len(parts) > 0:
+                    file_path = parts[-1]  # Assume last part is the file
+                    status_type = "modified_unstaged"  # Default to modified
+                    status = " M"
 
-                    if "changed" in current_section:
-                        status_type = "modified_unstaged"
-                        status = " M"
-                    elif "added" in current_section:
+                    if "new file" in line.lower() or "add" in line.lower():
                         status_type = "added"
                         status = "A "
-                    elif "removed" in current_section or "deleted" in current_section:
+                    elif "delete" in line.lower():
                         status_type = "deleted"
                         status = "D "
-                    elif "untracked" in current_section:
-                        status_type = "untracked"
-                        status = "??"
 
                     changes.append(
                         {
@@ -865,36 +1968,6 @@ def git_status():
                         }
                     )
 
-            # If we didn't parse any changes but have output, try a simpler approach
-            if not changes and result.stdout:
-                # Try to find file mentions in the output
-                for line in result.stdout.splitlines():
-                    line = line.strip()
-                    if not line or line.endswith(":"):
-                        continue
-
-                    # Try to extract filenames
-                    parts = line.split()
-                    if len(parts) > 0:
-                        file_path = parts[-1]  # Assume last part is the file
-                        status_type = "modified_unstaged"  # Default to modified
-                        status = " M"
-
-                        if "new file" in line.lower() or "add" in line.lower():
-                            status_type = "added"
-                            status = "A "
-                        elif "delete" in line.lower():
-                            status_type = "deleted"
-                            status = "D "
-
-                        changes.append(
-                            {
-                                "status": status,
-                                "status_type": status_type,
-                                "path": file_path,
-                            }
-                        )
-
         return jsonify(
             {"success": True, "changes": changes, "raw_output": result.stdout}
         )
@@ -911,17 +1984,192 @@ def git_status():
         )
 
 
+def generate_status_events(watcher, since: int):
+    """SSE stream of status changes after version ``since``."""
+    while True:
+        changes = watcher.changes(since)
+        if changes["version"] != since:
+            since = changes["version"]
+            changes["updated"] = git_order(changes["updated"].values())
+            yield format_sse_event(changes, since)
+        elif not watcher.wait(since, STATUS_STREAM_HEARTBEAT):
+            yield ": keep-alive\n\n"
+        elif watcher.stopped:
+            return
+
+
+@app.route("/git/status/stream", methods=["GET"])
+@token_required
+def git_status_stream():
+    """Push git status changes for ``?directory=`` as SSE.
+
+    The first event lists every changed path; later ones carry only the
+    paths whose status changed (``updated``) or that became clean
+    (``removed``). Event ids are status versions, so clients can resume
+    with Last-Event-ID.
+    """
+    directory = request.args.get("directory")
+    if not directory:
+        return jsonify({"error": "Directory path is required"}), 400
+    try:
+        watcher = get_status_watcher(directory)
+    except OSError as e:
+        return jsonify({"error": "Invalid directory", "details": str(e)}), 400
+    if watcher is None:
+        return jsonify({"error": "Status watching isn't available here"}), 400
+
+    since = parse_last_event_id(
+        request.headers.get("Last-Event-ID") or request.args.get("since")
+    )
+    # A fresh client always starts from the full list
+    return stream_response(generate_status_events(watcher, since or -1))
+
+
+@app.route("/git/watchers", methods=["GET"])
+@token_required
+def git_watchers():
+    """Repositories whose status is being watched."""
+    return jsonify(status_watchers.stats())
+
+
+@app.route("/git/watchers/stop", methods=["POST"])
+@token_required
+def stop_git_watcher():
+    """Stop watching the repository containing ``directory``."""
+    data = request.get_json()
+    directory = data.get("directory")
+    if not directory:
+        return jsonify({"error": "Directory path is required"}), 400
+    try:
+        root = repo_cache.get(directory).root or directory
+    except OSError as e:
+        return jsonify({"error": "Invalid directory", "details": str(e)}), 400
+    return jsonify({"success": True, "stopped": status_watchers.stop(root)})
+
+
+def diff_paths(data: Dict[str, Any]) -> Optional[List[str]]:
+    """Paths a diff request is limited to, from file_path or file_paths."""
+    if data.get("file_paths"):
+        return [str(path) for path in data["file_paths"]]
+    return [data["file_path"]] if data.get("file_path") else None
+
+
+def diff_limits(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Parsing options for a structured diff, capped by the server limits."""
+    return {
+        "max_file_bytes": min(
+            int(data.get("max_file_bytes") or DIFF_MAX_FILE_BYTES),
+            DIFF_MAX_FILE_BYTES,
+        ),
+        "max_total_bytes": min(
+            int(data.get("max_total_bytes") or DIFF_MAX_TOTAL_BYTES),
+            DIFF_MAX_TOTAL_BYTES,
+        ),
+        "include_generated": bool(data.get("include_generated")),
+    }
+
+
+def diff_summary(files: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "files": files,
+        "count": len(files),
+        "additions": sum(f["additions"] for f in files),
+        "deletions": sum(f["deletions"] for f in files),
+    }
+
+
+def diff_cache_key(
+    directory: str, git_cmd: str, file_path: str, staged: bool, variant: str
+) -> Optional[str]:
+    """Diff cache key for one file of a git repo, or None if it isn't cached."""
+    if git_cmd != GIT:
+        return None
+    info = repo_cache.get(directory)
+    if not info.is_git or not info.control_dir:
+        return None
+    return diff_cache.key(
+        os.path.realpath(directory), info.control_dir, file_path, staged, variant
+    )
+
+
+def cached_file_diff(
+    directory: str, git_cmd: str, file_path: str, staged: bool
+) -> Optional[List[str]]:
+    """Lines of one file's diff from the diff cache, running git on a miss.
+
+    Returns None when the diff can't be cached, for the caller to stream.
+    """
+    key = diff_cache_key(directory, git_cmd, file_path, staged, "lines")
+    diff = diff_cache.get(key)
+    if diff is None:
+        if key is None:
+            return None
+        diff = "\n".join(stream_diff(directory, git_cmd, [file_path], staged))
+        diff_cache.put(key, diff)
+    return diff.split("\n")
+
+
+def iter_diff_records(directory, git_cmd, data):
+    """A diff as a summary record, one record per file, then an end record."""
+    paths = diff_paths(data)
+    staged = bool(data.get("staged"))
+    hunk_lines = data.get("hunks", "full") != "headers"
+    try:
+        file_diffs = None
+        if paths is not None and len(paths) == 1:
+            lines = cached_file_diff(directory, git_cmd, paths[0], staged)
+            if lines is not None:
+                # One file's diff is already in hand; count it instead of
+                # running --numstat
+                file_diffs = list(iter_file_diffs(lines, **diff_limits(data)))
+        if file_diffs is not None:
+            files = [file_summary(file_diff) for file_diff in file_diffs]
+        else:
+            files = numstat(directory, git_cmd, paths, staged)
+        yield {"type": "summary", **diff_summary(files)}
+        if data.get("stat_only"):
+            yield {"type": "end", "truncated": False}
+            return
+        truncated = False
+        if file_diffs is None:
+            lines = stream_diff(directory, git_cmd, paths, staged)
+            file_diffs = iter_file_diffs(lines, **diff_limits(data))
+        for file_diff in file_diffs:
+            truncated = truncated or file_diff.truncated or file_diff.omitted
+            yield {"type": "file", **file_diff.to_dict(hunk_lines)}
+        yield {"type": "end", "truncated": truncated}
+    except OSError as e:
+        yield {"type": "error", "error": str(e)}
+
+
+def generate_diff_stream(records, sse: bool):
+    """Diff records as NDJSON lines, or as SSE events named after their type."""
+    for payload in records:
+        if sse:
+            yield format_sse_event(payload, event=payload["type"])
+        else:
+            yield json.dumps(payload) + "\n"
+
+
 @app.route("/git/diff", methods=["POST"])
 @token_required
 def git_diff():
-    """Get the diff of a specific file or all files."""
+    """Get the diff of a specific file or all files.
+
+    By default the diff is returned as one string. With ``format`` set to
+    ``structured``, ``ndjson`` or ``sse`` it is parsed into files and hunks,
+    with a ``--numstat`` summary first and size caps applied.
+    """
     try:
         data = request.get_json()
         directory = data.get("directory")
         file_path = data.get("file_path")  # Optional, if None, get diff for all files
+        output_format = data.get("format", "raw")
 
         if not directory:
             return jsonify({"error": "Directory path is required"}), 400
+        if output_format not in DIFF_FORMATS:
+            return jsonify({"error": f"Unknown format: {output_format}"}), 400
 
         git_cmd = get_git_command()
 
@@ -931,29 +2179,59 @@ def git_diff():
         if not is_git_repo and not is_sl_repo:
             return jsonify({"error": "Not a git or sl repository"}), 400
 
+        records = iter_diff_records(directory, git_cmd, data)
+        if output_format in ("ndjson", "sse"):
+            sse = output_format == "sse"
+            return stream_response(
+                generate_diff_stream(records, sse),
+                mimetype="text/event-stream" if sse else "application/x-ndjson",
+            )
+        if output_format == "structured":
+            summary, files, end = None, [], None
+            for record in records:
+                kind = record.pop("type")
+                if kind == "error":
+                    return jsonify({"success": False, "error": record["error"]}), 400
+                if kind == "summary":
+                    summary = record
+                elif kind == "file":
+                    files.append(record)
+                else:
+                    end = record
+            return jsonify(
+                {
+                    "success": True,
+                    "summary": summary,
+                    "files": files,
+                    "truncated": end["truncated"],
+                }
+            )
+
+        key = None
+        if file_path:
+            key = diff_cache_key(directory, git_cmd, file_path, False, "raw")
+            diff = diff_cache.get(key)
+            if diff is not None:
+                return jsonify({"success": True, "diff": diff, "file_path": file_path})
+
         # Build the diff command, same for git and sl
-        diff_cmd = f"{git_cmd} diff"
+        diff_cmd = [git_cmd, "diff"]
 
         # If file_path is provided, get diff for that specific file
         if file_path:
             if git_cmd == "git":
-                diff_cmd = f"{diff_cmd} -- {file_path}"
+                diff_cmd += ["--", file_path]
             else:
                 # For sl, the file path comes after the diff command without --
-                diff_cmd = f"{diff_cmd} {file_path}"
+                diff_cmd.append(file_path)
 
         # Run git diff
-        result = subprocess.run(
-            diff_cmd,
-            cwd=directory,
-            shell=True,
-            capture_output=True,
-            text=True,
-        )
+        result = launcher.run(diff_cmd, cwd=directory)
 
         if result.returncode != 0:
             return jsonify({"success": False, "error": result.stderr}), 400
 
+        diff_cache.put(key, result.stdout)
         return jsonify({"success": True, "diff": result.stdout, "file_path": file_path})
     except Exception as e:
         return (
@@ -964,6 +2242,295 @@ def git_diff():
         )
 
 
+def git_changes_payload(directory: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Status and diff of many files, from one git status and one git diff.
+
+    ``paths`` lists repo-relative paths; without it, or with ``"all"``,
+    every changed path is included. The diff is run once from the repo root
+    and split per file, untracked files are shown as added, and all hunk
+    text shares one ``max_total_bytes`` budget. Untracked directories are
+    one entry without a diff unless ``untracked`` is ``"all"``.
+    """
+    root = repo_cache.get(directory).root
+    staged = bool(data.get("staged"))
+    hunk_lines = data.get("hunks", "full") != "headers"
+    paths = data.get("paths")
+    if paths == "all":
+        paths = None
+    elif paths is not None:
+        if not isinstance(paths, list):
+            raise ValueError('paths must be a list of paths or "all"')
+        paths = sorted({str(path).strip("/") for path in paths})
+    limit = int(data.get("limit") or MAX_CHANGES_FILES)
+    limit = max(1, min(limit, MAX_CHANGES_FILES))
+
+    options = status_options({"untracked": data.get("untracked")})
+
+    version = None
+    watcher = None
+    if data.get("watch", True) and options == DEFAULT_STATUS_OPTIONS:
+        watcher = get_status_watcher(directory)
+    if watcher is not None:
+        snapshot = watcher.snapshot()
+        version = snapshot["version"]
+        statuses = snapshot["statuses"]
+    else:
+        pathspec = paths
+        if paths is not None and len(paths) > CHANGES_PATHSPEC_LIMIT:
+            pathspec = None
+        statuses = {
+            entry["path"]: entry for entry in iter_status(root, pathspec, **options)
+        }
+    if paths is not None:
+        statuses = {path: statuses[path] for path in paths if path in statuses}
+    entries = git_order(statuses.values())
+    total = len(entries)
+    entries = entries[:limit]
+
+    tracked, untracked = set(), []
+    for entry in entries:
+        if entry["status"] == "??":
+            if not staged:
+                untracked.append(entry["path"])
+        elif entry["status"] != "!!":
+            tracked.add(entry["path"])
+            if entry.get("orig_path"):
+                tracked.add(entry["orig_path"])
+    lines = iter(())
+    if tracked:
+        pathspec = sorted(tracked) if len(tracked) <= CHANGES_PATHSPEC_LIMIT else None
+        lines = stream_diff(root, GIT, pathspec, staged)
+    lines = itertools.chain(
+        lines, *(untracked_diff_lines(root, path) for path in untracked)
+    )
+    diffs = {}
+    truncated = total > len(entries)
+    for file_diff in iter_file_diffs(
+        lines, only=tracked.union(untracked), **diff_limits(data)
+    ):
+        truncated = truncated or file_diff.truncated or file_diff.omitted
+        diffs[file_diff.path] = file_diff.to_dict(hunk_lines)
+
+    files = [{**entry, "diff": diffs.get(entry["path"])} for entry in entries]
+    return {
+        "success": True,
+        "version": version,
+        "files": files,
+        "total": total,
+        "additions": sum(diff["additions"] for diff in diffs.values()),
+        "deletions": sum(diff["deletions"] for diff in diffs.values()),
+        "truncated": truncated,
+    }
+
+
+@app.route("/git/changes", methods=["POST"])
+@token_required
+def git_changes():
+    """Status and diffs of many changed files in one request.
+
+    Replaces a /git/status call followed by one /git/diff per file.
+    """
+    try:
+        data = request.get_json()
+        directory = data.get("directory")
+        if not directory:
+            return jsonify({"error": "Directory path is required"}), 400
+
+        is_git_repo, is_sl_repo = is_git_repo_dir(directory)
+        if not is_git_repo and not is_sl_repo:
+            return jsonify({"error": "Not a git or sl repository"}), 400
+        if not is_git_repo:
+            return jsonify({"error": "/git/changes requires a git repository"}), 400
+
+        return jsonify(git_changes_payload(directory, data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except (StatusError, OSError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": "Failed to get git changes",
+                    "details": str(e),
+                }
+            ),
+            500,
+        )
+
+
+def git_file_payload(directory: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Contents of files at a revision, read through the cat-file pool.
+
+    ``rev`` is ``"HEAD"`` by default, ``"index"`` for the staged version, or
+    any revision git understands. Paths are relative to the repository
+    root. Sizes are checked first, so files over the limit are reported
+    without reading them.
+    """
+    info = repo_cache.get(directory)
+    paths = data.get("paths") or ([data["path"]] if data.get("path") else [])
+    if not isinstance(paths, list) or not paths:
+        raise ValueError("path or paths is required")
+    if len(paths) > MAX_FILE_CONTENT_PATHS:
+        raise ValueError(f"At most {MAX_FILE_CONTENT_PATHS} paths per request")
+    rev = str(data.get("rev") or "HEAD")
+    paths = [str(path).strip("/") for path in paths]
+    specs = [f":{path}" if rev == "index" else f"{rev}:{path}" for path in paths]
+
+    headers = cat_file_pool.read(info.root, info.control_dir, specs, contents=False)
+    wanted = []
+    if data.get("content", True):
+        wanted = [
+            spec
+            for spec, header in zip(specs, headers)
+            if header
+            and header.type == "blob"
+            and header.size <= MAX_FILE_CONTENT_BYTES
+        ]
+    blobs = {}
+    if wanted:
+        objects = cat_file_pool.read(info.root, info.control_dir, wanted)
+        blobs = dict(zip(wanted, objects))
+
+    files = []
+    for path, spec, header in zip(paths, specs, headers):
+        entry: Dict[str, Any] = {"path": path, "rev": rev, "found": header is not None}
+        if header is not None:
+            blob = blobs.get(spec) or header
+            entry.update(blob.to_dict())
+            entry["too_large"] = header.size > MAX_FILE_CONTENT_BYTES
+        files.append(entry)
+    return {"success": True, "files": files}
+
+
+@app.route("/git/file", methods=["POST"])
+@token_required
+def git_file():
+    """A file's content at HEAD, in the index or at any revision."""
+    try:
+        data = request.get_json()
+        directory = data.get("directory")
+        if not directory:
+            return jsonify({"error": "Directory path is required"}), 400
+
+        is_git_repo, is_sl_repo = is_git_repo_dir(directory)
+        if not is_git_repo and not is_sl_repo:
+            return jsonify({"error": "Not a git or sl repository"}), 400
+        if not is_git_repo:
+            return jsonify({"error": "/git/file requires a git repository"}), 400
+
+        return jsonify(git_file_payload(directory, data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except (CatFileError, OSError) as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    except Exception as e:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": "Failed to read file",
+                    "details": str(e),
+                }
+            ),
+            500,
+        )
+
+
+@app.route("/git/cat-file", methods=["GET"])
+@token_required
+def git_cat_file_stats():
+    """Running cat-file processes and how often they were reused."""
+    return jsonify(cat_file_pool.stats())
+
+
+@app.route("/git/cat-file/shutdown", methods=["POST"])
+@token_required
+def shutdown_git_cat_file():
+    """Close idle cat-file processes, for one repo or all of them."""
+    data = request.get_json(silent=True) or {}
+    directory = data.get("directory")
+    root = None
+    if directory:
+        try:
+            root = repo_cache.get(directory).root or directory
+        except OSError as e:
+            return jsonify({"error": "Invalid directory", "details": str(e)}), 400
+    return jsonify({"success": True, "closed": cat_file_pool.shutdown(root)})
+
+
+@app.route("/git/diff-cache", methods=["GET"])
+@token_required
+def git_diff_cache():
+    """Size and hit counts of the single-file diff cache."""
+    return jsonify(diff_cache.stats())
+
+
+@app.route("/git/diff-cache/clear", methods=["POST"])
+@token_required
+def clear_git_diff_cache():
+    """Drop every cached diff."""
+    return jsonify({"success": True, "cleared": diff_cache.clear()})
+
+
+@app.route("/git/diff/hunk", methods=["POST"])
+@token_required
+def git_diff_hunk():
+    """One hunk of a file's diff, for clients that loaded only hunk headers.
+
+    Body: ``{"directory", "file_path", "index", "staged"}``.
+    """
+    try:
+        data = request.get_json()
+        directory = data.get("directory")
+        file_path = data.get("file_path")
+        index = data.get("index")
+        if not directory or not file_path or index is None:
+            return (
+                jsonify({"error": "directory, file_path and index are required"}),
+                400,
+            )
+
+        git_cmd = get_git_command()
+        is_git_repo, is_sl_repo = is_git_repo_dir(directory)
+        if not is_git_repo and not is_sl_repo:
+            return jsonify({"error": "Not a git or sl repository"}), 400
+
+        staged = bool(data.get("staged"))
+        lines = cached_file_diff(directory, git_cmd, file_path, staged)
+        if lines is None:
+            lines = stream_diff(directory, git_cmd, [file_path], staged)
+        for file_diff in iter_file_diffs(
+            lines,
+            max_file_bytes=DIFF_MAX_FILE_BYTES,
+            max_total_bytes=DIFF_MAX_FILE_BYTES,
+            include_generated=True,
+        ):
+            if file_diff.path != file_path and file_diff.old_path != file_path:
+                continue
+            if not 0 <= int(index) < len(file_diff.hunks):
+                return jsonify({"error": "Hunk not found"}), 404
+            return jsonify(
+                {
+                    "success": True,
+                    "path": file_diff.path,
+                    "index": int(index),
+                    "hunk_count": len(file_diff.hunks),
+                    "hunk": file_diff.hunks[int(index)],
+                    "truncated": file_diff.truncated,
+                }
+            )
+        return jsonify({"error": "File has no changes"}), 404
+    except Exception as e:
+        return (
+            jsonify(
+                {"success": False, "error": "Failed to get git diff", "details": str(e)}
+            ),
+            500,
+        )
+
+
 @app.route("/git/reset-file", methods=["POST"])
 @token_required
 def git_reset_file():
@@ -989,31 +2556,13 @@ def git_reset_file():
 
         # Reset the file (unstaged changes)
         if git_cmd == "git":
-            result = subprocess.run(
-                f"{git_cmd} checkout -- {file_path}",
-                cwd=directory,
-                shell=True,
-                capture_output=True,
-                text=True,
-            )
+            result = launcher.run([git_cmd, "checkout", "--", file_path], cwd=directory)
 
             # If the file was staged, reset from staged too
-            staged_result = subprocess.run(
-                f"{git_cmd} reset HEAD {file_path}",
-                cwd=directory,
-                shell=True,
-                capture_output=True,
-                text=True,
-            )
+            staged_result = launcher.run([git_cmd, "reset", "HEAD", "--", file_path], cwd=directory)
         else:
             # For Sapling, use sl revert
-            result = subprocess.run(
-                f"{git_cmd} revert {file_path}",
-                cwd=directory,
-                shell=True,
-                capture_output=True,
-                text=True,
-            )
+            result = launcher.run([git_cmd, "revert", file_path], cwd=directory)
 
             # SL doesn't have a separate unstaging command like Git
             # For SL, the equivalent would be to use sl add to re-add a file
@@ -1021,6 +2570,7 @@ def git_reset_file():
             staged_result = subprocess.CompletedProcess(
                 args="", returncode=0, stdout="", stderr=""
             )
+        refresh_status_watcher(directory)
 
         return jsonify(
             {
@@ -1068,114 +2618,58 @@ def git_commit():
         if not is_git_repo and not is_sl_repo:
             return jsonify({"error": "Not a git or sl repository"}), 400
 
-        # Stage the files - different approach for git vs sapling
-        if git_cmd == "git":
-            # Git staging
-            if files:
-                # Stage specific files
-                for file in files:
-                    stage_result = subprocess.run(
-                        f"{git_cmd} add {file}",
-                        cwd=directory,
-                        shell=True,
-                        capture_output=True,
-                        text=True,
-                    )
-                    if stage_result.returncode != 0:
-                        return (
-                            jsonify(
-                                {
-                                    "success": False,
-                                    "error": f"Failed to stage file {file}",
-                                    "details": stage_result.stderr,
-                                }
-                            ),
-                            400,
-                        )
-            else:
-                # Stage all changes
-                stage_result = subprocess.run(
-                    f"{git_cmd} add -A",
-                    cwd=directory,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                )
-                if stage_result.returncode != 0:
-                    return (
-                        jsonify(
-                            {
-                                "success": False,
-                                "error": "Failed to stage changes",
-                                "details": stage_result.stderr,
-                            }
-                        ),
-                        400,
-                    )
-        else:
-            # Sapling staging - use addremove to track new files and remove deleted ones
-            if files:
-                # Stage specific files
-                for file in files:
-                    stage_result = subprocess.run(
-                        f"{git_cmd} add {file}",
-                        cwd=directory,
-                        shell=True,
-                        capture_output=True,
-                        text=True,
-                    )
-                    if stage_result.returncode != 0:
-                        return (
-                            jsonify(
-                                {
-                                    "success": False,
-                                    "error": f"Failed to stage file {file}",
-                                    "details": stage_result.stderr,
-                                }
-                            ),
-                            400,
-                        )
+        # Stage the files in one invocation: git reads the paths from stdin,
+        # sl takes them as arguments to addremove
+        started = time.perf_counter()
+        try:
+            stage_errors = stage_files(directory, git_cmd, files)
+        except StageError as e:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "error": "Failed to stage changes",
+                        "details": str(e),
+                    }
+                ),
+                400,
+            )
+        timing = {"stage_ms": round((time.perf_counter() - started) * 1000, 2)}
+        if stage_errors:
+            if len(stage_errors) == 1:
+                error = f"Failed to stage file {stage_errors[0]['path']}"
             else:
-                # Use addremove for all changes
-                stage_result = subprocess.run(
-                    f"{git_cmd} addremove",
-                    cwd=directory,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                )
-                if stage_result.returncode != 0:
-                    return (
-                        jsonify(
-                            {
-                                "success": False,
-                                "error": "Failed to stage changes with sl addremove",
-                                "details": stage_result.stderr,
-                            }
+                error = f"Failed to stage {len(stage_errors)} files"
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "error": error,
+                        "details": "\n".join(
+                            f"{e['path']}: {e['error']}" for e in stage_errors
                         ),
-                        400,
-                    )
+                        "errors": stage_errors,
+                        "timing": timing,
+                    }
+                ),
+                400,
+            )
 
         # Create the commit (with different syntax for sapling)
-        if git_cmd == "git":
-            commit_cmd = f'{git_cmd} commit -m "{message}"'
-        else:
-            # Use sl commit -m for sapling
-            commit_cmd = f'{git_cmd} commit -m "{message}"'
-
-        commit_result = subprocess.run(
-            commit_cmd,
-            cwd=directory,
-            shell=True,
-            capture_output=True,
-            text=True,
-        )
+        # The message is passed as its own argument, so quotes in it are safe
+        commit_cmd = [git_cmd, "commit", "-m", message]
+
+        started = time.perf_counter()
+        commit_result = launcher.run(commit_cmd, cwd=directory)
+        timing["commit_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        refresh_status_watcher(directory)
 
         return jsonify(
             {
                 "success": commit_result.returncode == 0,
                 "stdout": commit_result.stdout,
                 "stderr": commit_result.stderr,
+                "timing": timing,
             }
         )
     except Exception as e:
@@ -1213,18 +2707,12 @@ def git_push():
             return jsonify({"error": "Not a git or sl repository"}), 400
 
         # Build the push command
-        push_cmd = f"{git_cmd} push {remote}"
+        push_cmd = [git_cmd, "push", remote]
         if branch:
-            push_cmd = f"{push_cmd} {branch}"
+            push_cmd.append(branch)
 
         # Push changes
-        push_result = subprocess.run(
-            push_cmd,
-            cwd=directory,
-            shell=True,
-            capture_output=True,
-            text=True,
-        )
+        push_result = launcher.run(push_cmd, cwd=directory)
 
         return jsonify(
             {
@@ -1272,29 +2760,17 @@ def git_create_pr():
             # The command will submit the current commits that haven't been pushed yet
             
             # First, let's check the current branch
-            branch_cmd = subprocess.run(
-                f"{git_cmd} branch --show-current",
-                cwd=directory,
-                shell=True,
-                capture_output=True,
-                text=True,
-            )
+            branch_cmd = launcher.run([git_cmd, "branch", "--show-current"], cwd=directory)
             current_branch = branch_cmd.stdout.strip()
             print(f"Current branch: {current_branch}")
             
             # Ensure we have commits that can be submitted
-            log_cmd = subprocess.run(
-                f"{git_cmd} log -n 1",
-                cwd=directory,
-                shell=True,
-                capture_output=True,
-                text=True,
-            )
+            log_cmd = launcher.run([git_cmd, "log", "-n", "1"], cwd=directory)
             print(f"Latest commit: {log_cmd.stdout}")
             
             # Just use the simple 'sl pr submit' command without any options
             # Sapling will use the commit message for PR title/description
-            pr_cmd = f'{git_cmd} pr submit'
+            pr_cmd = [git_cmd, "pr", "submit"]
             
             # Print the simple command we're using
             print(f"Using simple Sapling PR command: {pr_cmd}")
@@ -1302,13 +2778,7 @@ def git_create_pr():
             # Commenting out the push before PR submit since it might be 
             # interfering with the PR creation process
             # print("Attempting to push before creating PR...")
-            # push_cmd = subprocess.run(
-            #     f"{git_cmd} push",
-            #     cwd=directory,
-            #     shell=True,
-            #     capture_output=True,
-            #     text=True,
-            # )
+            # push_cmd = launcher.run([git_cmd, "push"], cwd=directory)
             # print(f"Push result: {push_cmd.returncode}, stdout: {push_cmd.stdout}")
             
             # Add a short delay to ensure any file system operations complete
@@ -1320,13 +2790,7 @@ def git_create_pr():
         else:
             # For git repos, check if the gh CLI is installed
             try:
-                gh_version = subprocess.run(
-                    "gh --version",
-                    cwd=directory,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                )
+                gh_version = launcher.run(["gh", "--version"], cwd=directory)
                 if gh_version.returncode != 0:
                     return (
                         jsonify(
@@ -1349,23 +2813,17 @@ def git_create_pr():
                 )
 
             # Create PR command using GitHub CLI
-            pr_cmd = f'gh pr create --title "{title}"'
+            pr_cmd = ["gh", "pr", "create", "--title", title]
             if body:
-                pr_cmd = f'{pr_cmd} --body "{body}"'
+                pr_cmd += ["--body", body]
             if base:
-                pr_cmd = f"{pr_cmd} --base {base}"
+                pr_cmd += ["--base", base]
             if head:
-                pr_cmd = f"{pr_cmd} --head {head}"
+                pr_cmd += ["--head", head]
 
         # Create the PR
         print(f"Executing PR command: {pr_cmd} in directory: {directory}")
-        pr_result = subprocess.run(
-            pr_cmd,
-            cwd=directory,
-            shell=True,
-            capture_output=True,
-            text=True,
-        )
+        pr_result = launcher.run(pr_cmd, cwd=directory)
         
         print(f"PR command result: returncode={pr_result.returncode}")
         print(f"PR command stdout: {pr_result.stdout}")
@@ -1396,7 +2854,7 @@ def git_create_pr():
                 "stdout": pr_result.stdout,
                 "stderr": pr_result.stderr,
                 "error": error_message,
-                "command": pr_cmd  # Include the command for debugging
+                "command": " ".join(pr_cmd)  # Include the command for debugging
             }
         )
     except Exception as e:
@@ -1433,40 +2891,17 @@ def git_reset():
         # Run reset
         if git_cmd == "git":
             # Git reset --hard
-            result = subprocess.run(
-                f"{git_cmd} reset --hard",
-                cwd=directory,
-                shell=True,
-                capture_output=True,
-                text=True,
-            )
+            result = launcher.run([git_cmd, "reset", "--hard"], cwd=directory)
 
             # Also clean untracked files if desired
-            clean_result = subprocess.run(
-                f"{git_cmd} clean -fd",
-                cwd=directory,
-                shell=True,
-                capture_output=True,
-                text=True,
-            )
+            clean_result = launcher.run([git_cmd, "clean", "-fd"], cwd=directory)
         else:
             # SL uses revert -a for equivalent of git reset --hard
-            result = subprocess.run(
-                f"{git_cmd} revert -a",
-                cwd=directory,
-                shell=True,
-                capture_output=True,
-                text=True,
-            )
+            result = launcher.run([git_cmd, "revert", "-a"], cwd=directory)
 
             # SL has clean command
-            clean_result = subprocess.run(
-                f"{git_cmd} clean --force",
-                cwd=directory,
-                shell=True,
-                capture_output=True,
-                text=True,
-            )
+            clean_result = launcher.run([git_cmd, "clean", "--force"], cwd=directory)
+        refresh_status_watcher(directory)
 
         return jsonify(
             {
@@ -0,0 +1,4 @@
+from . import launcher
+from .launcher import CLAUDE_ARGS
+from .env import EnvironmentResolver
+from .reader import STDERR, STDOUT, OutputLine, read_lines
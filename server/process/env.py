@@ -0,0 +1,179 @@
+import os
+import signal
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from . import launcher
+
+# Seconds before a captured environment is refreshed in the background
+DEFAULT_TTL = 600
+
+# Longest we wait for the login shell to print its environment
+CAPTURE_TIMEOUT = 15  # seconds
+
+# Startup files whose modification means the captured environment is stale
+SHELL_RC_FILES = [
+    ".profile",
+    ".bash_profile",
+    ".bash_login",
+    ".bashrc",
+    ".zshenv",
+    ".zprofile",
+    ".zshrc",
+    ".config/fish/config.fish",
+]
+
+# Printed before the environment so banners from rc files can be skipped
+ENV_MARKER = "__CLAUDE_CODE_GO_ENV__"
+
+
+def _parse_env(output: str) -> Dict[str, str]:
+    """Parse NUL-separated ``env -0`` output that follows ENV_MARKER."""
+    _, found, rest = output.partition(ENV_MARKER + "\0")
+    if not found:
+        return {}
+    return dict(entry.split("=", 1) for entry in rest.split("\0") if "=" in entry)
+
+
+class EnvironmentResolver:
+    """Snapshot of the user's login-shell environment.
+
+    The environment is captured once by running the login shell and then
+    served from memory. It is refreshed in the background when the TTL
+    expires or a shell rc file changes, and synchronously on ``refresh()``,
+    which SIGHUP and the admin endpoint trigger.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, rc_files: Optional[List[str]] = None):
+        self.ttl = ttl
+        home = os.path.expanduser("~")
+        self.rc_files = [
+            os.path.join(home, name) for name in (rc_files or SHELL_RC_FILES)
+        ]
+        self._env: Optional[Dict[str, str]] = None
+        self._rc_mtimes: Dict[str, Optional[float]] = {}
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._ready = threading.Event()
+        self.captured_at: Optional[float] = None
+        self.capture_ms: Optional[float] = None
+        self.source: Optional[str] = None
+        self.refreshes = 0
+        self.last_error: Optional[str] = None
+
+    def get(self) -> Dict[str, str]:
+        """Return the cached environment, without blocking once it is captured.
+
+        The first call waits for the capture ``prime()`` started, starting
+        one if there is none.
+        """
+        env = self._env
+        if env is None:
+            self._refresh_in_background()
+            self._ready.wait(CAPTURE_TIMEOUT * 2)
+            return self._env if self._env is not None else self.refresh()
+        if self._stale():
+            self._refresh_in_background()
+        return env
+
+    def refresh(self) -> Dict[str, str]:
+        """Capture the environment now and replace the cached snapshot.
+
+        The login shell runs outside the lock, so readers keep getting the
+        previous snapshot until the new one is swapped in.
+        """
+        started = time.perf_counter()
+        rc_mtimes = self._read_rc_mtimes()
+        env, source = self._capture()
+        capture_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        with self._lock:
+            self._env = env
+            self._rc_mtimes = rc_mtimes
+            self.source = source
+            self.captured_at = time.time()
+            self.capture_ms = capture_ms
+            self.refreshes += 1
+        self._ready.set()
+        print(
+            f"Captured {len(env)} environment variables from {source} in {capture_ms}ms"
+        )
+        return env
+
+    def invalidate(self):
+        """Refresh on a background thread, e.g. from a signal handler."""
+        self._refresh_in_background()
+
+    def prime(self):
+        """Capture the environment at startup without blocking the caller."""
+        self._refresh_in_background()
+
+    def install_sighup_handler(self) -> bool:
+        """Refresh the snapshot on SIGHUP; only possible from the main thread."""
+        if not hasattr(signal, "SIGHUP"):
+            return False
+        try:
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.invalidate())
+            return True
+        except ValueError:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "captured_at": self.captured_at,
+            "capture_ms": self.capture_ms,
+            "age": time.time() - self.captured_at if self.captured_at else None,
+            "ttl": self.ttl,
+            "refreshes": self.refreshes,
+            "variables": len(self._env or {}),
+            "rc_files": [path for path, mtime in self._rc_mtimes.items() if mtime],
+            "last_error": self.last_error,
+        }
+
+    def _stale(self) -> bool:
+        if self.captured_at is None or time.time() - self.captured_at > self.ttl:
+            return True
+        return self._read_rc_mtimes() != self._rc_mtimes
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _read_rc_mtimes(self) -> Dict[str, Optional[float]]:
+        mtimes = {}
+        for path in self.rc_files:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def _capture(self):
+        shell = os.environ.get("SHELL") or "/bin/sh"
+        script = f"printf '%s\\0' {ENV_MARKER}; env -0"
+        try:
+            result = launcher.run(
+                [shell, "-l", "-c", script], timeout=CAPTURE_TIMEOUT
+            )
+            env = _parse_env(result.stdout)
+            if result.returncode == 0 and env:
+                self.last_error = None
+                return env, f"{shell} -l"
+            self.last_error = result.stderr.strip()[-500:] or "empty environment"
+        except Exception as e:
+            self.last_error = str(e)
+
+        print(f"Could not capture login shell environment: {self.last_error}")
+        return dict(os.environ), "process environment"
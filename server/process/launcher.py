@@ -0,0 +1,240 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Sequence, Union
+
+# Non-interactive Claude run that reads its prompt from stdin
+CLAUDE_ARGS = [
+    "claude",
+    "-p",
+    "--dangerously-skip-permissions",
+    "--output-format",
+    "stream-json",
+]
+
+# Finished runs kept for GET /processes
+MAX_RECENT_RUNS = 100
+
+# Seconds between SIGTERM and SIGKILL when stopping a process group
+KILL_GRACE_SECONDS = 5
+
+Argv = Union[str, Sequence[str]]
+
+
+def _program(argv: Argv) -> str:
+    if isinstance(argv, str):
+        return argv.split()[0] if argv.split() else argv
+    return os.path.basename(argv[0]) if argv else ""
+
+
+def _describe(argv: Argv) -> str:
+    if isinstance(argv, str):
+        return argv[:200]
+    return " ".join(argv)[:200]
+
+
+class LaunchStats:
+    """Spawn and exit timing for every process started through the launcher."""
+
+    def __init__(self, max_recent: int = MAX_RECENT_RUNS):
+        self._lock = threading.Lock()
+        self._recent: deque = deque(maxlen=max_recent)
+        self._programs: Dict[str, Dict[str, float]] = {}
+        self.running: Dict[int, Dict[str, Any]] = {}
+
+    def spawned(self, process: subprocess.Popen, argv: Argv, spawn_ms: float):
+        with self._lock:
+            program = self._programs.setdefault(
+                _program(argv),
+                {"spawns": 0, "spawn_ms": 0.0, "runs": 0, "run_ms": 0.0, "failures": 0},
+            )
+            program["spawns"] += 1
+            program["spawn_ms"] += spawn_ms
+            self.running[process.pid] = {
+                "pid": process.pid,
+                "command": _describe(argv),
+                "program": _program(argv),
+                "started_at": time.time(),
+                "spawn_ms": round(spawn_ms, 2),
+            }
+
+    def exited(self, process: subprocess.Popen):
+        with self._lock:
+            run = self.running.pop(process.pid, None)
+            if run is None:
+                return
+            run["duration_ms"] = round((time.time() - run["started_at"]) * 1000, 2)
+            run["exit_code"] = process.returncode
+            self._recent.append(run)
+
+            program = self._programs.get(run["program"])
+            if program is not None:
+                program["runs"] += 1
+                program["run_ms"] += run["duration_ms"]
+                if process.returncode != 0:
+                    program["failures"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": list(self.running.values()),
+                "recent": list(self._recent),
+                "programs": {
+                    name: {
+                        **counts,
+                        "avg_spawn_ms": round(counts["spawn_ms"] / counts["spawns"], 2)
+                        if counts["spawns"]
+                        else None,
+                        "avg_run_ms": round(counts["run_ms"] / counts["runs"], 2)
+                        if counts["runs"]
+                        else None,
+                    }
+                    for name, counts in self._programs.items()
+                },
+            }
+
+
+launch_stats = LaunchStats()
+
+
+def _write_stdin(process: subprocess.Popen, data):
+    try:
+        process.stdin.write(data)
+    except (BrokenPipeError, OSError):
+        # The child exited or closed stdin early; its exit code tells the story
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+
+def spawn(
+    argv: Argv,
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    stdin_data: Optional[Union[str, bytes]] = None,
+    text: bool = True,
+    **popen_kwargs,
+) -> subprocess.Popen:
+    """Start a process with piped stdout/stderr and record its spawn time.
+
+    ``argv`` is executed directly, without a shell, unless the caller passes
+    ``shell=True`` for a user-supplied command line. When ``stdin_data`` is
+    given it is written to the child's stdin on a background thread, so a
+    large prompt never deadlocks against a child that is already writing
+    output, and stdin is closed afterwards. Pass ``start_new_session=True``
+    to make the child lead its own process group so that
+    ``kill_process_group`` can stop everything it started.
+    """
+    popen_kwargs.setdefault("stdout", subprocess.PIPE)
+    popen_kwargs.setdefault("stderr", subprocess.PIPE)
+    if stdin_data is not None:
+        popen_kwargs["stdin"] = subprocess.PIPE
+    if text:
+        popen_kwargs.setdefault("bufsize", 1)
+
+    started = time.perf_counter()
+    process = subprocess.Popen(argv, cwd=cwd, env=env, text=text, **popen_kwargs)
+    launch_stats.spawned(process, argv, (time.perf_counter() - started) * 1000)
+
+    if stdin_data is not None:
+        threading.Thread(
+            target=_write_stdin, args=(process, stdin_data), daemon=True
+        ).start()
+    return process
+
+
+def wait(process: subprocess.Popen, timeout: Optional[float] = None) -> int:
+    """Wait for a launched process and record its exit."""
+    returncode = process.wait(timeout)
+    launch_stats.exited(process)
+    return returncode
+
+
+def run(
+    argv: Argv,
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    input: Optional[Union[str, bytes]] = None,
+    timeout: Optional[float] = None,
+    text: bool = True,
+) -> subprocess.CompletedProcess:
+    """Run a command to completion, like ``subprocess.run(capture_output=True)``."""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        argv,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=text,
+    )
+    launch_stats.spawned(process, argv, (time.perf_counter() - started) * 1000)
+
+    try:
+        stdout, stderr = process.communicate(input, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise
+    finally:
+        launch_stats.exited(process)
+    return subprocess.CompletedProcess(argv, process.returncode, stdout, stderr)
+
+
+def _signal_group(pgid: int, signum: int) -> bool:
+    try:
+        os.killpg(pgid, signum)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+def group_alive(pgid: int) -> bool:
+    """Whether any process is left in a process group."""
+    return _signal_group(pgid, 0)
+
+
+def kill_process_group(
+    process: subprocess.Popen, grace: float = KILL_GRACE_SECONDS
+) -> bool:
+    """Terminate a process and every process in its group.
+
+    Sends SIGTERM, then SIGKILL if the leader hasn't exited within ``grace``
+    seconds. Processes that don't lead their own group (they weren't started
+    with ``start_new_session``) are terminated on their own so the server's
+    group is never signalled.
+    """
+    if process.poll() is not None and not group_alive(process.pid):
+        return False
+
+    try:
+        leads_group = os.getpgid(process.pid) == process.pid
+    except ProcessLookupError:
+        leads_group = group_alive(process.pid)
+
+    if leads_group:
+        _signal_group(process.pid, signal.SIGTERM)
+    else:
+        process.terminate()
+
+    try:
+        process.wait(grace)
+    except subprocess.TimeoutExpired:
+        pass
+
+    if leads_group:
+        _signal_group(process.pid, signal.SIGKILL)
+    elif process.poll() is None:
+        process.kill()
+    return True
+
+
+def stats() -> Dict[str, Any]:
+    return launch_stats.to_dict()
@@ -0,0 +1,66 @@
+import codecs
+import os
+import selectors
+import subprocess
+import time
+from typing import Iterator, NamedTuple
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+READ_CHUNK_SIZE = 65536
+
+
+class OutputLine(NamedTuple):
+    """A complete line read from a child process."""
+
+    stream: str  # STDOUT or STDERR
+    text: str  # includes the trailing newline, except for a final partial line
+    timestamp: float
+
+
+def read_lines(process: subprocess.Popen) -> Iterator[OutputLine]:
+    """Drain a process's stdout and stderr together, in arrival order.
+
+    Both pipes are watched with a selector and read as soon as data is
+    available, so a child writing heavily to stderr never fills that pipe
+    and blocks while we wait on stdout. Lines are yielded as they complete,
+    tagged with their stream and the time they were read. The pipes are
+    read through their file descriptors; don't also read the Popen's file
+    objects. Iteration ends once both pipes are closed.
+    """
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    for stream, pipe in ((STDOUT, process.stdout), (STDERR, process.stderr)):
+        if pipe is None:
+            continue
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        selector.register(pipe.fileno(), selectors.EVENT_READ, stream)
+        buffers[stream] = [decoder, ""]
+
+    try:
+        while selector.get_map():
+            for key, _ in selector.select():
+                stream = key.data
+                decoder, pending = buffers[stream]
+                data = os.read(key.fd, READ_CHUNK_SIZE)
+                timestamp = time.time()
+
+                if not data:
+                    selector.unregister(key.fd)
+                    pending += decoder.decode(b"", final=True)
+                    buffers[stream][1] = ""
+                    if pending:
+                        yield OutputLine(stream, pending, timestamp)
+                    continue
+
+                pending += decoder.decode(data)
+                # Keep an unterminated last line until the rest of it arrives
+                end = pending.rfind("\n") + 1
+                complete, buffers[stream][1] = pending[:end], pending[end:]
+
+                for line in complete.split("\n")[:-1]:
+                    # Match the universal newlines of text-mode pipes
+                    yield OutputLine(stream, line.rstrip("\r") + "\n", timestamp)
+    finally:
+        selector.close()
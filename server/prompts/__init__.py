@@ -0,0 +1,18 @@
+from .sse import EventBuffer, format_sse_event, parse_last_event_id
+from .scheduler import QueueFullError, Scheduler
+from .cache import PromptCache
+from .sessions import Session, SessionRegistry
+from .transcripts import Transcript, TranscriptStore
+from .jobs import Job, JobManager
+from .lifecycle import LifecycleMonitor, parse_timeouts
+from .batch import Batch, BatchManager
+from .stream_parser import (
+    FORMAT_CONDENSED,
+    FORMAT_EVENTS,
+    FORMAT_RAW,
+    OUTPUT_FORMATS,
+    StreamJsonParser,
+    condense_event,
+    parse_stream_lines,
+)
+from .workers import ClaudeWorker, WorkerError, WorkerPool
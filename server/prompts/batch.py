@@ -0,0 +1,289 @@
+import os
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..vcs import worktrees
+from ..vcs.worktrees import Worktree, WorktreePool
+from .jobs import Job, JobManager
+from .sse import DEFAULT_REPLAY_EVENTS, EventBuffer
+
+# Prompts accepted in one batch
+MAX_BATCH_ITEMS = 16
+
+# Finished batches kept for GET /batch/<id>
+MAX_FINISHED_BATCHES = 50
+
+# Seconds an aborted batch waits for each cancelled run to stop before
+# resetting its worktree
+ABORT_WAIT_SECONDS = 10
+
+
+class BatchItem:
+    """One prompt of a batch and where it runs."""
+
+    def __init__(self, index: int, command: str, directory: str):
+        self.index = index
+        self.command = command
+        self.directory = directory
+        self.work_dir = directory
+        self.repo_root: Optional[str] = None
+        self.worktree: Optional[Worktree] = None
+        self.branch: Optional[str] = None
+        # Files already changed before an in-place run, with their stat
+        self.baseline: Dict[str, Optional[Tuple[int, ...]]] = {}
+        self.job: Optional[Job] = None
+        self.files_changed: List[str] = []
+        self.commit: Optional[str] = None
+        self.error: Optional[str] = None
+        self.done = False
+
+    def summary(self) -> Dict[str, Any]:
+        job = self.job
+        end = (job.finished_at if job else None) or time.time()
+        return {
+            "item": self.index,
+            "command": self.command[:200],
+            "directory": self.directory,
+            "work_dir": self.work_dir,
+            "job_id": job.id if job else None,
+            "status": job.status if job else None,
+            "exit_code": job.exit_code if job else None,
+            "duration": end - job.started_at if job and job.started_at else None,
+            "files_changed": self.files_changed,
+            "branch": self.branch,
+            "commit": self.commit,
+            "error": self.error or (job.error if job else None),
+            "done": self.done,
+        }
+
+
+class Batch:
+    """A set of prompts run in parallel, with one merged event stream."""
+
+    def __init__(self, items: List[BatchItem]):
+        self.id = uuid.uuid4().hex
+        self.items = items
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events = EventBuffer(DEFAULT_REPLAY_EVENTS * max(1, len(items)))
+        self._pending = len(items)
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        items = [item.summary() for item in self.items]
+        return {
+            "batch_id": self.id,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "finished": self.finished,
+            "statuses": dict(Counter(item["status"] for item in items)),
+            "items": items,
+            "last_event_id": self.events.last_id,
+        }
+
+
+class BatchManager:
+    """Fans a batch of prompts out over the job scheduler.
+
+    Items targeting the same git repository more than once each lease a
+    worktree from the pool on a ``claude/batch-...`` branch so their edits
+    can't collide; when an item finishes its changes are committed to that
+    branch and the worktree goes back to the pool. Other items run in place.
+    Every item's output is forwarded into the batch's event stream, tagged
+    with the item's index.
+    """
+
+    def __init__(
+        self,
+        job_manager: JobManager,
+        worktree_pool: Optional[WorktreePool] = None,
+        max_finished_batches: int = MAX_FINISHED_BATCHES,
+    ):
+        self.job_manager = job_manager
+        self.worktree_pool = worktree_pool or WorktreePool()
+        self._max_finished_batches = max_finished_batches
+        self._batches: "OrderedDict[str, Batch]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(
+        self, items: List[Dict[str, Any]], submit: Callable[[str, str], Job]
+    ) -> Batch:
+        """Prepare worktrees, submit every item and start forwarding output.
+
+        ``submit(command, directory)`` queues one prompt. Raises ValueError
+        for an invalid batch, WorktreeError if a worktree can't be created
+        and QueueFullError if the scheduler can't take every item. Nothing is
+        left running or checked out when any error is raised.
+        """
+        if not items:
+            raise ValueError("At least one item is required")
+        if len(items) > MAX_BATCH_ITEMS:
+            raise ValueError(f"A batch can have at most {MAX_BATCH_ITEMS} items")
+
+        batch_items = []
+        for index, item in enumerate(items):
+            command = item.get("command")
+            directory = item.get("directory")
+            if not command or not directory:
+                raise ValueError(f"Item {index} needs a command and a directory")
+            if not os.path.isdir(directory):
+                raise ValueError(f"Item {index}: directory not found: {directory}")
+            batch_items.append(BatchItem(index, command, directory))
+
+        batch = Batch(batch_items)
+        try:
+            self._prepare(batch)
+            for item in batch.items:
+                item.job = submit(item.command, item.work_dir)
+        except Exception:
+            self._abort(batch)
+            raise
+
+        with self._lock:
+            self._batches[batch.id] = batch
+            self._evict_locked()
+
+        for item in batch.items:
+            threading.Thread(
+                target=self._forward, args=(batch, item), daemon=True
+            ).start()
+        print(f"Batch {batch.id}: started {len(batch.items)} prompts")
+        return batch
+
+    def get(self, batch_id: str) -> Optional[Batch]:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def list(self) -> List[Batch]:
+        with self._lock:
+            return list(self._batches.values())
+
+    def cancel(self, batch: Batch) -> int:
+        """Cancel every item that hasn't finished yet."""
+        return sum(
+            1
+            for item in batch.items
+            if item.job is not None and self.job_manager.cancel(item.job)
+        )
+
+    def _prepare(self, batch: Batch):
+        """Give items that share a repository their own worktree."""
+        for item in batch.items:
+            item.repo_root = worktrees.repo_root(item.directory)
+        shared = Counter(item.repo_root for item in batch.items if item.repo_root)
+
+        for item in batch.items:
+            if not item.repo_root:
+                continue
+            if shared[item.repo_root] < 2:
+                item.baseline = worktrees.file_states(
+                    item.repo_root, worktrees.changed_files(item.directory)
+                )
+                continue
+
+            if not self.worktree_pool.registered(item.repo_root):
+                # Keep worktrees ready for the next batch against this repo
+                self.worktree_pool.register(item.repo_root)
+            item.branch = f"claude/batch-{batch.id[:8]}-{item.index}"
+            item.worktree = self.worktree_pool.lease(item.repo_root, item.branch)
+
+            # Run in the same subdirectory the caller pointed at
+            relative = os.path.relpath(
+                os.path.realpath(item.directory), item.repo_root
+            )
+            item.work_dir = str(item.worktree.path / relative)
+            # Directories without tracked files aren't checked out
+            os.makedirs(item.work_dir, exist_ok=True)
+
+    def _abort(self, batch: Batch):
+        for item in batch.items:
+            if item.job is not None:
+                self.job_manager.cancel(item.job)
+        for item in batch.items:
+            if item.worktree is None:
+                continue
+            if item.job is not None and not item.job.wait(ABORT_WAIT_SECONDS):
+                # Claude may still be writing there; leave it out of the pool
+                print(f"Batch {batch.id}: item {item.index} didn't stop in time")
+                self.worktree_pool.release(item.worktree, keep=True)
+                continue
+            self.worktree_pool.release(item.worktree)
+            worktrees.delete_branch(item.repo_root, item.branch)
+
+    def _forward(self, batch: Batch, item: BatchItem):
+        """Copy an item's job events into the batch stream, then wrap it up."""
+        job = item.job
+        for event in job.events.iter_from(0):
+            if event is None:
+                continue
+            _, payload = event
+            batch.events.append({"item": item.index, "jobId": job.id, **payload})
+
+        try:
+            self._finish_item(batch, item)
+        except Exception as e:
+            item.error = str(e)
+            print(f"Batch {batch.id}: item {item.index} cleanup failed: {e}")
+
+        item.done = True
+        batch.events.append({"item": item.index, "summary": item.summary()})
+        with batch._lock:
+            batch._pending -= 1
+            last = batch._pending == 0
+        if last:
+            batch.finished_at = time.time()
+            batch.events.append(
+                {"done": True, "items": [item.summary() for item in batch.items]}
+            )
+            batch.events.close()
+            print(f"Batch {batch.id}: finished")
+
+    def _finish_item(self, batch: Batch, item: BatchItem):
+        if not item.repo_root:
+            return
+
+        if item.worktree is None:
+            # Ran in place: report files that weren't already dirty, and
+            # dirty ones the run edited or reverted
+            after = worktrees.changed_files(item.directory)
+            paths = after + [path for path in item.baseline if path not in after]
+            states = worktrees.file_states(item.repo_root, paths)
+            item.files_changed = [
+                path
+                for path in paths
+                if path not in item.baseline or states[path] != item.baseline[path]
+            ]
+            return
+
+        worktree = str(item.worktree.path)
+        try:
+            item.files_changed = worktrees.changed_files(worktree)
+            if item.files_changed:
+                first_line = item.command.strip().splitlines()[0][:72]
+                item.commit = worktrees.commit_all(
+                    worktree, f"Batch {batch.id[:8]}, item {item.index}: {first_line}"
+                )
+        except Exception:
+            # Leave the worktree out of the pool so the changes aren't lost
+            self.worktree_pool.release(item.worktree, keep=True)
+            raise
+
+        self.worktree_pool.release(item.worktree)
+        if item.commit is None:
+            # Nothing to keep on the branch
+            worktrees.delete_branch(item.repo_root, item.branch)
+            item.branch = None
+
+    def _evict_locked(self):
+        finished = [
+            batch_id for batch_id, batch in self._batches.items() if batch.finished
+        ]
+        for batch_id in finished[: max(0, len(finished) - self._max_finished_batches)]:
+            del self._batches[batch_id]
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..vcs.tree_state import tree_state
+
+DEFAULT_CACHE_DIR = Path.home() / ".claudecodego" / "prompt-cache"
+DEFAULT_MAX_ENTRIES = 200
+DEFAULT_TTL = 24 * 3600  # seconds
+
+# Results larger than this aren't cached
+MAX_ENTRY_BYTES = 8 * 1024 * 1024
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so trivially reformatted prompts share an entry."""
+    return " ".join(prompt.split())
+
+
+class PromptCache:
+    """On-disk cache of successful prompt results.
+
+    Entries are keyed by the normalized prompt, the directory and the state
+    of its git working tree (see ``tree_state``), so any commit or edit in
+    the checkout makes earlier results miss. Each entry is one JSON file.
+    Reads refresh the file's mtime, and the least recently used entries are
+    deleted beyond ``max_entries``; entries older than ``ttl`` are ignored
+    and removed.
+    """
+
+    def __init__(
+        self,
+        directory: Path = DEFAULT_CACHE_DIR,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+    ):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def key(self, prompt: str, directory: str) -> Optional[str]:
+        """Cache key for a prompt, or None if the directory isn't a git checkout."""
+        state = tree_state(directory)
+        if state is None:
+            return None
+        material = "\0".join(
+            [normalize_prompt(prompt), os.path.realpath(directory), state]
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+
+        if time.time() - entry.get("created_at", 0) > self.ttl:
+            self._delete(path)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(
+        self,
+        key: str,
+        stdout: List[str],
+        stderr: List[str],
+        exit_code: Optional[int],
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """Store a result; returns False if it was too large to cache."""
+        entry = {
+            **(meta or {}),
+            "key": key,
+            "created_at": time.time(),
+            "exit_code": exit_code,
+            "stdout": stdout,
+            "stderr": stderr,
+        }
+        data = json.dumps(entry)
+        if len(data) > MAX_ENTRY_BYTES:
+            return False
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.stores += 1
+        self._evict()
+        return True
+
+    def clear(self) -> int:
+        paths = self._entry_paths()
+        for path in paths:
+            self._delete(path)
+        return len(paths)
+
+    def stats(self) -> Dict[str, Any]:
+        paths = self._entry_paths()
+        return {
+            "directory": str(self.directory),
+            "entries": len(paths),
+            "bytes": sum(self._size(path) for path in paths),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _entry_paths(self) -> List[Path]:
+        try:
+            return [path for path in self.directory.iterdir() if path.suffix == ".json"]
+        except FileNotFoundError:
+            return []
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for path in self._entry_paths():
+                try:
+                    entries.append((path.stat().st_mtime, path))
+                except FileNotFoundError:
+                    continue
+            entries.sort()
+            now = time.time()
+            excess = len(entries) - self.max_entries
+            for index, (mtime, path) in enumerate(entries):
+                # Reads refresh mtime, so a stale mtime means an expired entry
+                if index < excess or now - mtime > self.ttl:
+                    self._delete(path)
+                    self.evictions += 1
+
+    @staticmethod
+    def _delete(path: Path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _size(path: Path) -> int:
+        try:
+            return path.stat().st_size
+        except FileNotFoundError:
+            return 0
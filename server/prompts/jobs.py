@@ -0,0 +1,476 @@
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from ..process import launcher
+from ..process.reader import STDERR, STDOUT
+from .scheduler import QueueFullError, Scheduler
+from .cache import PromptCache
+from .sessions import SessionRegistry
+from .sse import EventBuffer
+from .transcripts import Transcript, TranscriptStore
+
+# Finished jobs kept in memory for status/result/stream lookups
+MAX_FINISHED_JOBS = 200
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_TIMED_OUT = "timed_out"
+
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED, JOB_TIMED_OUT)
+
+# Why a job was stopped early
+CANCEL_REQUESTED = "cancelled"
+CANCEL_DISCONNECTED = "disconnected"
+CANCEL_TIMEOUT = "timeout"
+CANCEL_IDLE_TIMEOUT = "idle_timeout"
+
+TIMEOUT_REASONS = (CANCEL_TIMEOUT, CANCEL_IDLE_TIMEOUT)
+
+
+class Job:
+    """A single Claude prompt run and everything it has produced so far."""
+
+    def __init__(
+        self,
+        prompt: str,
+        directory: str,
+        command: Optional[str] = None,
+        warm: bool = False,
+    ):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.command = command if command is not None else prompt
+        self.directory = directory
+        self.warm = warm
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.exit_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.queue_position: Optional[int] = None
+        self._stdout: Optional[List[str]] = []
+        self._stderr: Optional[List[str]] = []
+        self.output_lines = 0
+        self.events = EventBuffer()
+        self.transcript: Optional[Transcript] = None
+
+        # Prompt result cache: the key to store under, or whether this job
+        # was answered from the cache instead of running Claude
+        self.cache_key: Optional[str] = None
+        self.cached = False
+
+        # Client conversation this run belongs to and the Claude session it
+        # continues with --resume, if any
+        self.conversation_id: Optional[str] = None
+        self.resume_session: Optional[str] = None
+
+        # Called with the job once its outcome is known, before the final
+        # event is published and before waiters wake up
+        self.finish_callbacks: List[Callable[["Job"], None]] = []
+        self._done = threading.Event()
+
+        # Lifecycle: limits, stream subscribers and the running process
+        self.timeout: Optional[float] = None
+        self.idle_timeout: Optional[float] = None
+        self.cancel_on_disconnect = False
+        self.cancel_reason: Optional[str] = None
+        self.last_output_at: Optional[float] = None
+        self.subscribers = 0
+        self.detached_at: Optional[float] = None
+        self.process = None
+        self.pgid: Optional[int] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def stdout(self) -> List[str]:
+        """Output lines, read back from the transcript once the job has finished."""
+        if self._stdout is None:
+            return self.transcript.lines(STDOUT)
+        return self._stdout
+
+    @property
+    def stderr(self) -> List[str]:
+        if self._stderr is None:
+            return self.transcript.lines(STDERR)
+        return self._stderr
+
+    def set_queue_position(self, position: Optional[int]):
+        """Record the job's place in the scheduler queue and tell stream readers."""
+        if position != self.queue_position:
+            self.queue_position = position
+            self.events.append({"queuePosition": position})
+
+    def start(self):
+        """Mark the job as running."""
+        self.set_queue_position(None)
+        self.status = JOB_RUNNING
+        self.started_at = time.time()
+        self.last_output_at = self.started_at
+
+    def attach_process(self, process, reap_orphans: bool = True):
+        """Remember the job's child so it can be killed on cancel.
+
+        With ``reap_orphans`` the child's process group is also cleaned up
+        once the job finishes; warm workers outlive their jobs, so they opt out.
+        """
+        self.process = process
+        # Claude processes lead their own group (see launcher.spawn)
+        self.pgid = process.pid if reap_orphans else None
+        if self.cancel_reason:
+            launcher.kill_process_group(process)
+
+    def subscribe(self):
+        """A stream reader attached to this job."""
+        self.subscribers += 1
+        self.detached_at = None
+
+    def unsubscribe(self):
+        """A stream reader went away; the lifecycle monitor may cancel the job."""
+        self.subscribers = max(0, self.subscribers - 1)
+        if self.subscribers == 0:
+            self.detached_at = time.time()
+
+    def request_cancel(self, reason: str = CANCEL_REQUESTED) -> bool:
+        """Stop a running job by killing its process group."""
+        if self.finished:
+            return False
+        if self.cancel_reason is None:
+            self.cancel_reason = reason
+        if self.process is not None:
+            threading.Thread(
+                target=launcher.kill_process_group, args=(self.process,), daemon=True
+            ).start()
+        return True
+
+    def add_output(
+        self, line: str, is_stderr: bool = False, timestamp: Optional[float] = None
+    ):
+        """Record a line of output and publish it to stream readers.
+
+        ``timestamp`` is when the line was read from the pipe; it is sent to
+        stream readers as ``ts`` so they can interleave stdout and stderr.
+        """
+        timestamp = timestamp or time.time()
+        stream = STDERR if is_stderr else STDOUT
+        if is_stderr:
+            self._stderr.append(line)
+        else:
+            self._stdout.append(line)
+        self.output_lines += 1
+        self.events.append({stream: line, "ts": timestamp})
+        self.last_output_at = time.time()
+
+        if self.transcript is not None:
+            try:
+                self.transcript.append(stream, line, timestamp)
+            except OSError as e:
+                print(f"Job {self.id}: transcript write failed, disabling it: {e}")
+                self.transcript.close()
+                self.transcript = None
+
+    def finish(self, exit_code: Optional[int] = None, error: Optional[str] = None):
+        """Record the final outcome and close the event stream."""
+        self.exit_code = exit_code
+        self.error = error
+        self.finished_at = time.time()
+
+        if self.cancel_reason in TIMEOUT_REASONS:
+            self.status = JOB_TIMED_OUT
+        elif self.cancel_reason:
+            self.status = JOB_CANCELLED
+        elif exit_code == 0 and not error:
+            self.status = JOB_COMPLETED
+        else:
+            self.status = JOB_FAILED
+
+        for callback in self.finish_callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Job {self.id}: finish callback failed: {e}")
+
+        if self.cancel_reason:
+            self.events.append({"exitCode": exit_code, "cancelled": self.cancel_reason})
+        elif error:
+            self.events.append({"error": error})
+        elif self.cached:
+            self.events.append({"exitCode": exit_code, "cached": True})
+        else:
+            self.events.append({"exitCode": exit_code})
+        self.events.close()
+
+        if self.transcript is not None:
+            self.transcript.close()
+            if self.save_meta():
+                # The transcript has everything now; don't hold it in memory too
+                self._stdout = self._stderr = None
+        self._done.set()
+
+    def save_meta(self) -> bool:
+        """Write the job's summary next to its transcript."""
+        if self.transcript is None:
+            return False
+        try:
+            self.transcript.write_meta(self.to_dict())
+            return True
+        except OSError as e:
+            print(f"Job {self.id}: could not save transcript metadata: {e}")
+            return False
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes; returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summary of the job suitable for status responses."""
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "queue_position": self.queue_position,
+            "command": self.command[:200],
+            "directory": self.directory,
+            "warm": self.warm,
+            "cached": self.cached,
+            "conversation_id": self.conversation_id,
+            "resumed_session": self.resume_session,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": end - self.started_at if self.started_at else None,
+            "exit_code": self.exit_code,
+            "error": self.error,
+            "cancel_reason": self.cancel_reason,
+            "subscribers": self.subscribers,
+            "output_lines": self.output_lines,
+            "last_event_id": self.events.last_id,
+        }
+
+    def result(self) -> Dict[str, Any]:
+        """Full output of a finished job."""
+        return {
+            **self.to_dict(),
+            "stdout": "".join(self.stdout),
+            "stderr": "".join(self.stderr),
+            "success": self.status == JOB_COMPLETED,
+        }
+
+
+class JobManager:
+    """Registry of prompt jobs, run in the background by a Scheduler."""
+
+    def __init__(
+        self,
+        runner: Callable[[Job], None],
+        scheduler: Optional[Scheduler] = None,
+        max_finished_jobs: int = MAX_FINISHED_JOBS,
+        transcripts: Optional[TranscriptStore] = None,
+        cache: Optional[PromptCache] = None,
+        sessions: Optional[SessionRegistry] = None,
+    ):
+        self._runner = runner
+        self.scheduler = scheduler or Scheduler()
+        self._max_finished_jobs = max_finished_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cancellations: Counter = Counter()
+        self.transcripts = transcripts
+        self.cache = cache
+        self.sessions = sessions
+
+    def submit(
+        self,
+        prompt: str,
+        directory: str,
+        command: Optional[str] = None,
+        job_id: Optional[str] = None,
+        warm: bool = False,
+        use_cache: bool = False,
+        conversation_id: Optional[str] = None,
+    ) -> Job:
+        """Register a job and queue it on the scheduler.
+
+        With ``conversation_id`` the run resumes that conversation's Claude
+        session, if it has one when the job starts. With ``use_cache`` a
+        cached result for the same prompt and working tree is replayed
+        instead and the job is finished immediately. Warm jobs and
+        conversations depend on earlier turns, so they are never cached.
+        Raises QueueFullError if the scheduler cannot take another job.
+        """
+        job = Job(prompt, directory, command, warm)
+        if job_id:
+            job.id = job_id
+        if conversation_id and warm:
+            # Runs on the conversation's own warm worker, which keeps its
+            # session in the process
+            job.conversation_id = conversation_id
+        elif conversation_id and self.sessions is not None:
+            job.conversation_id = conversation_id
+            job.finish_callbacks.append(self._record_session)
+        if self.transcripts is not None:
+            job.transcript = self.transcripts.create(job.id)
+            job.save_meta()
+
+        entry = None
+        cacheable = use_cache and not warm and not job.conversation_id
+        if cacheable and self.cache is not None:
+            job.cache_key = self.cache.key(prompt, directory)
+            entry = self.cache.get(job.cache_key) if job.cache_key else None
+
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict_locked()
+
+        if entry is not None:
+            self._replay(job, entry)
+            return job
+        if job.cache_key:
+            job.finish_callbacks.append(self._store_in_cache)
+
+        try:
+            self.scheduler.submit(job, self._run)
+        except QueueFullError:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            if job.transcript is not None:
+                job.transcript.delete()
+            raise
+        return job
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def transcript(self, job_id: str) -> Optional[Transcript]:
+        """A job's transcript, including jobs from before a restart."""
+        job = self.get(job_id)
+        if job is not None:
+            return job.transcript
+        if self.transcripts is None:
+            return None
+        return self.transcripts.open(job_id)
+
+    def stored(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Summary of a job that is only left on disk, e.g. after a restart."""
+        transcript = self.transcript(job_id)
+        meta = transcript.meta() if transcript is not None else None
+        if meta is None:
+            return None
+        if meta.get("status") not in FINISHED_STATUSES:
+            # The server stopped while the job was queued or running
+            meta["status"] = JOB_FAILED
+            meta["error"] = "Server stopped before the job finished"
+        return meta
+
+    def list(self, status: Optional[str] = None) -> List[Job]:
+        """Jobs in submission order, optionally filtered by status."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if status:
+            jobs = [job for job in jobs if job.status == status]
+        return jobs
+
+    def cancel(self, job: Job, reason: str = CANCEL_REQUESTED) -> bool:
+        """Cancel a job, whether it is still queued or already running."""
+        if job.finished:
+            return False
+
+        job.cancel_reason = job.cancel_reason or reason
+        if self.scheduler.remove(job):
+            job.finish()
+        else:
+            job.request_cancel(reason)
+        self.cancellations[job.cancel_reason] += 1
+        print(f"Job {job.id}: cancelling ({job.cancel_reason})")
+        return True
+
+    def _replay(self, job: Job, entry: Dict[str, Any]):
+        """Answer a job from a cached result without running Claude."""
+        print(f"Job {job.id}: serving cached result")
+        job.cached = True
+        job.start()
+        for line in entry.get("stdout", []):
+            job.add_output(line)
+        for line in entry.get("stderr", []):
+            job.add_output(line, is_stderr=True)
+        job.finish(exit_code=entry.get("exit_code"))
+
+    def _store_in_cache(self, job: Job):
+        """Cache a successful result if the run left the working tree unchanged.
+
+        A prompt that edited files can't be answered by replaying its output,
+        so only read-only runs (same tree state before and after) are stored.
+        Runs as a finish callback so the result is cached before anyone
+        waiting on the job sees it finish.
+        """
+        if job.status != JOB_COMPLETED:
+            return
+        if self.cache.key(job.prompt, job.directory) != job.cache_key:
+            print(f"Job {job.id}: working tree changed, not caching the result")
+            return
+        try:
+            self.cache.put(
+                job.cache_key,
+                job.stdout,
+                job.stderr,
+                job.exit_code,
+                {
+                    "job_id": job.id,
+                    "command": job.command[:200],
+                    "directory": job.directory,
+                },
+            )
+        except OSError as e:
+            print(f"Job {job.id}: could not cache the result: {e}")
+
+    def _record_session(self, job: Job):
+        """Remember the session a conversation's run ended in."""
+        if job.status == JOB_FAILED and job.resume_session:
+            # The session may be gone; the next prompt starts a new one
+            self.sessions.forget(job.conversation_id)
+            return
+        session = self.sessions.record(job.conversation_id, job.directory, job.stdout)
+        if session is not None:
+            print(
+                f"Job {job.id}: conversation {job.conversation_id} is on session "
+                f"{session.session_id} ({session.turns} turns)"
+            )
+
+    def _run(self, job: Job):
+        if job.cancel_reason:
+            # Cancelled between leaving the queue and starting
+            job.finish()
+            return
+        if job.conversation_id and not job.warm:
+            # Resolved now rather than at submit: the scheduler runs one job
+            # per directory at a time, so an earlier turn queued ahead of
+            # this one has recorded its session by now
+            job.resume_session = self.sessions.resume_id(
+                job.conversation_id, job.directory
+            )
+        job.start()
+        try:
+            self._runner(job)
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            if not job.finished:
+                job.finish(error=str(e))
+        if not job.finished:
+            job.finish(error="Job runner exited without a result")
+
+    def _evict_locked(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self._max_finished_jobs)]:
+            del self._jobs[job_id]
@@ -0,0 +1,156 @@
+import math
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from ..process import launcher
+from .jobs import (
+    CANCEL_DISCONNECTED,
+    CANCEL_IDLE_TIMEOUT,
+    CANCEL_TIMEOUT,
+    JOB_QUEUED,
+    JobManager,
+)
+
+DEFAULT_JOB_TIMEOUT = 1800  # seconds of wall-clock time per run
+DEFAULT_IDLE_TIMEOUT = 600  # seconds without any output
+DEFAULT_DISCONNECT_GRACE = 30  # seconds a stream may be gone before cancelling
+CHECK_INTERVAL = 2.0  # seconds between monitor passes
+
+# How long after a job finishes its process group is watched for leftovers
+ORPHAN_WATCH_SECONDS = 60
+
+
+def parse_timeouts(
+    data: Mapping[str, Any], query: bool = False
+) -> Tuple[Optional[float], Optional[float]]:
+    """``timeout`` and ``idle_timeout`` from a request body or query string.
+
+    Each is None when not given. Raises ValueError unless every value given
+    is a positive number of seconds; query string values are parsed first.
+    """
+    timeouts = []
+    for name in ("timeout", "idle_timeout"):
+        value = data.get(name)
+        if value is not None and query:
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        if value is not None and (
+            isinstance(value, bool)
+            or not isinstance(value, (int, float))
+            or not math.isfinite(value)
+            or value <= 0
+        ):
+            raise ValueError(f"{name} must be a positive number of seconds")
+        timeouts.append(None if value is None else float(value))
+    return timeouts[0], timeouts[1]
+
+
+class LifecycleMonitor:
+    """Background reaper that enforces job limits.
+
+    Each pass cancels running jobs that exceeded their wall-clock or
+    idle-output timeout, cancels jobs whose stream clients all went away
+    more than ``disconnect_grace`` seconds ago (leaving time to resume with
+    Last-Event-ID), and kills any processes left behind in the process group
+    of a job that has already finished.
+    """
+
+    def __init__(
+        self,
+        job_manager: JobManager,
+        timeout: float = DEFAULT_JOB_TIMEOUT,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        disconnect_grace: float = DEFAULT_DISCONNECT_GRACE,
+        interval: float = CHECK_INTERVAL,
+    ):
+        self.job_manager = job_manager
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.disconnect_grace = disconnect_grace
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._reaped_groups: Dict[int, float] = {}
+        self.orphans_killed = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def check(self, now: Optional[float] = None):
+        """Run one pass over all jobs."""
+        now = now or time.time()
+        for job in self.job_manager.list():
+            try:
+                self._check_job(job, now)
+            except Exception as e:
+                print(f"Lifecycle monitor error for job {job.id}: {e}")
+
+        # Forget groups we have stopped watching
+        for pgid, finished_at in list(self._reaped_groups.items()):
+            if now - finished_at > ORPHAN_WATCH_SECONDS:
+                del self._reaped_groups[pgid]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "timeout": self.timeout,
+            "idle_timeout": self.idle_timeout,
+            "disconnect_grace": self.disconnect_grace,
+            "cancellations": dict(self.job_manager.cancellations),
+            "orphans_killed": self.orphans_killed,
+        }
+
+    def _check_job(self, job, now: float):
+        if job.finished:
+            self._reap_orphans(job, now)
+            return
+
+        if (
+            job.cancel_on_disconnect
+            and job.subscribers == 0
+            and job.detached_at is not None
+            and now - job.detached_at > self.disconnect_grace
+        ):
+            self.job_manager.cancel(job, CANCEL_DISCONNECTED)
+            return
+
+        if job.status == JOB_QUEUED or job.cancel_reason:
+            return
+
+        timeout = job.timeout or self.timeout
+        if timeout and job.started_at and now - job.started_at > timeout:
+            self.job_manager.cancel(job, CANCEL_TIMEOUT)
+            return
+
+        idle_timeout = job.idle_timeout or self.idle_timeout
+        if (
+            idle_timeout
+            and job.last_output_at
+            and now - job.last_output_at > idle_timeout
+        ):
+            self.job_manager.cancel(job, CANCEL_IDLE_TIMEOUT)
+
+    def _reap_orphans(self, job, now: float):
+        if not job.pgid or not job.finished_at:
+            return
+        if now - job.finished_at > ORPHAN_WATCH_SECONDS:
+            return
+        if job.pgid in self._reaped_groups or not launcher.group_alive(job.pgid):
+            return
+
+        print(f"Job {job.id}: killing processes left in group {job.pgid}")
+        self._reaped_groups[job.pgid] = now
+        if job.process is not None:
+            launcher.kill_process_group(job.process, grace=1)
+        self.orphans_killed += 1
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Lifecycle monitor error: {e}")
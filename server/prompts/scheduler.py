@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+# Claude runs allowed at once across all directories
+DEFAULT_MAX_CONCURRENT = 4
+
+# Jobs allowed to wait for a slot before new submissions are rejected
+DEFAULT_MAX_QUEUED = 32
+
+# Used for Retry-After until a few runs have completed
+DEFAULT_EXPECTED_DURATION = 60.0  # seconds
+MAX_RETRY_AFTER = 600  # seconds
+
+
+class QueueFullError(Exception):
+    """Raised when the prompt queue cannot take another job."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Prompt queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def directory_key(directory: str) -> str:
+    """Normalize a directory so aliases of the same path share a queue."""
+    return os.path.realpath(os.path.expanduser(directory))
+
+
+class Scheduler:
+    """Bounded FIFO scheduler for Claude runs.
+
+    At most ``max_concurrent`` jobs run at once and at most one per
+    directory. Waiting jobs are dispatched strictly in submission order,
+    skipping only those whose directory is still busy, so one busy project
+    never blocks the others.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._pending: deque = deque()  # (job, run) pairs
+        self._running: Dict[str, Any] = {}  # directory key -> job
+        self._durations: deque = deque(maxlen=20)
+        self._lock = threading.Lock()
+        self.total_started = 0
+        self.total_rejected = 0
+
+    def submit(self, job, run: Callable[[Any], None]):
+        """Queue a job, starting it immediately if a slot is free.
+
+        Raises QueueFullError when the wait queue is already at capacity.
+        """
+        with self._lock:
+            if len(self._pending) >= self.max_queued:
+                self.total_rejected += 1
+                raise QueueFullError(self._retry_after_locked())
+
+            self._pending.append((job, run))
+            self._dispatch_locked()
+
+    def position(self, job) -> Optional[int]:
+        """1-based position of a waiting job, or None if it is not queued."""
+        with self._lock:
+            for index, (queued, _) in enumerate(self._pending):
+                if queued is job:
+                    return index + 1
+        return None
+
+    def remove(self, job) -> bool:
+        """Drop a job from the wait queue; returns False if it already started."""
+        with self._lock:
+            for entry in self._pending:
+                if entry[0] is job:
+                    self._pending.remove(entry)
+                    self._publish_positions_locked()
+                    return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queued": self.max_queued,
+                "running": len(self._running),
+                "queued": len(self._pending),
+                "running_directories": list(self._running.keys()),
+                "total_started": self.total_started,
+                "total_rejected": self.total_rejected,
+                "average_duration": self._average_duration_locked(),
+            }
+
+    def _dispatch_locked(self):
+        busy = set(self._running)
+        for entry in list(self._pending):
+            if len(self._running) >= self.max_concurrent:
+                break
+            job, run = entry
+            key = directory_key(job.directory)
+            if key in busy:
+                continue
+
+            self._pending.remove(entry)
+            self._running[key] = job
+            busy.add(key)
+            self.total_started += 1
+            threading.Thread(
+                target=self._run, args=(job, run, key), daemon=True
+            ).start()
+
+        self._publish_positions_locked()
+
+    def _publish_positions_locked(self):
+        for index, (job, _) in enumerate(self._pending):
+            job.set_queue_position(index + 1)
+
+    def _run(self, job, run, key):
+        started = time.time()
+        try:
+            run(job)
+        finally:
+            with self._lock:
+                self._running.pop(key, None)
+                self._durations.append(time.time() - started)
+                self._dispatch_locked()
+
+    def _average_duration_locked(self) -> float:
+        if not self._durations:
+            return DEFAULT_EXPECTED_DURATION
+        return sum(self._durations) / len(self._durations)
+
+    def _retry_after_locked(self) -> int:
+        # A queue slot frees up roughly every average run / concurrency
+        estimate = self._average_duration_locked() / max(1, self.max_concurrent)
+        return int(min(MAX_RETRY_AFTER, max(1, estimate)))
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .scheduler import directory_key
+from .stream_parser import StreamJsonParser
+
+DEFAULT_SESSION_TTL = 24 * 3600  # seconds a conversation may sit unused
+DEFAULT_MAX_SESSIONS = 500
+
+# Token counters summed from each turn's result event
+TOKEN_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+
+class Session:
+    """The Claude session behind one client conversation."""
+
+    def __init__(self, conversation_id: str, directory: str, session_id: str):
+        self.conversation_id = conversation_id
+        self.directory = directory
+        self.session_id = session_id
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.turns = 0
+        self.tokens: Dict[str, int] = {field: 0 for field in TOKEN_FIELDS}
+        self.cost_usd = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "conversation_id": self.conversation_id,
+            "directory": self.directory,
+            "session_id": self.session_id,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+            "turns": self.turns,
+            "tokens": dict(self.tokens),
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+
+class SessionRegistry:
+    """Maps client conversation ids to Claude session ids for ``--resume``.
+
+    The session id is taken from a finished run's stream-json output (its
+    system and result events), together with the turn's token usage.
+    Claude stores sessions per project directory, so a conversation is
+    only resumed in the directory it started in. Sessions unused for
+    ``ttl`` seconds are evicted, as are the least recently used ones beyond
+    ``max_sessions``.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_SESSION_TTL,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+    ):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.resumed = 0
+        self.evicted = 0
+
+    def resume_id(self, conversation_id: str, directory: str) -> Optional[str]:
+        """Session id to resume for a conversation, if there is a live one."""
+        with self._lock:
+            self._evict_locked()
+            session = self._sessions.get(conversation_id)
+            if session is None or session.directory != directory_key(directory):
+                return None
+            self.resumed += 1
+            return session.session_id
+
+    def record(
+        self, conversation_id: str, directory: str, stdout: List[str]
+    ) -> Optional[Session]:
+        """Update a conversation from a run's stream-json output."""
+        parser = StreamJsonParser()
+        for line in stdout:
+            parser.feed(line)
+        if not parser.session_id:
+            return None
+
+        directory = directory_key(directory)
+        with self._lock:
+            session = self._sessions.pop(conversation_id, None)
+            if session is None or session.directory != directory:
+                session = Session(conversation_id, directory, parser.session_id)
+            session.session_id = parser.session_id
+            session.last_used = time.time()
+            session.turns += 1
+
+            result = parser.result or {}
+            usage = result.get("usage") or {}
+            for field in TOKEN_FIELDS:
+                session.tokens[field] += usage.get(field) or 0
+            session.cost_usd += result.get("cost_usd") or 0
+
+            self._sessions[conversation_id] = session
+            self._evict_locked()
+            return session
+
+    def get(self, conversation_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.get(conversation_id)
+
+    def forget(self, conversation_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(conversation_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._evict_locked()
+            sessions = [session.to_dict() for session in self._sessions.values()]
+        return {
+            "sessions": list(reversed(sessions)),
+            "ttl": self.ttl,
+            "max_sessions": self.max_sessions,
+            "resumed": self.resumed,
+            "evicted": self.evicted,
+        }
+
+    def _evict_locked(self):
+        now = time.time()
+        # Sessions are kept in least recently used order
+        while self._sessions:
+            conversation_id, session = next(iter(self._sessions.items()))
+            if (
+                len(self._sessions) <= self.max_sessions
+                and now - session.last_used <= self.ttl
+            ):
+                break
+            del self._sessions[conversation_id]
+            self.evicted += 1
+
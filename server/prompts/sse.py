@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Number of events kept per stream for clients that reconnect with Last-Event-ID
+DEFAULT_REPLAY_EVENTS = 2000
+
+# Seconds between keep-alive comments while a stream is idle
+DEFAULT_HEARTBEAT_SECONDS = 15.0
+
+
+def format_sse_event(
+    data: Dict[str, Any], event_id: Optional[int] = None, event: Optional[str] = None
+) -> str:
+    """Format a payload as a single SSE event."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    """Parse a Last-Event-ID header value, treating anything invalid as 0."""
+    try:
+        return max(0, int(value)) if value else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+class EventBuffer:
+    """Bounded, thread-safe buffer of numbered stream events.
+
+    Events get monotonically increasing ids starting at 1. Only the newest
+    ``max_events`` are kept, so a reconnecting client can replay what it
+    missed without the producer holding the whole stream in memory.
+    """
+
+    def __init__(self, max_events: int = DEFAULT_REPLAY_EVENTS):
+        self._events: deque = deque(maxlen=max_events)
+        self._next_id = 1
+        self._condition = threading.Condition()
+        self.closed = False
+        self.closed_at: Optional[float] = None
+
+    @property
+    def last_id(self) -> int:
+        """Id of the most recently appended event (0 if none)."""
+        return self._next_id - 1
+
+    def append(self, payload: Dict[str, Any]) -> int:
+        """Append an event and wake up any waiting readers."""
+        with self._condition:
+            event_id = self._next_id
+            self._next_id += 1
+            self._events.append((event_id, payload))
+            self._condition.notify_all()
+            return event_id
+
+    def close(self):
+        """Mark the stream as finished; readers drain and then stop."""
+        with self._condition:
+            self.closed = True
+            self.closed_at = time.time()
+            self._condition.notify_all()
+
+    def since(self, last_id: int) -> Tuple[List[Tuple[int, Dict[str, Any]]], bool]:
+        """Return buffered events after ``last_id`` and whether some were dropped."""
+        with self._condition:
+            return self._since_locked(last_id)
+
+    def _since_locked(self, last_id):
+        events = [event for event in self._events if event[0] > last_id]
+        oldest = self._events[0][0] if self._events else self._next_id
+        return events, last_id + 1 < oldest
+
+    def iter_from(
+        self, last_id: int = 0, heartbeat: float = DEFAULT_HEARTBEAT_SECONDS
+    ) -> Iterator[Optional[Tuple[int, Dict[str, Any]]]]:
+        """Yield events after ``last_id`` until the stream is closed.
+
+        ``None`` is yielded whenever ``heartbeat`` seconds pass without a new
+        event so callers can send a keep-alive.
+        """
+        while True:
+            with self._condition:
+                events, _ = self._since_locked(last_id)
+                if not events and not self.closed:
+                    self._condition.wait(timeout=heartbeat)
+                    events, _ = self._since_locked(last_id)
+                closed = self.closed
+
+            if events:
+                for event in events:
+                    yield event
+                last_id = events[-1][0]
+            elif closed:
+                return
+            else:
+                yield None
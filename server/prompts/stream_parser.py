@@ -0,0 +1,171 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+# Output formats for prompt results and streams
+FORMAT_RAW = "raw"  # stream-json lines exactly as the CLI printed them
+FORMAT_EVENTS = "events"  # typed events with every field kept
+FORMAT_CONDENSED = "condensed"  # typed events without redundant fields
+
+OUTPUT_FORMATS = (FORMAT_RAW, FORMAT_EVENTS, FORMAT_CONDENSED)
+
+# Fields kept per event type in condensed mode
+CONDENSED_FIELDS = {
+    "system": ("type", "subtype", "session_id", "model", "cwd"),
+    "text": ("type", "text"),
+    "thinking": ("type", "text"),
+    "tool_use": ("type", "id", "name", "input"),
+    "tool_result": ("type", "tool_use_id", "content", "is_error"),
+    "result": (
+        "type",
+        "subtype",
+        "is_error",
+        "result",
+        "session_id",
+        "duration_ms",
+        "num_turns",
+        "cost_usd",
+        "usage",
+    ),
+    "raw": ("type", "text"),
+}
+
+
+def condense_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop fields the client doesn't need, along with empty values."""
+    fields = CONDENSED_FIELDS.get(event.get("type"))
+    if fields is None:
+        return event
+    return {
+        key: event[key]
+        for key in fields
+        if key in event and event[key] is not None and event[key] != ""
+    }
+
+
+def _tool_result_content(content: Any) -> Any:
+    """Flatten a tool_result content list of text blocks into a string."""
+    if isinstance(content, list) and all(
+        isinstance(block, dict) and block.get("type") == "text" for block in content
+    ):
+        return "".join(block.get("text", "") for block in content)
+    return content
+
+
+class StreamJsonParser:
+    """Incremental parser for ``claude --output-format stream-json`` lines.
+
+    Each line fed in becomes zero or more typed events: ``system``, ``text``,
+    ``thinking``, ``tool_use``, ``tool_result``, ``result`` or ``raw`` for
+    lines that aren't JSON. Consecutive text fragments are merged into a
+    single ``text`` event, which is emitted once something else arrives or
+    the parser is flushed.
+    """
+
+    def __init__(self, condensed: bool = False, merge_text: bool = True):
+        self.condensed = condensed
+        self.merge_text = merge_text
+        self.session_id: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self._text: List[str] = []
+
+    def feed(self, line: str) -> List[Dict[str, Any]]:
+        """Parse one output line and return the events that are now complete."""
+        line = line.strip()
+        if not line:
+            return []
+
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            return self._emit([{"type": "raw", "text": line}])
+
+        if not isinstance(message, dict):
+            return self._emit([{"type": "raw", "text": line}])
+
+        if message.get("session_id"):
+            self.session_id = message["session_id"]
+
+        kind = message.get("type")
+        if kind == "system":
+            return self._emit([{**message, "type": "system"}])
+        if kind == "result":
+            event = {
+                **message,
+                "cost_usd": message.get("total_cost_usd", message.get("cost_usd")),
+            }
+            self.result = event
+            return self._emit([event])
+        if kind in ("assistant", "user"):
+            return self._emit(self._content_events(message))
+        return self._emit([{**message, "type": kind or "raw"}])
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Return any text still waiting to be merged."""
+        if not self._text:
+            return []
+        text = "".join(self._text)
+        self._text = []
+        return [self._finish({"type": "text", "text": text})]
+
+    def _content_events(self, message: Dict[str, Any]) -> List[Dict[str, Any]]:
+        body = message.get("message") or {}
+        content = body.get("content")
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+
+        events = []
+        for block in content or []:
+            if not isinstance(block, dict):
+                continue
+            kind = block.get("type")
+            if kind == "text":
+                events.append({"type": "text", "text": block.get("text", "")})
+            elif kind == "thinking":
+                events.append({"type": "thinking", "text": block.get("thinking", "")})
+            elif kind == "tool_use":
+                events.append(
+                    {
+                        "type": "tool_use",
+                        "id": block.get("id"),
+                        "name": block.get("name"),
+                        "input": block.get("input"),
+                        "message_id": body.get("id"),
+                    }
+                )
+            elif kind == "tool_result":
+                events.append(
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": block.get("tool_use_id"),
+                        "content": _tool_result_content(block.get("content")),
+                        "is_error": block.get("is_error", False),
+                    }
+                )
+            else:
+                events.append(block)
+        return events
+
+    def _emit(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        ready = []
+        for event in events:
+            if event.get("type") == "text" and self.merge_text:
+                self._text.append(event.get("text", ""))
+                continue
+            ready.extend(self.flush())
+            ready.append(self._finish(event))
+        return ready
+
+    def _finish(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        return condense_event(event) if self.condensed else event
+
+
+def parse_stream_lines(
+    lines: Iterable[str], output_format: str = FORMAT_CONDENSED
+) -> List[Dict[str, Any]]:
+    """Parse a complete stream-json transcript into typed events."""
+    parser = StreamJsonParser(condensed=output_format == FORMAT_CONDENSED)
+    events = []
+    for line in lines:
+        events.extend(parser.feed(line))
+    events.extend(parser.flush())
+    return events
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..process.reader import STDERR, STDOUT
+
+DEFAULT_TRANSCRIPT_DIR = Path.home() / ".claudecodego" / "transcripts"
+
+# Transcripts kept on disk; the oldest are deleted beyond this
+MAX_TRANSCRIPTS = 500
+
+# Prune the directory once every this many new transcripts
+PRUNE_EVERY = 50
+
+_STREAM_CODES = {STDOUT: 0, STDERR: 1}
+_STREAM_NAMES = {code: name for name, code in _STREAM_CODES.items()}
+
+# One index record per line: byte offset, byte length, read time, stream
+_INDEX_RECORD = struct.Struct("<QIdB")
+
+_SAFE_ID = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+
+def _file_name(job_id: str) -> str:
+    """Job ids can come from clients, so unusual ones are hashed."""
+    if _SAFE_ID.fullmatch(job_id):
+        return job_id
+    return hashlib.sha256(job_id.encode("utf-8")).hexdigest()
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def _map(path: Path) -> Optional[mmap.mmap]:
+    """Read-only mapping of a file, or None when it is missing or empty."""
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+
+class Transcript:
+    """Append-only record of one job's output.
+
+    ``<id>.log`` holds the output bytes exactly as they were read, stdout and
+    stderr interleaved in arrival order. ``<id>.idx`` holds a fixed-size
+    record per line (offset, length, timestamp, stream), so line N is found
+    without scanning. ``<id>.json`` holds the job's metadata. Reads map the
+    files into memory and copy out only the requested range.
+    """
+
+    def __init__(self, base: Path):
+        self.base = base
+        self.log_path = base.with_suffix(".log")
+        self.index_path = base.with_suffix(".idx")
+        self.meta_path = base.with_suffix(".json")
+        self._log = None
+        self._index = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    # Writing
+
+    def open_for_append(self):
+        self.base.parent.mkdir(parents=True, exist_ok=True)
+        self._log = open(self.log_path, "ab", buffering=0)
+        self._index = open(self.index_path, "ab", buffering=0)
+        self._size = self._log.tell()
+
+    def append(self, stream: str, text: str, timestamp: float):
+        """Write a line; the log is written before the index entry pointing at it."""
+        if self._log is None:
+            return
+        data = text.encode("utf-8", errors="replace")
+        with self._lock:
+            self._log.write(data)
+            self._index.write(
+                _INDEX_RECORD.pack(
+                    self._size, len(data), timestamp, _STREAM_CODES.get(stream, 0)
+                )
+            )
+            self._size += len(data)
+
+    def write_meta(self, meta: Dict[str, Any]):
+        """Replace the metadata file atomically."""
+        self.base.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.meta_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def close(self):
+        with self._lock:
+            for f in (self._log, self._index):
+                if f is not None:
+                    f.close()
+            self._log = self._index = None
+
+    # Reading
+
+    @property
+    def size(self) -> int:
+        try:
+            return self.log_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    @property
+    def line_count(self) -> int:
+        try:
+            return self.index_path.stat().st_size // _INDEX_RECORD.size
+        except FileNotFoundError:
+            return 0
+
+    def meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def read_bytes(self, offset: int = 0, length: Optional[int] = None) -> bytes:
+        """Bytes ``[offset, offset + length)`` of the log."""
+        log = _map(self.log_path)
+        if log is None:
+            return b""
+        with log:
+            end = len(log) if length is None else min(len(log), offset + length)
+            return log[max(0, offset) : end]
+
+    def iter_lines(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[Tuple[int, str, str, float]]:
+        """Yield ``(number, stream, text, timestamp)`` for lines ``[start, end)``."""
+        index = _map(self.index_path)
+        if index is None:
+            return
+        with index:
+            count = len(index) // _INDEX_RECORD.size
+            end = count if end is None else min(end, count)
+            if start >= end:
+                return
+
+            log = _map(self.log_path)
+            if log is None:
+                return
+            with log:
+                for number in range(max(0, start), end):
+                    offset, length, timestamp, code = _INDEX_RECORD.unpack_from(
+                        index, number * _INDEX_RECORD.size
+                    )
+                    text = log[offset : offset + length].decode(
+                        "utf-8", errors="replace"
+                    )
+                    yield number, _STREAM_NAMES.get(code, STDOUT), text, timestamp
+
+    def read_lines(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        return [
+            {"line": number, "stream": stream, "text": text, "ts": timestamp}
+            for number, stream, text, timestamp in self.iter_lines(start, end)
+        ]
+
+    def lines(self, stream: str) -> List[str]:
+        """Every line of one stream, for building a full job result."""
+        return [text for _, name, text, _ in self.iter_lines() if name == stream]
+
+    def delete(self):
+        self.close()
+        for path in (self.log_path, self.index_path, self.meta_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class TranscriptStore:
+    """Directory of job transcripts that outlives the server process."""
+
+    def __init__(
+        self,
+        directory: Path = DEFAULT_TRANSCRIPT_DIR,
+        max_transcripts: int = MAX_TRANSCRIPTS,
+    ):
+        self.directory = Path(directory)
+        self.max_transcripts = max_transcripts
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str) -> Optional[Transcript]:
+        """Start a transcript for a new job; None if the directory isn't writable."""
+        transcript = Transcript(self.directory / _file_name(job_id))
+        try:
+            transcript.open_for_append()
+        except OSError as e:
+            print(f"Could not create transcript for job {job_id}: {e}")
+            return None
+
+        with self._lock:
+            self._created += 1
+            prune = self._created % PRUNE_EVERY == 1
+        if prune:
+            self.prune()
+        return transcript
+
+    def open(self, job_id: str) -> Optional[Transcript]:
+        """An existing transcript, for reading."""
+        transcript = Transcript(self.directory / _file_name(job_id))
+        if not transcript.meta_path.exists() and not transcript.log_path.exists():
+            return None
+        return transcript
+
+    def list(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Metadata of stored transcripts, newest first."""
+        paths = sorted(
+            self._meta_paths(), key=_mtime, reverse=True
+        )
+        metas = []
+        for path in paths[:limit]:
+            meta = Transcript(path.with_suffix("")).meta()
+            if meta is not None:
+                metas.append(meta)
+        return metas
+
+    def prune(self) -> int:
+        """Delete the oldest transcripts beyond ``max_transcripts``."""
+        paths = sorted(self._meta_paths(), key=_mtime)
+        stale = paths[: max(0, len(paths) - self.max_transcripts)]
+        for path in stale:
+            Transcript(path.with_suffix("")).delete()
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        paths = self._meta_paths()
+        return {
+            "directory": str(self.directory),
+            "count": len(paths),
+            "max_transcripts": self.max_transcripts,
+            "bytes": sum(Transcript(path.with_suffix("")).size for path in paths),
+        }
+
+    def _meta_paths(self) -> List[Path]:
+        try:
+            return [path for path in self.directory.iterdir() if path.suffix == ".json"]
+        except FileNotFoundError:
+            return []
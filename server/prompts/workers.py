@@ -0,0 +1,330 @@
+import json
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..process import launcher
+from .scheduler import directory_key
+
+# Long-lived Claude process driven through stream-json on stdin/stdout
+WARM_CLAUDE_ARGS = [
+    "claude",
+    "-p",
+    "--dangerously-skip-permissions",
+    "--input-format",
+    "stream-json",
+    "--output-format",
+    "stream-json",
+    "--verbose",
+]
+
+DEFAULT_IDLE_TIMEOUT = 600  # seconds a worker may sit unused
+DEFAULT_MAX_AGE = 3600  # seconds before a worker is restarted
+DEFAULT_MAX_WORKERS = 8
+HEALTH_CHECK_INTERVAL = 30  # seconds between janitor passes
+
+# Lines of stderr kept per worker for error reports
+STDERR_TAIL_LINES = 50
+
+# (directory key, conversation id); None for prompts outside a conversation
+WorkerKey = Tuple[str, Optional[str]]
+
+
+class WorkerError(Exception):
+    """Raised when a warm worker dies or stops responding mid-turn."""
+
+
+class ClaudeWorker:
+    """A single long-lived Claude process bound to one directory.
+
+    The process keeps its conversation across turns, so a worker only ever
+    serves the conversation it was started for.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        env: Dict[str, str],
+        args: List[str],
+        conversation_id: Optional[str] = None,
+    ):
+        self.directory = directory
+        self.conversation_id = conversation_id
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.turns = 0
+        self.busy = False
+        # Whether the last turn errored or never completed
+        self.failed = False
+        self.stderr_tail: deque = deque(maxlen=STDERR_TAIL_LINES)
+        self._stderr_sink: Optional[Callable[[str], None]] = None
+
+        self.process = launcher.spawn(
+            args,
+            cwd=directory,
+            env=env,
+            stdin=subprocess.PIPE,
+            start_new_session=True,
+        )
+
+        # Drain stderr continuously so a chatty process never blocks on the pipe
+        threading.Thread(target=self._drain_stderr, daemon=True).start()
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+    def run_turn(
+        self,
+        prompt: str,
+        on_stdout: Callable[[str], None],
+        on_stderr: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
+        """Send one prompt and stream output until its ``result`` message.
+
+        Raises WorkerError if the process exits before the turn completes.
+        """
+        self.failed = True
+        message = {
+            "type": "user",
+            "message": {"role": "user", "content": [{"type": "text", "text": prompt}]},
+        }
+        self._stderr_sink = on_stderr
+        try:
+            try:
+                self.process.stdin.write(json.dumps(message) + "\n")
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                raise WorkerError(f"Claude worker is not accepting input: {e}")
+
+            for line in iter(self.process.stdout.readline, ""):
+                on_stdout(line)
+                try:
+                    output = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(output, dict) and output.get("type") == "result":
+                    self.turns += 1
+                    self.failed = bool(output.get("is_error"))
+                    return output
+
+            raise WorkerError(
+                f"Claude worker exited with code {launcher.wait(self.process)}: "
+                + "".join(self.stderr_tail)
+            )
+        finally:
+            self._stderr_sink = None
+            self.last_used = time.time()
+
+    def close(self):
+        """Stop the process, closing stdin first so it can exit cleanly."""
+        try:
+            self.process.stdin.close()
+            launcher.wait(self.process, timeout=5)
+        except Exception:
+            self.process.kill()
+            launcher.wait(self.process)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pid": self.pid,
+            "directory": self.directory,
+            "conversation_id": self.conversation_id,
+            "alive": self.alive(),
+            "busy": self.busy,
+            "turns": self.turns,
+            "age": self.age(),
+            "idle": time.time() - self.last_used,
+        }
+
+    def _drain_stderr(self):
+        for line in iter(self.process.stderr.readline, ""):
+            self.stderr_tail.append(line)
+            sink = self._stderr_sink
+            if sink:
+                sink(line)
+
+
+class WorkerPool:
+    """Warm Claude processes, one per conversation in each directory.
+
+    A worker's process remembers every turn it ran, so workers are keyed by
+    directory and conversation and never shared between conversations.
+    Prompts without a conversation each get a fresh worker: it is closed
+    after its turn and a new one is started in the background for the next
+    such prompt. Workers are evicted after ``idle_timeout`` seconds without
+    use and replaced once they are older than ``max_age`` or a turn fails.
+    A janitor thread also drops workers whose process has died.
+    """
+
+    def __init__(
+        self,
+        env_factory: Callable[[], Dict[str, str]],
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        max_age: float = DEFAULT_MAX_AGE,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        args: Optional[List[str]] = None,
+    ):
+        self._env_factory = env_factory
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.max_workers = max_workers
+        self.args = args or WARM_CLAUDE_ARGS
+        self._workers: Dict[WorkerKey, ClaudeWorker] = {}
+        self._lock = threading.Lock()
+        self._janitor: Optional[threading.Thread] = None
+        self.spawned = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def acquire(
+        self, directory: str, conversation_id: Optional[str] = None
+    ) -> ClaudeWorker:
+        """Lease the conversation's warm worker, starting one if needed."""
+        key = (directory_key(directory), conversation_id)
+        with self._lock:
+            self._start_janitor_locked()
+            worker = self._workers.get(key)
+            if worker and not worker.busy and self._healthy(worker):
+                worker.busy = True
+                self.reused += 1
+                return worker
+            if worker and not worker.busy:
+                self._evict_locked(key)
+            self._make_room_locked()
+
+        # Spawn outside the lock; the scheduler keeps one job per directory
+        worker = self._spawn(directory, conversation_id)
+        worker.busy = True
+        self._register(key, worker)
+        return worker
+
+    def release(self, worker: ClaudeWorker, healthy: bool = True):
+        """Return a worker after a turn, closing it if it can't be reused."""
+        key = (directory_key(worker.directory), worker.conversation_id)
+        with self._lock:
+            worker.busy = False
+            owned = self._workers.get(key) is worker
+            reusable = worker.conversation_id is not None
+            if owned and reusable and healthy and self._healthy(worker):
+                return
+            if owned:
+                del self._workers[key]
+            self.evicted += 1
+        worker.close()
+        if worker.conversation_id is None:
+            threading.Thread(
+                target=self._start_spare, args=(worker.directory,), daemon=True
+            ).start()
+
+    def shutdown(self, directory: Optional[str] = None) -> int:
+        """Close idle workers, for one directory or all; returns how many."""
+        key = directory_key(directory) if directory else None
+        with self._lock:
+            keys = [
+                k
+                for k, worker in self._workers.items()
+                if not worker.busy and (key is None or k[0] == key)
+            ]
+            workers = [self._workers.pop(k) for k in keys]
+        for worker in workers:
+            worker.close()
+        return len(workers)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": [worker.to_dict() for worker in self._workers.values()],
+                "max_workers": self.max_workers,
+                "idle_timeout": self.idle_timeout,
+                "max_age": self.max_age,
+                "spawned": self.spawned,
+                "reused": self.reused,
+                "evicted": self.evicted,
+            }
+
+    def _healthy(self, worker: ClaudeWorker) -> bool:
+        if worker.conversation_id is None and worker.turns:
+            # Holds another client's conversation
+            return False
+        return not worker.failed and worker.alive() and worker.age() < self.max_age
+
+    def _spawn(self, directory: str, conversation_id: Optional[str]) -> ClaudeWorker:
+        print(f"Starting warm Claude worker in {directory}")
+        worker = ClaudeWorker(
+            directory, self._env_factory(), self.args, conversation_id
+        )
+        with self._lock:
+            self.spawned += 1
+        return worker
+
+    def _register(self, key: WorkerKey, worker: ClaudeWorker):
+        """Add a started worker to the pool unless a busy one holds its slot."""
+        with self._lock:
+            existing = self._workers.get(key)
+            if existing is None or not existing.busy:
+                # An idle worker registered while this one was starting would
+                # otherwise be dropped from the pool with its process running
+                if existing is not None:
+                    self._evict_locked(key)
+                self._workers[key] = worker
+
+    def _start_spare(self, directory: str):
+        """Start an unused worker for the directory's next one-off prompt."""
+        key = (directory_key(directory), None)
+        with self._lock:
+            if key in self._workers or len(self._workers) >= self.max_workers:
+                return
+        try:
+            worker = self._spawn(directory, None)
+        except OSError as e:
+            print(f"Could not start a warm Claude worker in {directory}: {e}")
+            return
+        with self._lock:
+            taken = key in self._workers or len(self._workers) >= self.max_workers
+            if not taken:
+                self._workers[key] = worker
+        if taken:
+            worker.close()
+
+    def _evict_locked(self, key: WorkerKey):
+        worker = self._workers.pop(key)
+        self.evicted += 1
+        threading.Thread(target=worker.close, daemon=True).start()
+
+    def _make_room_locked(self):
+        idle = sorted(
+            (worker.last_used, key)
+            for key, worker in self._workers.items()
+            if not worker.busy
+        )
+        while len(self._workers) >= self.max_workers and idle:
+            _, key = idle.pop(0)
+            self._evict_locked(key)
+
+    def _start_janitor_locked(self):
+        if self._janitor is None:
+            self._janitor = threading.Thread(target=self._janitor_loop, daemon=True)
+            self._janitor.start()
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(HEALTH_CHECK_INTERVAL)
+            now = time.time()
+            with self._lock:
+                for key, worker in list(self._workers.items()):
+                    if worker.busy:
+                        continue
+                    if (
+                        not self._healthy(worker)
+                        or now - worker.last_used > self.idle_timeout
+                    ):
+                        self._evict_locked(key)
@@ -0,0 +1,30 @@
+from . import worktrees
+from .cat_file import CatFileError, CatFilePool, GitObject
+from .diff import (
+    FileDiff,
+    file_summary,
+    is_generated,
+    iter_file_diffs,
+    numstat,
+    stream_diff,
+    untracked_diff_lines,
+)
+from .diff_cache import DiffCache
+from .repo_cache import GIT, SAPLING, RepoCache, RepoInfo
+from .staging import StageError, stage_files
+from .status import (
+    DEFAULT_STATUS_OPTIONS,
+    StatusError,
+    git_order,
+    group_by_directory,
+    iter_status,
+    paginate,
+    parse_cursor,
+    parse_porcelain_v2,
+    porcelain_status,
+    status_entry,
+    status_options,
+    status_type,
+)
+from .status_watcher import StatusWatcher, StatusWatchers
+from .worktrees import WORKTREE_ROOT, Worktree, WorktreeError, WorktreePool
@@ -0,0 +1,329 @@
+import base64
+import os
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..process import launcher
+from .diff import BINARY_CHECK_BYTES
+from .repo_cache import GIT
+
+BATCH = "--batch"  # object header and contents
+BATCH_CHECK = "--batch-check"  # object header only
+
+DEFAULT_MAX_PER_REPO = 2  # processes of each kind per repository
+DEFAULT_MAX_PROCESSES = 32
+DEFAULT_IDLE_TIMEOUT = 300  # seconds a process may sit unused
+GC_INTERVAL = 30
+
+# Requests written before reading their answers. Kept under the pipe buffer
+# size, so writing never blocks on git waiting for its output to be read.
+PIPELINE_BYTES = 32 * 1024
+
+
+class CatFileError(Exception):
+    """A cat-file process exited or answered out of protocol."""
+
+
+class GitObject:
+    """One object read through ``git cat-file``; ``content`` is None for checks."""
+
+    def __init__(
+        self, spec: str, oid: str, kind: str, size: int, content: Optional[bytes]
+    ):
+        self.spec = spec
+        self.oid = oid
+        self.type = kind
+        self.size = size
+        self.content = content
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Header fields, plus the content as text or, if binary, base64."""
+        data: Dict[str, Any] = {"oid": self.oid, "type": self.type, "size": self.size}
+        if self.content is not None:
+            binary = b"\0" in self.content[:BINARY_CHECK_BYTES]
+            data["binary"] = binary
+            if binary:
+                data["encoding"] = "base64"
+                data["content"] = base64.b64encode(self.content).decode("ascii")
+            else:
+                data["encoding"] = "utf-8"
+                data["content"] = self.content.decode("utf-8", errors="replace")
+        return data
+
+
+def _index_stat(git_dir: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = os.stat(os.path.join(git_dir, "index"))
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class CatFileProcess:
+    """A long-lived ``git cat-file --batch`` or ``--batch-check`` process.
+
+    git reads the index once per process, so ``index_stat`` records the
+    index as it was at start; the pool retires a process once it changes.
+    """
+
+    def __init__(self, root: str, git_dir: str, mode: str):
+        self.root = root
+        self.git_dir = git_dir
+        self.mode = mode
+        self.index_stat = _index_stat(git_dir)
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.requests = 0
+        self.objects = 0
+        self.process = launcher.spawn(
+            [GIT, "cat-file", mode],
+            cwd=root,
+            text=False,
+            stdin=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def current(self) -> bool:
+        """Whether the process still sees the repository's current index."""
+        return self.index_stat == _index_stat(self.git_dir)
+
+    def read(self, specs: List[str]) -> List[Optional[GitObject]]:
+        """Look up objects by spec, pipelining the requests.
+
+        Returns None for specs that name no object. Raises CatFileError if
+        git stops answering.
+        """
+        objects: List[Optional[GitObject]] = []
+        start = 0
+        while start < len(specs):
+            end, size = start, 0
+            while end < len(specs) and (end == start or size < PIPELINE_BYTES):
+                size += len(specs[end].encode("utf-8")) + 1
+                end += 1
+            chunk = specs[start:end]
+            try:
+                self.process.stdin.write(
+                    "".join(spec + "\n" for spec in chunk).encode("utf-8")
+                )
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                raise CatFileError(f"git cat-file is not accepting input: {e}")
+            objects.extend(self._read_answer(spec) for spec in chunk)
+            start = end
+        self.requests += 1
+        self.objects += len(specs)
+        self.last_used = time.time()
+        return objects
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            launcher.wait(self.process, timeout=5)
+        except Exception:
+            self.process.kill()
+            launcher.wait(self.process)
+        finally:
+            self.process.stdout.close()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pid": self.pid,
+            "root": self.root,
+            "mode": self.mode,
+            "alive": self.alive(),
+            "requests": self.requests,
+            "objects": self.objects,
+            "age": time.time() - self.created_at,
+            "idle": time.time() - self.last_used,
+        }
+
+    def _read_answer(self, spec: str) -> Optional[GitObject]:
+        # "<oid> <type> <size>", or "<spec> missing" / "<spec> ambiguous"
+        header = self.process.stdout.readline()
+        if not header.endswith(b"\n"):
+            raise CatFileError("git cat-file exited")
+        fields = header.decode("utf-8", errors="replace").rstrip("\n").split(" ")
+        if len(fields) != 3 or not fields[2].isdigit():
+            return None
+        oid, kind, size = fields[0], fields[1], int(fields[2])
+        content = None
+        if self.mode == BATCH:
+            content = self.process.stdout.read(size + 1)
+            if len(content) != size + 1:
+                raise CatFileError("git cat-file exited mid-object")
+            content = content[:-1]
+        return GitObject(spec, oid, kind, size, content)
+
+
+class CatFilePool:
+    """Persistent ``git cat-file`` processes, reused across requests.
+
+    Each repository gets up to ``max_per_repo`` processes of each mode;
+    requests beyond that wait for one to be free. Reading an object then
+    costs a pipe write instead of a process spawn. Processes are closed
+    after ``idle_timeout`` seconds unused, when the repository's index
+    changes, or to stay within ``max_processes``.
+    """
+
+    def __init__(
+        self,
+        max_per_repo: int = DEFAULT_MAX_PER_REPO,
+        max_processes: int = DEFAULT_MAX_PROCESSES,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    ):
+        self.max_per_repo = max_per_repo
+        self.max_processes = max_processes
+        self.idle_timeout = idle_timeout
+        # (root, mode) -> idle processes, most recently used last
+        self._idle: Dict[Tuple[str, str], List[CatFileProcess]] = {}
+        self._busy: Dict[Tuple[str, str], int] = {}
+        self._cond = threading.Condition()
+        self._janitor: Optional[threading.Thread] = None
+        self.spawned = 0
+        self.reused = 0
+        self.retired = 0
+
+    def read(
+        self, root: str, git_dir: str, specs: List[str], contents: bool = True
+    ) -> List[Optional[GitObject]]:
+        """Objects for ``specs`` (``HEAD:path``, ``:path``, ``<rev>:path``...).
+
+        With ``contents`` false only the type and size are looked up. Raises
+        ValueError for a spec containing a newline.
+        """
+        if any("\n" in spec for spec in specs):
+            raise ValueError("Object names can't contain newlines")
+        process = self._acquire(root, git_dir, BATCH if contents else BATCH_CHECK)
+        healthy = False
+        try:
+            objects = process.read(specs)
+            healthy = True
+            return objects
+        finally:
+            self._release(process, healthy)
+
+    def shutdown(self, root: Optional[str] = None) -> int:
+        """Close idle processes, for one repository or all; returns how many."""
+        root = os.path.realpath(root) if root else None
+        with self._cond:
+            closing = []
+            for key in list(self._idle):
+                if root is None or key[0] == root:
+                    closing += self._idle.pop(key)
+        for process in closing:
+            process.close()
+        return len(closing)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            idle = [p.to_dict() for ps in self._idle.values() for p in ps]
+            busy = sum(self._busy.values())
+            return {
+                "idle": idle,
+                "busy": busy,
+                "max_per_repo": self.max_per_repo,
+                "max_processes": self.max_processes,
+                "idle_timeout": self.idle_timeout,
+                "spawned": self.spawned,
+                "reused": self.reused,
+                "retired": self.retired,
+            }
+
+    def _acquire(self, root: str, git_dir: str, mode: str) -> CatFileProcess:
+        key = (os.path.realpath(root), mode)
+        closing = []
+        with self._cond:
+            self._start_janitor_locked()
+            while True:
+                idle = self._idle.get(key, [])
+                while idle:
+                    process = idle.pop()
+                    if process.alive() and process.current():
+                        self._busy[key] = self._busy.get(key, 0) + 1
+                        self.reused += 1
+                        return process
+                    closing.append(process)
+                    self.retired += 1
+                if self._busy.get(key, 0) < self.max_per_repo:
+                    break
+                self._cond.wait()
+            self._busy[key] = self._busy.get(key, 0) + 1
+            closing += self._make_room_locked()
+            self.spawned += 1
+        for process in closing:
+            process.close()
+        try:
+            return CatFileProcess(key[0], git_dir, mode)
+        except OSError:
+            with self._cond:
+                self._busy[key] -= 1
+                self._cond.notify_all()
+            raise
+
+    def _release(self, process: CatFileProcess, healthy: bool):
+        key = (process.root, process.mode)
+        with self._cond:
+            self._busy[key] -= 1
+            if not self._busy[key]:
+                del self._busy[key]
+            reuse = healthy and process.alive()
+            if reuse:
+                self._idle.setdefault(key, []).append(process)
+            else:
+                self.retired += 1
+            self._cond.notify_all()
+        if not reuse:
+            process.close()
+
+    def _make_room_locked(self) -> List[CatFileProcess]:
+        """Idle processes to close so that one more may start."""
+        idle = sorted(
+            (p for ps in self._idle.values() for p in ps), key=lambda p: p.last_used
+        )
+        total = len(idle) + sum(self._busy.values())
+        closing = []
+        while total > self.max_processes and idle:
+            process = idle.pop(0)
+            self._idle[(process.root, process.mode)].remove(process)
+            closing.append(process)
+            self.retired += 1
+            total -= 1
+        return closing
+
+    def _start_janitor_locked(self):
+        if self._janitor is None:
+            self._janitor = threading.Thread(target=self._janitor_loop, daemon=True)
+            self._janitor.start()
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(GC_INTERVAL)
+            now = time.time()
+            with self._cond:
+                closing = []
+                for key, processes in list(self._idle.items()):
+                    keep = [
+                        p
+                        for p in processes
+                        if p.alive() and now - p.last_used <= self.idle_timeout
+                    ]
+                    closing += [p for p in processes if p not in keep]
+                    if keep:
+                        self._idle[key] = keep
+                    else:
+                        del self._idle[key]
+                self.retired += len(closing)
+            for process in closing:
+                try:
+                    process.close()
+                except Exception as e:
+                    print(f"cat-file janitor error: {e}")
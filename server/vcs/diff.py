@@ -0,0 +1,386 @@
+import fnmatch
+import os
+import re
+import stat
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional
+
+from ..process import launcher
+from .repo_cache import GIT
+
+DEFAULT_MAX_FILE_BYTES = 256 * 1024  # hunk text kept per file
+DEFAULT_MAX_TOTAL_BYTES = 2 * 1024 * 1024  # hunk text kept per response
+UNTRACKED_READ_LIMIT = 8 * 1024 * 1024  # bytes of an untracked file counted
+BINARY_CHECK_BYTES = 8000  # git also looks for a NUL byte this far
+
+# Files that are regenerated by tools rather than written by hand. Their
+# hunks are left out unless asked for, since they are rarely worth reading
+# on a phone and are often the largest part of a diff.
+GENERATED_FILES = {
+    "package-lock.json",
+    "npm-shrinkwrap.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+    "bun.lockb",
+    "Cargo.lock",
+    "Gemfile.lock",
+    "composer.lock",
+    "poetry.lock",
+    "Pipfile.lock",
+    "uv.lock",
+    "go.sum",
+    "flake.lock",
+}
+GENERATED_PATTERNS = ("*.min.js", "*.min.css", "*.map", "*.pb.go", "*_pb2.py")
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$")
+
+
+def is_generated(path: str) -> bool:
+    name = os.path.basename(path)
+    return name in GENERATED_FILES or any(
+        fnmatch.fnmatch(name, pattern) for pattern in GENERATED_PATTERNS
+    )
+
+
+def diff_args(
+    command: str, paths: Optional[List[str]] = None, staged: bool = False
+) -> List[str]:
+    """Command line for a diff in git format, for git or sl."""
+    if command == GIT:
+        args = [GIT, "-c", "core.quotePath=false", "diff", "--no-color"]
+        args += ["--no-ext-diff", "-M"]
+        if staged:
+            args.append("--cached")
+        return args + (["--", *paths] if paths else [])
+    # sl has no index, and takes paths without "--"
+    return [command, "diff", "--git", *(paths or [])]
+
+
+def numstat(
+    directory: str,
+    command: str,
+    paths: Optional[List[str]] = None,
+    staged: bool = False,
+) -> List[Dict[str, Any]]:
+    """Lines added and deleted per file, without the diff text.
+
+    git reports this with ``--numstat``; for sl the diff is read once and
+    only counted.
+    """
+    if command != GIT:
+        return [
+            file_summary(diff)
+            for diff in iter_file_diffs(
+                stream_diff(directory, command, paths, staged), max_total_bytes=0
+            )
+        ]
+
+    args = [GIT, "diff", "--numstat", "-z", "-M"]
+    if staged:
+        args.append("--cached")
+    if paths:
+        args += ["--", *paths]
+    result = launcher.run(args, cwd=directory)
+    if result.returncode != 0:
+        raise OSError(result.stderr.strip() or "git diff --numstat failed")
+
+    files = []
+    fields = iter(result.stdout.split("\0"))
+    for field in fields:
+        if not field:
+            continue
+        added, deleted, path = field.split("\t", 2)
+        old_path = None
+        if not path:
+            # Renames: "added\tdeleted\t\0old\0new"
+            old_path, path = next(fields, ""), next(fields, "")
+        binary = added == "-"
+        files.append(
+            {
+                "path": path,
+                "old_path": old_path,
+                "additions": 0 if binary else int(added),
+                "deletions": 0 if binary else int(deleted),
+                "binary": binary,
+                "generated": is_generated(path),
+            }
+        )
+    return files
+
+
+def stream_diff(
+    directory: str,
+    command: str,
+    paths: Optional[List[str]] = None,
+    staged: bool = False,
+) -> Iterator[str]:
+    """Lines of a diff as the command writes them, without line endings."""
+    args = diff_args(command, paths, staged)
+    process = launcher.spawn(args, cwd=directory, text=False)
+    finished = False
+    try:
+        for line in process.stdout:
+            yield line.decode("utf-8", errors="replace").rstrip("\n")
+        finished = True
+    finally:
+        if not finished and process.poll() is None:
+            process.kill()
+        stderr = process.stderr.read()
+        process.stdout.close()
+        process.stderr.close()
+        returncode = launcher.wait(process)
+    # git diff exits 1 only with --exit-code; sl exits 1 when nothing differs
+    if returncode not in (0, 1):
+        raise OSError(stderr.decode("utf-8", errors="replace").strip())
+
+
+def untracked_diff_lines(root: str, path: str) -> Iterator[str]:
+    """The lines ``git diff`` would show for an untracked file as added.
+
+    git diff leaves untracked files out, so they are read here rather than
+    with one ``git diff --no-index`` per file. Only the first
+    ``UNTRACKED_READ_LIMIT`` bytes are read; beyond that the line counts
+    are a lower bound.
+    """
+    full_path = os.path.join(root, path)
+    try:
+        info = os.lstat(full_path)
+        if stat.S_ISLNK(info.st_mode):
+            mode, data = "120000", os.readlink(full_path).encode("utf-8")
+        elif stat.S_ISREG(info.st_mode):
+            mode = "100755" if info.st_mode & stat.S_IXUSR else "100644"
+            with open(full_path, "rb") as f:
+                data = f.read(UNTRACKED_READ_LIMIT)
+        else:
+            # Nested repositories and other special files have no text diff
+            return
+    except OSError:
+        return
+
+    yield f"diff --git a/{path} b/{path}"
+    yield f"new file mode {mode}"
+    if not data:
+        return
+    if b"\0" in data[:BINARY_CHECK_BYTES]:
+        yield f"Binary files /dev/null and b/{path} differ"
+        return
+    lines = data.split(b"\n")
+    # A read cut off by the limit ends mid-line, not at the end of the file
+    missing_newline = lines[-1] != b"" and len(data) < UNTRACKED_READ_LIMIT
+    if lines[-1] == b"":
+        lines.pop()
+    yield from ("--- /dev/null", f"+++ b/{path}")
+    yield "@@ -0,0 +1" + ("" if len(lines) == 1 else f",{len(lines)}") + " @@"
+    for line in lines:
+        yield "+" + line.decode("utf-8", errors="replace")
+    if missing_newline:
+        yield "\\ No newline at end of file"
+
+
+class FileDiff:
+    """One file's part of a diff, parsed into hunks."""
+
+    def __init__(self, old_path: str, path: str):
+        self.path = path
+        self.old_path = old_path
+        self.status = "modified"
+        self.binary = False
+        self.generated = is_generated(path)
+        self.additions = 0
+        self.deletions = 0
+        self.hunks: List[Dict[str, Any]] = []
+        self.bytes = 0
+        self.truncated = False
+        self.omitted = False
+
+    def to_dict(self, hunk_lines: bool = True) -> Dict[str, Any]:
+        hunks = self.hunks
+        if not hunk_lines:
+            hunks = [
+                {key: value for key, value in hunk.items() if key != "lines"}
+                for hunk in hunks
+            ]
+        return {
+            "path": self.path,
+            "old_path": self.old_path if self.old_path != self.path else None,
+            "status": self.status,
+            "binary": self.binary,
+            "generated": self.generated,
+            "additions": self.additions,
+            "deletions": self.deletions,
+            "hunks": hunks,
+            "bytes": self.bytes,
+            "truncated": self.truncated,
+            "omitted": self.omitted,
+        }
+
+
+def file_summary(diff: FileDiff) -> Dict[str, Any]:
+    """The numstat fields of a parsed file diff."""
+    return {
+        "path": diff.path,
+        "old_path": diff.old_path if diff.old_path != diff.path else None,
+        "additions": diff.additions,
+        "deletions": diff.deletions,
+        "binary": diff.binary,
+        "generated": diff.generated,
+    }
+
+
+_ESCAPES = {
+    "n": b"\n",
+    "t": b"\t",
+    "r": b"\r",
+    "a": b"\a",
+    "b": b"\b",
+    "f": b"\f",
+    "v": b"\v",
+    '"': b'"',
+    "\\": b"\\",
+}
+
+
+def unquote_path(path: str) -> str:
+    """Undo git's C-style quoting of a path, if it is quoted."""
+    if len(path) < 2 or path[0] != '"' or path[-1] != '"':
+        return path
+    body = path[1:-1]
+    out = bytearray()
+    i = 0
+    while i < len(body):
+        ch = body[i]
+        if ch == "\\" and i + 1 < len(body):
+            escape = body[i + 1]
+            if escape in "01234567":
+                out.append(int(body[i + 1 : i + 4], 8) & 0xFF)
+                i += 4
+                continue
+            out += _ESCAPES.get(escape, escape.encode("utf-8"))
+            i += 2
+            continue
+        out += ch.encode("utf-8")
+        i += 1
+    return out.decode("utf-8", errors="replace")
+
+
+def _strip_prefix(path: str) -> str:
+    # "--- a/path" lines end in a tab when the path has spaces
+    path = unquote_path(path.rstrip("\t"))
+    return path[2:] if path[:2] in ("a/", "b/") else path
+
+
+def _split_git_header(line: str):
+    """Old and new path from ``diff --git a/old b/new``."""
+    rest = line[len("diff --git ") :]
+    if rest.startswith('"'):
+        end = rest.index('"', 1)
+        while rest[end - 1] == "\\":
+            end = rest.index('"', end + 1)
+        return _strip_prefix(rest[: end + 1]), _strip_prefix(rest[end + 2 :])
+    # Unquoted paths may contain spaces; unless the file was renamed both
+    # halves are the same length
+    middle = len(rest) // 2
+    if rest[middle : middle + 1] == " " and rest[2:middle] == rest[middle + 3 :]:
+        return _strip_prefix(rest[:middle]), _strip_prefix(rest[middle + 1 :])
+    old, _, new = rest.partition(" b/")
+    return _strip_prefix(old), new
+
+
+def iter_file_diffs(
+    lines: Iterable[str],
+    max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+    max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
+    include_generated: bool = False,
+    only: Optional[Collection[str]] = None,
+) -> Iterator[FileDiff]:
+    """Parse a git-format diff into one ``FileDiff`` per file, streaming.
+
+    Every line is counted, but hunk text is only kept up to
+    ``max_file_bytes`` per file and ``max_total_bytes`` overall; files cut
+    short are marked ``truncated``, and files past the total budget keep
+    their counts and hunk ranges without text and are marked ``omitted``.
+    Hunks of generated files are dropped unless ``include_generated``.
+    With ``only``, files with neither path in it are skipped without using
+    any of the budget.
+    """
+    current: Optional[FileDiff] = None
+    hunk: Optional[Dict[str, Any]] = None
+    total = 0
+
+    for line in lines:
+        if line.startswith("diff --git "):
+            if current is not None:
+                total += current.bytes
+                yield current
+            old_path, path = _split_git_header(line)
+            hunk = None
+            if only is not None and old_path not in only and path not in only:
+                current = None
+                continue
+            current = FileDiff(old_path, path)
+            current.omitted = total >= max_total_bytes or (
+                current.generated and not include_generated
+            )
+            continue
+        if current is None:
+            continue
+
+        if hunk is None:
+            # File header lines, before the first hunk
+            if line.startswith("new file mode"):
+                current.status = "added"
+            elif line.startswith("deleted file mode"):
+                current.status = "deleted"
+            elif line.startswith("rename from "):
+                current.status = "renamed"
+                current.old_path = unquote_path(line[len("rename from ") :])
+            elif line.startswith("rename to "):
+                current.path = unquote_path(line[len("rename to ") :])
+            elif line.startswith("copy from "):
+                current.status = "copied"
+                current.old_path = unquote_path(line[len("copy from ") :])
+            elif line.startswith("copy to "):
+                current.path = unquote_path(line[len("copy to ") :])
+            elif line.startswith("Binary files ") or line == "GIT binary patch":
+                current.binary = True
+            elif line.startswith("+++ ") and line != "+++ /dev/null":
+                current.path = _strip_prefix(line[4:])
+            elif line.startswith("--- ") and line != "--- /dev/null":
+                current.old_path = _strip_prefix(line[4:])
+        if line.startswith("@@"):
+            match = _HUNK_HEADER.match(line)
+            if match is None:
+                continue
+            old_start, old_lines, new_start, new_lines, section = match.groups()
+            hunk = {
+                "header": line,
+                "old_start": int(old_start),
+                "old_lines": int(old_lines) if old_lines is not None else 1,
+                "new_start": int(new_start),
+                "new_lines": int(new_lines) if new_lines is not None else 1,
+                "section": section,
+                "lines": [],
+            }
+            current.hunks.append(hunk)
+            continue
+        if hunk is None or line[:1] not in ("+", "-", " ", "\\"):
+            continue
+
+        if line.startswith("+"):
+            current.additions += 1
+        elif line.startswith("-"):
+            current.deletions += 1
+        if current.omitted or current.truncated:
+            continue
+        size = len(line) + 1
+        if (
+            current.bytes + size > max_file_bytes
+            or total + current.bytes + size > max_total_bytes
+        ):
+            current.truncated = True
+            continue
+        hunk["lines"].append(line)
+        current.bytes += size
+
+    if current is not None:
+        yield current
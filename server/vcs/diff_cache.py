@@ -0,0 +1,225 @@
+import hashlib
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from ..process import launcher
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024  # diff text kept in memory
+DEFAULT_MAX_ENTRY_BYTES = 4 * 1024 * 1024  # larger diffs aren't cached
+
+# Files modified this recently may change again within the same mtime tick
+# without their size changing, so their diffs aren't cached (git's "racy"
+# check)
+RACY_SECONDS = 2
+
+# Index blob lookups remembered per index file state
+MAX_OID_LOOKUPS = 4096
+
+# (path, mode, blob id, stage) of each index entry a path matches
+IndexEntries = Tuple[Tuple[str, str, str, str], ...]
+
+
+def _stat_key(path: str) -> Optional[Tuple[int, ...]]:
+    # Not following symlinks: a link's diff is its target path. The mode and
+    # ctime catch chmod, which leaves mtime and size alone.
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return None
+    return (
+        info.st_mtime_ns,
+        info.st_ctime_ns,
+        info.st_size,
+        info.st_ino,
+        info.st_mode,
+    )
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def read_head(git_dir: str) -> Optional[str]:
+    """The commit HEAD points at, read from the git directory without git."""
+    head = _read(os.path.join(git_dir, "HEAD"))
+    if not head or not head.startswith("ref: "):
+        return head
+    ref = head[len("ref: ") :]
+    common = _read(os.path.join(git_dir, "commondir"))
+    common_dir = os.path.normpath(os.path.join(git_dir, common)) if common else git_dir
+    for base in (git_dir, common_dir):
+        commit = _read(os.path.join(base, ref))
+        if commit:
+            return commit
+    packed = _read(os.path.join(common_dir, "packed-refs")) or ""
+    for line in packed.splitlines():
+        if line.endswith(" " + ref):
+            return line.split(" ", 1)[0]
+    # A branch without commits yet
+    return None
+
+
+class DiffCache:
+    """LRU cache of single-file diffs.
+
+    An entry's key combines the file's index entry (mode, blob id and stage)
+    with either the worktree file's (mtime, ctime, size, inode, mode), for
+    unstaged diffs, or the HEAD commit, for staged ones. Any edit, staging
+    or commit therefore makes the old entry miss. Index entries are looked
+    up with ``git ls-files`` and remembered until the index file itself
+    changes, so repeated requests for an unchanged file don't start any
+    process. Entries are evicted least recently used first once
+    ``max_bytes`` of diff text is held.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_entry_bytes: int = DEFAULT_MAX_ENTRY_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._entries_by_path: Dict[Tuple, IndexEntries] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncacheable = 0
+
+    def key(
+        self,
+        directory: str,
+        git_dir: str,
+        path: str,
+        staged: bool,
+        variant: str = "",
+    ) -> Optional[str]:
+        """Cache key for one file's diff, or None if it can't be cached safely.
+
+        ``path`` is relative to ``directory``, as git diff takes it there;
+        ``variant`` tells apart diffs of the same file made with other options.
+        Only single files have a key: directories and pathspecs matching
+        several files would need every file's state in it.
+        """
+        stat_key = _stat_key(os.path.join(directory, path))
+        if stat_key is not None and not (
+            stat.S_ISREG(stat_key[-1]) or stat.S_ISLNK(stat_key[-1])
+        ):
+            return None
+        index_stat = _stat_key(os.path.join(git_dir, "index"))
+        entries = self._index_entries(directory, path, index_stat)
+        if len(entries) > 1 or (
+            entries and entries[0][0] != os.path.normpath(path)
+        ):
+            # A pathspec or glob, or a conflicted file with several stages
+            return None
+        if stat_key is None and not entries:
+            # Neither on disk nor in the index: not a plain file path
+            return None
+        index_entry = "\0".join(entries[0][1:]) if entries else "untracked"
+        if staged:
+            state = read_head(git_dir)
+            if state is None:
+                return None
+        else:
+            if (
+                stat_key is not None
+                and time.time() - max(stat_key[0], stat_key[1]) / 1e9 < RACY_SECONDS
+            ):
+                return None
+            state = repr(stat_key)
+        material = "\0".join(
+            [
+                directory,
+                path,
+                "staged" if staged else "worktree",
+                index_entry,
+                state,
+                variant,
+            ]
+        )
+        return hashlib.sha1(material.encode("utf-8", "surrogateescape")).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            self.uncacheable += 1
+            return None
+        with self._lock:
+            diff = self._entries.get(key)
+            if diff is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return diff
+
+    def put(self, key: Optional[str], diff: str) -> bool:
+        if key is None or len(diff) > self.max_entry_bytes:
+            return False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = diff
+            self._bytes += len(diff)
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+        return True
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._entries_by_path.clear()
+            self._bytes = 0
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entry_bytes": self.max_entry_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "uncacheable": self.uncacheable,
+            }
+
+    def _index_entries(
+        self, directory: str, path: str, index_stat
+    ) -> IndexEntries:
+        """(path, mode, blob id, stage) of each index entry ``path`` matches."""
+        lookup = (directory, path, index_stat)
+        with self._lock:
+            if lookup in self._entries_by_path:
+                return self._entries_by_path[lookup]
+        # "<mode> <oid> <stage>\t<path>"; untracked files have no entry
+        result = launcher.run(
+            ["git", "ls-files", "-s", "-z", "--", path], cwd=directory
+        )
+        entries: IndexEntries = ()
+        if result.returncode == 0:
+            for line in result.stdout.split("\0"):
+                if "\t" in line:
+                    info, entry_path = line.split("\t", 1)
+                    mode, oid, stage = info.split(" ", 2)
+                    entries += ((entry_path, mode, oid, stage),)
+        with self._lock:
+            if len(self._entries_by_path) >= MAX_OID_LOOKUPS:
+                self._entries_by_path.clear()
+            self._entries_by_path[lookup] = entries
+        return entries
@@ -0,0 +1,289 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from ..process import launcher
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional; entries then expire by TTL alone
+    FileSystemEventHandler = object
+    Observer = None
+
+GIT = "git"
+SAPLING = "sl"
+
+DEFAULT_TTL = 300  # seconds before repository metadata is looked up again
+DEFAULT_NEGATIVE_TTL = 5  # seconds a "not a repository" answer is kept
+DEFAULT_MAX_ENTRIES = 256  # directories cached
+DEFAULT_MAX_WATCHES = 64  # control directories watched at once
+
+# Files in a control directory whose changes can alter the cached metadata.
+# Index and lock files change on almost every command and are ignored.
+CONTROL_FILES = {
+    "HEAD",
+    "config",
+    "packed-refs",
+    "commondir",
+    "gitdir",
+    "hgrc",
+    "requires",
+    "sharedpath",
+}
+
+WRITE_EVENTS = {"created", "modified", "deleted", "moved"}
+
+
+class RepoInfo:
+    """Version control metadata for one directory."""
+
+    def __init__(
+        self,
+        directory: str,
+        kind: Optional[str] = None,
+        root: Optional[str] = None,
+        control_dir: Optional[str] = None,
+        default_branch: Optional[str] = None,
+    ):
+        self.directory = directory
+        self.kind = kind
+        self.root = root
+        self.control_dir = control_dir
+        self.default_branch = default_branch
+        self.checked_at = time.time()
+
+    @property
+    def is_git(self) -> bool:
+        return self.kind == GIT
+
+    @property
+    def is_sl(self) -> bool:
+        return self.kind == SAPLING
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "kind": self.kind,
+            "root": self.root,
+            "control_dir": self.control_dir,
+            "default_branch": self.default_branch,
+            "checked_at": self.checked_at,
+        }
+
+
+def detect_vcs_command() -> str:
+    """``sl`` if Sapling is installed, otherwise ``git``."""
+    try:
+        if launcher.run([SAPLING, "--version"]).returncode == 0:
+            return SAPLING
+    except FileNotFoundError:
+        pass
+    return GIT
+
+
+def _git_info(directory: str) -> RepoInfo:
+    result = launcher.run(
+        [
+            GIT,
+            "rev-parse",
+            "--is-inside-work-tree",
+            "--show-toplevel",
+            "--absolute-git-dir",
+        ],
+        cwd=directory,
+    )
+    lines = result.stdout.splitlines()
+    if result.returncode != 0 or len(lines) != 3 or lines[0] != "true":
+        return RepoInfo(directory)
+    root, git_dir = lines[1], lines[2]
+
+    # The remote's default branch, falling back to the local convention
+    branch = launcher.run(
+        [GIT, "symbolic-ref", "--short", "-q", "refs/remotes/origin/HEAD"],
+        cwd=directory,
+    )
+    default_branch = branch.stdout.strip().split("/", 1)[-1] or None
+    if default_branch is None:
+        config = launcher.run([GIT, "config", "init.defaultBranch"], cwd=directory)
+        default_branch = config.stdout.strip() or "main"
+    return RepoInfo(directory, GIT, root, git_dir, default_branch)
+
+
+def _sl_info(directory: str) -> RepoInfo:
+    result = launcher.run([SAPLING, "root"], cwd=directory)
+    root = result.stdout.strip()
+    if result.returncode != 0 or not root:
+        return RepoInfo(directory)
+    control_dir = next(
+        (
+            os.path.join(root, name)
+            for name in (".sl", ".hg", ".git")
+            if os.path.isdir(os.path.join(root, name))
+        ),
+        None,
+    )
+    config = launcher.run(
+        [SAPLING, "config", "remotenames.selectivepulldefault"], cwd=directory
+    )
+    default_branch = config.stdout.strip() or "main"
+    return RepoInfo(directory, SAPLING, root, control_dir, default_branch)
+
+
+class _ControlDirHandler(FileSystemEventHandler):
+    def __init__(self, cache: "RepoCache", control_dir: str):
+        self.cache = cache
+        self.control_dir = control_dir
+
+    def on_any_event(self, event):
+        # Git reads HEAD and config on every command; only writes matter
+        if event.event_type not in WRITE_EVENTS:
+            return
+        if event.src_path == self.control_dir:
+            # The directory itself is "modified" whenever a file in it is
+            # created; only its removal matters
+            if event.event_type in ("deleted", "moved"):
+                self.cache.invalidate_control_dir(self.control_dir)
+            return
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            if path and os.path.basename(path) in CONTROL_FILES:
+                self.cache.invalidate_control_dir(self.control_dir)
+                return
+
+
+class RepoCache:
+    """Caches which VCS a directory uses, its root, control dir and default branch.
+
+    Without it, every git endpoint spawns ``sl --version`` and then
+    ``git rev-parse`` or ``sl root`` before doing any real work. Entries
+    are keyed by directory and expire after ``ttl`` seconds. With watchdog
+    installed, each repository's control directory (``.git``, ``.sl``) is
+    also watched, and entries are dropped as soon as HEAD, the config or
+    the directory itself changes. Directories that aren't repositories are
+    only remembered for ``negative_ttl`` seconds, so a fresh ``git init``
+    is picked up quickly.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_watches: int = DEFAULT_MAX_WATCHES,
+        watch: bool = True,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_watches = max_watches
+        self._entries: "OrderedDict[str, RepoInfo]" = OrderedDict()
+        # control dir -> watchdog watch, least recently used first
+        self._watches: "OrderedDict[str, Any]" = OrderedDict()
+        self._observer = None
+        self._watch = watch and Observer is not None
+        self._command: Optional[str] = None
+        self._command_checked = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def vcs_command(self) -> str:
+        """The VCS command line tool to use, checked at most once per TTL."""
+        now = time.time()
+        if self._command is None or now - self._command_checked > self.ttl:
+            self._command = detect_vcs_command()
+            self._command_checked = now
+        return self._command
+
+    def get(self, directory: str) -> RepoInfo:
+        """Metadata for ``directory``, looking it up on a miss.
+
+        Raises OSError if the directory doesn't exist.
+        """
+        key = os.path.realpath(directory)
+        now = time.time()
+        with self._lock:
+            info = self._entries.get(key)
+            if info is not None:
+                ttl = self.ttl if info.kind else self.negative_ttl
+                if now - info.checked_at <= ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return info
+                del self._entries[key]
+            self.misses += 1
+
+        command = self.vcs_command()
+        info = _git_info(key) if command == GIT else _sl_info(key)
+        with self._lock:
+            self._entries[key] = info
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if info.control_dir:
+                self._watch_locked(info.control_dir)
+        return info
+
+    def invalidate(self, directory: Optional[str] = None) -> int:
+        """Forget one directory, or everything; returns entries dropped."""
+        with self._lock:
+            if directory is None:
+                count = len(self._entries)
+                self._entries.clear()
+                self._command = None
+            else:
+                count = int(
+                    self._entries.pop(os.path.realpath(directory), None) is not None
+                )
+            self.invalidations += count
+            return count
+
+    def invalidate_control_dir(self, control_dir: str):
+        """Forget every directory of the repository using ``control_dir``."""
+        with self._lock:
+            for key, info in list(self._entries.items()):
+                if info.control_dir == control_dir:
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = [info.to_dict() for info in self._entries.values()]
+            watched = list(self._watches)
+        return {
+            "command": self._command,
+            "entries": entries,
+            "watched": watched,
+            "watching": self._watch,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    def _watch_locked(self, control_dir: str):
+        if not self._watch:
+            return
+        if control_dir in self._watches:
+            self._watches.move_to_end(control_dir)
+            return
+        try:
+            if self._observer is None:
+                self._observer = Observer()
+                self._observer.daemon = True
+                self._observer.start()
+            self._watches[control_dir] = self._observer.schedule(
+                _ControlDirHandler(self, control_dir), control_dir, recursive=False
+            )
+        except OSError as e:
+            # Out of inotify watches, for example; the TTL still applies
+            print(f"Could not watch {control_dir}: {e}")
+            return
+        while len(self._watches) > self.max_watches:
+            _, watch = self._watches.popitem(last=False)
+            try:
+                self._observer.unschedule(watch)
+            except (KeyError, OSError):
+                pass
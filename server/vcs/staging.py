@@ -0,0 +1,103 @@
+import os
+import re
+from typing import Dict, List, Optional
+
+from ..process import launcher
+from .repo_cache import GIT
+
+_IGNORED_HEADER = "The following paths are ignored by one of your .gitignore files:"
+# "fatal: pathspec 'x' did not match any files", "fatal: 'x' is outside ..."
+_PATH_ERROR = re.compile(r"^(?:fatal|error|warning): (?:pathspec )?'(.*?)' (.*)$")
+_NO_MATCH = "did not match any files"
+
+
+class StageError(Exception):
+    """Staging failed for a reason other than particular files."""
+
+
+def stage_files(
+    directory: str, command: str, files: Optional[List[str]] = None
+) -> List[Dict[str, str]]:
+    """Stage ``files``, or every change, with a single VCS invocation.
+
+    git reads the paths NUL-separated from stdin, so any number of files
+    costs one process and one index lock. sl has no index; its
+    ``addremove`` marks new files added and missing files removed, and
+    takes the paths as arguments. Returns ``{"path", "error"}`` for each
+    file that couldn't be staged, and raises StageError if staging failed
+    for another reason.
+    """
+    if command == GIT:
+        if not files:
+            result = launcher.run([GIT, "add", "-A"], cwd=directory)
+        else:
+            result = launcher.run(
+                [GIT, "add", "--pathspec-from-file=-", "--pathspec-file-nul"],
+                cwd=directory,
+                input="\0".join(files),
+            )
+    else:
+        result = launcher.run(
+            [command, "addremove", *(["--", *files] if files else [])], cwd=directory
+        )
+    if result.returncode == 0:
+        return []
+
+    errors = []
+    if files:
+        if command == GIT:
+            errors = _git_file_errors(directory, files, result.stderr)
+        else:
+            errors = _sl_file_errors(files, result.stderr)
+    if not errors:
+        details = result.stderr.strip()
+        raise StageError(details or f"{command} exited {result.returncode}")
+    return errors
+
+
+def _git_file_errors(
+    directory: str, files: List[str], stderr: str
+) -> List[Dict[str, str]]:
+    errors: Dict[str, str] = {}
+    lines = iter(stderr.splitlines())
+    for line in lines:
+        if line == _IGNORED_HEADER:
+            # The ignored paths follow one per line, then hints; the other
+            # files were still staged
+            for path in lines:
+                if path.startswith("hint:") or path.startswith("Use -f"):
+                    break
+                errors[path] = "ignored by .gitignore"
+            continue
+        match = _PATH_ERROR.match(line)
+        if match:
+            errors[match.group(1)] = match.group(2)
+
+    if any(error == _NO_MATCH for error in errors.values()):
+        # git stops at the first unmatched path, and nothing is staged; find
+        # the others at once: missing from disk and not tracked either
+        missing = [
+            path
+            for path in files
+            if path not in errors and not os.path.lexists(os.path.join(directory, path))
+        ]
+        if missing:
+            result = launcher.run(
+                [GIT, "ls-files", "-z", "--", *missing], cwd=directory
+            )
+            tracked = {os.path.normpath(path) for path in result.stdout.split("\0")}
+            for path in missing:
+                if os.path.normpath(path) not in tracked:
+                    errors[path] = _NO_MATCH
+    return [{"path": path, "error": error} for path, error in sorted(errors.items())]
+
+
+def _sl_file_errors(files: List[str], stderr: str) -> List[Dict[str, str]]:
+    # "path: No such file or directory"
+    wanted = set(files)
+    errors = []
+    for line in stderr.splitlines():
+        path, _, error = line.partition(": ")
+        if path in wanted and error:
+            errors.append({"path": path, "error": error})
+    return errors
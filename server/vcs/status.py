@@ -0,0 +1,261 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..process import launcher
+
+READ_CHUNK_SIZE = 64 * 1024
+
+UNTRACKED_MODES = ("all", "normal", "no")
+IGNORED_MODES = ("no", "traditional", "matching")
+SUBMODULE_MODES = ("none", "untracked", "dirty", "all")
+
+# Options the status watcher runs with; requests asking for anything else
+# run git directly
+DEFAULT_STATUS_OPTIONS = {
+    "untracked": "normal",
+    "ignored": "no",
+    "renames": True,
+    "ignore_submodules": "none",
+}
+
+# Unmerged XY codes (both sides touched the path)
+UNMERGED = {"DD", "AU", "UD", "UA", "DU", "AA", "UU"}
+
+
+class StatusError(Exception):
+    """git status failed."""
+
+
+def status_type(status: str) -> str:
+    """Describe a two-letter porcelain status code for the app."""
+    if status == "??":
+        return "untracked"
+    elif status == "!!":
+        return "ignored"
+    elif status in UNMERGED:
+        return "conflicted"
+    elif status == "MM":
+        return "modified_staged_and_unstaged"
+    elif status[0] == "R":
+        return "renamed"
+    elif status[0] == "C":
+        return "copied"
+    elif status[0] == "M":
+        return "modified_staged"
+    elif status[1] == "M":
+        return "modified_unstaged"
+    elif status[0] == "A":
+        return "added"
+    elif status[0] == "D":
+        return "deleted"
+    elif status[1] == "D":
+        return "deleted_unstaged"
+    return "other"
+
+
+def status_entry(status: str, path: str, **extra) -> Dict[str, Any]:
+    return {
+        "status": status,
+        "status_type": status_type(status),
+        "path": path,
+        **extra,
+    }
+
+
+def iter_fields(stream, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """NUL-terminated fields from a binary stream, decoded as they arrive."""
+    buffer = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        *fields, buffer = buffer.split(b"\0")
+        for field in fields:
+            yield field.decode("utf-8", errors="replace")
+    if buffer:
+        yield buffer.decode("utf-8", errors="replace")
+
+
+def _submodule(state: str) -> Optional[Dict[str, bool]]:
+    # "N..." for ordinary files, "S<c><m><u>" for submodules
+    if not state.startswith("S"):
+        return None
+    return {
+        "commit_changed": state[1] == "C",
+        "modified": state[2] == "M",
+        "untracked": state[3] == "U",
+    }
+
+
+def parse_porcelain_v2(fields: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Entries from ``git status --porcelain=v2 -z`` output fields.
+
+    Status codes use a space for "unchanged", as in porcelain v1, so ``M.``
+    becomes ``"M "``. Renamed and copied entries carry ``orig_path`` and
+    the similarity ``score``; submodules carry their ``submodule`` state.
+    """
+    fields = iter(fields)
+    for field in fields:
+        if not field or field[0] == "#":
+            continue
+        kind = field[0]
+        if kind in "?!":
+            yield status_entry(kind * 2, field[2:])
+            continue
+
+        if kind == "1":
+            parts = field.split(" ", 8)
+            extra = {}
+        elif kind == "2":
+            parts = field.split(" ", 9)
+            score = parts[8]
+            extra = {
+                "orig_path": next(fields, ""),
+                "score": int(score[1:]) if score[1:].isdigit() else None,
+            }
+        elif kind == "u":
+            parts = field.split(" ", 10)
+            extra = {}
+        else:
+            continue
+        submodule = _submodule(parts[2])
+        if submodule:
+            extra["submodule"] = submodule
+        yield status_entry(parts[1].replace(".", " "), parts[-1], **extra)
+
+
+def status_args(
+    untracked: str = "normal",
+    ignored: str = "no",
+    renames: bool = True,
+    ignore_submodules: str = "none",
+) -> List[str]:
+    """``git status`` command line for machine-readable output.
+
+    Uses ``--no-optional-locks`` so that reading the status never rewrites
+    the index.
+    """
+    return [
+        "git",
+        "--no-optional-locks",
+        "status",
+        "--porcelain=v2",
+        "-z",
+        f"--untracked-files={untracked}",
+        f"--ignored={ignored}",
+        "--renames" if renames else "--no-renames",
+        f"--ignore-submodules={ignore_submodules}",
+    ]
+
+
+def status_options(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Validated status options from a request body."""
+    options = dict(DEFAULT_STATUS_OPTIONS)
+    for key, modes in (
+        ("untracked", UNTRACKED_MODES),
+        ("ignored", IGNORED_MODES),
+        ("ignore_submodules", SUBMODULE_MODES),
+    ):
+        value = data.get(key)
+        if value is not None:
+            if value not in modes:
+                raise ValueError(f"{key} must be one of: {', '.join(modes)}")
+            options[key] = value
+    if data.get("renames") is not None:
+        options["renames"] = bool(data["renames"])
+    return options
+
+
+def iter_status(
+    root: str, paths: Optional[List[str]] = None, **options
+) -> Iterator[Dict[str, Any]]:
+    """Stream status entries while git is still writing them.
+
+    Only paths under ``paths`` are checked when it is given. Raises
+    StatusError if git fails; closing the generator early stops git.
+    """
+    args = status_args(**options)
+    if paths is not None:
+        args += ["--", *(f":(literal){path}" for path in paths)]
+    process = launcher.spawn(args, cwd=root, text=False)
+    finished = False
+    try:
+        yield from parse_porcelain_v2(iter_fields(process.stdout))
+        finished = True
+    finally:
+        if not finished and process.poll() is None:
+            process.kill()
+        stderr = process.stderr.read()
+        process.stdout.close()
+        process.stderr.close()
+        returncode = launcher.wait(process)
+    if returncode != 0:
+        raise StatusError(stderr.decode("utf-8", errors="replace").strip())
+
+
+def porcelain_status(
+    root: str, paths: Optional[List[str]] = None
+) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Status entries by path, for every changed path or those under ``paths``.
+
+    Returns None if git fails.
+    """
+    try:
+        return {entry["path"]: entry for entry in iter_status(root, paths)}
+    except (StatusError, OSError):
+        return None
+
+
+def git_order(entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sort entries like git does: tracked paths, then untracked, then ignored."""
+    rank = {"??": 1, "!!": 2}
+    return sorted(entries, key=lambda e: (rank.get(e["status"], 0), e["path"]))
+
+
+def parse_cursor(cursor: Optional[str]) -> Tuple[Optional[int], int]:
+    """Split a page cursor into (version, offset)."""
+    if not cursor:
+        return None, 0
+    version, _, offset = str(cursor).rpartition(".")
+    try:
+        return (int(version) if version else None), max(0, int(offset))
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def paginate(
+    entries: Iterable[Dict[str, Any]],
+    offset: int,
+    limit: int,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """One page of entries, plus the total count, without keeping the rest."""
+    page = []
+    total = 0
+    for entry in entries:
+        if offset <= total < offset + limit:
+            page.append(entry)
+        total += 1
+    return page, total
+
+
+def group_by_directory(
+    entries: Iterable[Dict[str, Any]], depth: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Counts of changed paths per directory, by status type.
+
+    With ``depth``, directories are cut to their first ``depth`` components,
+    so ``depth=1`` summarizes by top-level directory.
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        parts = entry["path"].rstrip("/").split("/")[:-1]
+        if depth is not None:
+            parts = parts[:depth]
+        directory = "/".join(parts) or "."
+        group = groups.setdefault(
+            directory, {"directory": directory, "count": 0, "types": {}}
+        )
+        group["count"] += 1
+        types = group["types"]
+        types[entry["status_type"]] = types.get(entry["status_type"], 0) + 1
+    return [groups[directory] for directory in sorted(groups)]
@@ -0,0 +1,526 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..process import launcher
+from .status import StatusError, iter_status, porcelain_status
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # without watchdog, /git/status runs git every time
+    FileSystemEventHandler = object
+    Observer = None
+
+DEBOUNCE_SECONDS = 0.1  # quiet time before a burst of edits is refreshed
+MAX_PARTIAL_PATHS = 256  # above this, the whole status is refreshed
+HISTORY_SIZE = 256  # changes kept for clients catching up from a version
+
+DEFAULT_MAX_WATCHERS = 8
+DEFAULT_IDLE_TIMEOUT = 600  # seconds a watcher may go unused
+# Seconds before a repo whose watcher failed to start (usually out of
+# inotify watches) is tried again; until then it is read with git directly
+FAILED_RETRY_INTERVAL = 600
+GC_INTERVAL = 60
+
+# Watches scheduled to skip ignored directories; each takes an inotify
+# instance (128 per user by default), so trees needing more are watched
+# recursively from the root with events under ignored paths dropped
+MAX_WATCHES = 32
+
+# Files in .git whose changes can alter the status of any path
+FULL_REFRESH_FILES = {"index", "HEAD", "packed-refs", "exclude"}
+
+# Files in .git written by every command that changes what is staged or
+# checked out; compared to catch up on writes the watcher hasn't seen yet
+SYNC_FILES = ("index", "HEAD")
+
+
+def _control_state(git_dir: str):
+    state = []
+    for name in SYNC_FILES:
+        try:
+            stat = os.stat(os.path.join(git_dir, name))
+            state.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        except OSError:
+            state.append(None)
+    return tuple(state)
+
+
+def ignored_directories(root: str) -> Set[str]:
+    """Directories matching an ignore rule, relative to ``root``."""
+    try:
+        return {
+            entry["path"].rstrip("/")
+            for entry in iter_status(root, untracked="normal", ignored="matching")
+            if entry["status"] == "!!" and entry["path"].endswith("/")
+        }
+    except (StatusError, OSError):
+        return set()
+
+
+def watch_plan(root: str, skipped: Set[str]) -> Optional[List[Tuple[str, bool]]]:
+    """``(directory, recursive)`` watches covering ``root`` except ``skipped``.
+
+    Directories above a skipped one are watched without recursion and their
+    other subdirectories recursively. Returns None if that would take more
+    than ``MAX_WATCHES`` watches.
+    """
+    above = set()
+    for path in skipped:
+        parts = path.split("/")
+        above.update("/".join(parts[:i]) for i in range(len(parts)))
+    plan = []
+    for rel in sorted(above):
+        directory = os.path.join(root, rel) if rel else root
+        plan.append((directory, False))
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            child = f"{rel}/{entry.name}" if rel else entry.name
+            if (
+                entry.is_dir(follow_symlinks=False)
+                and child not in skipped
+                and child not in above
+            ):
+                plan.append((entry.path, True))
+        if len(plan) > MAX_WATCHES:
+            return None
+    return plan
+
+
+class StatusWatcher:
+    """Keeps the ``git status`` of one repository up to date.
+
+    The working tree is watched with watchdog, leaving out ignored
+    directories such as ``node_modules`` and the git directory's objects
+    where that fits in ``MAX_WATCHES`` watches. Edited paths are collected
+    and, after ``DEBOUNCE_SECONDS`` of quiet, only those paths are
+    re-checked with a pathspec-limited ``git status``. Changes to the index,
+    HEAD, refs or ignore rules trigger a full refresh instead.
+
+    Every refresh that changes a status bumps ``version``, and the change is
+    kept in a short history so clients can catch up from the version they
+    last saw.
+    """
+
+    def __init__(self, root: str, git_dir: Optional[str] = None):
+        self.root = root
+        self.git_dir = git_dir or os.path.join(root, ".git")
+        # Status entries of changed paths, by path
+        self.statuses: Dict[str, Dict[str, Any]] = {}
+        self.version = 0
+        self.refreshes = 0
+        self.full_refreshes = 0
+        self.last_used = time.time()
+        self.error: Optional[str] = None
+        self._history: deque = deque(maxlen=HISTORY_SIZE)
+        self._pending: Set[str] = set()
+        self._full = True
+        self._stopped = False
+        self._ready = threading.Event()
+        self._cond = threading.Condition()
+        # Serializes refreshes from the refresh thread and from sync()
+        self._refresh_lock = threading.Lock()
+        # Index and HEAD as they were when the last full refresh started
+        self._synced_state = None
+        self._observer = None
+        self._handler = _TreeHandler(self)
+        # Ignored directories, as "path/" prefixes relative to the root
+        self._ignored: Tuple[str, ...] = ()
+        # Directories watched without recursion
+        self._shallow: Set[str] = set()
+
+    def start(self):
+        """Start watching; raises OSError if the tree can't be watched."""
+        ignored = ignored_directories(self.root)
+        self._ignored = tuple(path + "/" for path in sorted(ignored))
+        plan = watch_plan(self.root, ignored | {".git"})
+        whole_tree = plan is None
+        if whole_tree:
+            plan = [(self.root, True)]
+        observer = Observer()
+        observer.daemon = True
+        for directory, recursive in plan:
+            observer.schedule(self._handler, directory, recursive=recursive)
+            if not recursive:
+                self._shallow.add(directory)
+        if not whole_tree:
+            # Only what is read from the git directory, not its objects
+            observer.schedule(self._handler, self.git_dir, recursive=False)
+            refs = os.path.join(self.git_dir, "refs")
+            if os.path.isdir(refs):
+                observer.schedule(self._handler, refs, recursive=True)
+        self._observer = observer
+        try:
+            # Adds the inotify watches, which can run out
+            observer.start()
+        except OSError:
+            self._observer = None
+            observer.stop()
+            raise
+        threading.Thread(target=self._refresh_loop, daemon=True).start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Wait for the first full status to be loaded."""
+        return self._ready.wait(timeout)
+
+    def sync(self, force: bool = False):
+        """Refresh now if the index or HEAD changed since the last full refresh.
+
+        The watcher hears of writes only after the debounce, so a status read
+        right after a commit or reset would otherwise still show the old
+        state. ``force`` refreshes regardless, e.g. after a checkout that
+        only touched the working tree.
+        """
+        with self._refresh_lock:
+            if not force and _control_state(self.git_dir) == self._synced_state:
+                return
+            try:
+                self._refresh(None)
+            except Exception as e:
+                self.error = str(e)
+                print(f"Status watcher error in {self.root}: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            self.last_used = time.time()
+            return {"version": self.version, "statuses": dict(self.statuses)}
+
+    def changes(self, since: int) -> Dict[str, Any]:
+        """Statuses changed after version ``since``.
+
+        ``reset`` is set, with every status in ``updated``, when ``since``
+        is too old to catch up from the history or from another server run.
+        """
+        with self._cond:
+            self.last_used = time.time()
+            oldest = self._history[0]["version"] if self._history else 1
+            if since > self.version or (since < self.version and since + 1 < oldest):
+                return {
+                    "version": self.version,
+                    "reset": True,
+                    "updated": dict(self.statuses),
+                    "removed": [],
+                }
+            updated: Dict[str, Dict[str, Any]] = {}
+            removed: Set[str] = set()
+            for change in self._history:
+                if change["version"] <= since:
+                    continue
+                for path, entry in change["updated"].items():
+                    updated[path] = entry
+                    removed.discard(path)
+                for path in change["removed"]:
+                    updated.pop(path, None)
+                    removed.add(path)
+            return {
+                "version": self.version,
+                "reset": False,
+                "updated": updated,
+                "removed": sorted(removed),
+            }
+
+    def wait(self, since: int, timeout: float) -> bool:
+        """Block until the version passes ``since``; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.version != since or self._stopped, timeout=timeout
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "root": self.root,
+                "version": self.version,
+                "changed_paths": len(self.statuses),
+                "ignored_directories": len(self._ignored),
+                "shallow_watches": len(self._shallow),
+                "pending": len(self._pending),
+                "refreshes": self.refreshes,
+                "full_refreshes": self.full_refreshes,
+                "idle": time.time() - self.last_used,
+                "error": self.error,
+            }
+
+    def mark(self, path: str):
+        """Record a changed absolute path from the file watcher."""
+        git_rel = os.path.relpath(path, self.git_dir)
+        if not git_rel.startswith(".."):
+            # A linked worktree's git directory is outside its root
+            rel = os.path.join(".git", git_rel)
+        else:
+            rel = os.path.relpath(path, self.root)
+        if rel == "." or rel.startswith(".."):
+            return
+        parts = rel.split(os.sep)
+        if parts[0] == ".git":
+            name = os.path.basename(path)
+            if name not in FULL_REFRESH_FILES and "refs" not in parts:
+                return
+            full = True
+        elif ("/".join(parts) + "/").startswith(self._ignored):
+            return
+        else:
+            full = parts[-1] == ".gitignore"
+        with self._cond:
+            if full:
+                self._full = True
+            else:
+                self._pending.add("/".join(parts))
+            self._cond.notify_all()
+
+    def watch_directory(self, path: str):
+        """Watch a directory created where only direct children are watched."""
+        rel = os.path.relpath(path, self.root)
+        if os.path.dirname(path) not in self._shallow or rel.startswith(".."):
+            return
+        if self._observer is None:
+            return
+        ignored = launcher.run(
+            ["git", "check-ignore", "-q", "--", rel], cwd=self.root
+        ).returncode == 0
+        if ignored:
+            self._ignored += ("/".join(rel.split(os.sep)) + "/",)
+            return
+        try:
+            self._observer.schedule(self._handler, path, recursive=True)
+        except OSError as e:
+            print(f"Status watcher could not watch {path}: {e}")
+
+    def _refresh_loop(self):
+        while True:
+            with self._cond:
+                while not (self._full or self._pending or self._stopped):
+                    self._cond.wait()
+                if self._stopped:
+                    return
+            # Let a burst of writes settle into one refresh
+            time.sleep(DEBOUNCE_SECONDS)
+            with self._cond:
+                full = self._full or len(self._pending) > MAX_PARTIAL_PATHS
+                paths = sorted(self._pending)
+                self._full = False
+                self._pending.clear()
+            try:
+                with self._refresh_lock:
+                    self._refresh(None if full else paths)
+            except Exception as e:
+                self.error = str(e)
+                print(f"Status watcher error in {self.root}: {e}")
+            finally:
+                self._ready.set()
+
+    def _refresh(self, paths: Optional[List[str]]):
+        # git collapses an untracked directory into one "dir/" entry, but
+        # lists its files one by one when they are named in a pathspec, so
+        # only a full status is consistent around untracked paths
+        untracked_dirs = tuple(
+            path
+            for path, entry in self.statuses.items()
+            if entry["status"] == "??" and path.endswith("/")
+        )
+        if paths is not None and any(p.startswith(untracked_dirs) for p in paths):
+            paths = None
+        if paths is None:
+            state = _control_state(self.git_dir)
+        statuses = porcelain_status(self.root, paths)
+        if statuses is None:
+            self.error = "git status failed"
+            return
+        if paths is not None and any(
+            entry["status"] == "??" for entry in statuses.values()
+        ):
+            self._refresh(None)
+            return
+        self.error = None
+        if paths is None:
+            self._synced_state = state
+
+        with self._cond:
+            self.refreshes += 1
+            if paths is None:
+                self.full_refreshes += 1
+                previous = self.statuses
+            else:
+                prefixes = tuple(path + "/" for path in paths)
+                covered = set(paths)
+                previous = {
+                    path: status
+                    for path, status in self.statuses.items()
+                    if path in covered or path.startswith(prefixes)
+                }
+            updated = {
+                path: status
+                for path, status in statuses.items()
+                if previous.get(path) != status
+            }
+            removed = [path for path in previous if path not in statuses]
+            if not updated and not removed:
+                return
+
+            for path in removed:
+                del self.statuses[path]
+            self.statuses.update(updated)
+            self.version += 1
+            self._history.append(
+                {"version": self.version, "updated": updated, "removed": removed}
+            )
+            self._cond.notify_all()
+
+
+class _TreeHandler(FileSystemEventHandler):
+    def __init__(self, watcher: StatusWatcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type not in ("created", "modified", "deleted", "moved"):
+            return
+        if event.is_directory and event.event_type == "modified":
+            # Reported for the parent of every created or deleted file
+            return
+        self.watcher.mark(event.src_path)
+        dest_path = getattr(event, "dest_path", "")
+        if dest_path:
+            self.watcher.mark(dest_path)
+        if event.is_directory and event.event_type in ("created", "moved"):
+            self.watcher.watch_directory(dest_path or event.src_path)
+
+
+class StatusWatchers:
+    """One ``StatusWatcher`` per repository, started on first use.
+
+    At most ``max_watchers`` repositories are watched; the least recently
+    used watcher is stopped to make room, and a janitor stops watchers
+    unused for ``idle_timeout`` seconds. A repository whose watcher fails
+    to start isn't tried again for ``FAILED_RETRY_INTERVAL`` seconds.
+    """
+
+    def __init__(
+        self,
+        max_watchers: int = DEFAULT_MAX_WATCHERS,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    ):
+        self.max_watchers = max_watchers
+        self.idle_timeout = idle_timeout
+        self._watchers: Dict[str, StatusWatcher] = {}
+        # root -> (time, error) of the last failed start
+        self._failures: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._janitor: Optional[threading.Thread] = None
+
+    @property
+    def available(self) -> bool:
+        return Observer is not None
+
+    def get(self, root: str, git_dir: Optional[str] = None) -> StatusWatcher:
+        """The watcher for a repository root, starting one if needed.
+
+        Raises OSError if the tree can't be watched, now or on a recent try.
+        """
+        root = os.path.realpath(root)
+        with self._lock:
+            watcher = self._watchers.get(root)
+            if watcher is not None:
+                watcher.last_used = time.time()
+                return watcher
+            failure = self._failures.get(root)
+            if failure and time.time() - failure[0] < FAILED_RETRY_INTERVAL:
+                raise OSError(failure[1])
+
+        # Setting up the recursive watch walks the whole tree; other repos'
+        # requests shouldn't wait for it
+        watcher = StatusWatcher(root, git_dir)
+        try:
+            watcher.start()
+        except OSError as e:
+            print(f"Could not watch {root}, using git status directly: {e}")
+            with self._lock:
+                self._failures[root] = (time.time(), str(e))
+            raise
+
+        duplicate = None
+        with self._lock:
+            existing = self._watchers.get(root)
+            if existing is not None:
+                # Another request started one meanwhile
+                duplicate, watcher = watcher, existing
+            else:
+                if len(self._watchers) >= self.max_watchers:
+                    oldest = min(self._watchers.values(), key=lambda w: w.last_used)
+                    self._stop_locked(oldest.root)
+                self._watchers[root] = watcher
+                self._failures.pop(root, None)
+                self._start_janitor_locked()
+            watcher.last_used = time.time()
+        if duplicate is not None:
+            duplicate.stop()
+        return watcher
+
+    def find(self, root: str) -> Optional[StatusWatcher]:
+        with self._lock:
+            return self._watchers.get(os.path.realpath(root))
+
+    def stop(self, root: str) -> bool:
+        with self._lock:
+            return self._stop_locked(os.path.realpath(root))
+
+    def gc(self) -> int:
+        """Stop watchers that have been idle too long."""
+        now = time.time()
+        with self._lock:
+            idle = [
+                root
+                for root, watcher in self._watchers.items()
+                if now - watcher.last_used > self.idle_timeout
+            ]
+            for root in idle:
+                self._stop_locked(root)
+        return len(idle)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            watchers = list(self._watchers.values())
+            failures = dict(self._failures)
+        return {
+            "available": self.available,
+            "max_watchers": self.max_watchers,
+            "idle_timeout": self.idle_timeout,
+            "watchers": [watcher.stats() for watcher in watchers],
+            "failed": {root: error for root, (_, error) in failures.items()},
+        }
+
+    def _stop_locked(self, root: str) -> bool:
+        watcher = self._watchers.pop(root, None)
+        if watcher is None:
+            return False
+        watcher.stop()
+        return True
+
+    def _start_janitor_locked(self):
+        if self._janitor is None:
+            self._janitor = threading.Thread(target=self._janitor_loop, daemon=True)
+            self._janitor.start()
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(GC_INTERVAL)
+            try:
+                self.gc()
+            except Exception as e:
+                print(f"Status watcher janitor error: {e}")
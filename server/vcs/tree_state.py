@@ -0,0 +1,52 @@
+import hashlib
+import os
+from typing import Optional
+
+from ..process import launcher
+from .worktrees import WorktreeError, changed_files
+
+# Dirty files larger than this are fingerprinted by size and mtime instead
+# of by content
+MAX_HASHED_FILE_BYTES = 1024 * 1024
+
+
+def tree_state(directory: str) -> Optional[str]:
+    """Fingerprint of a git checkout: HEAD plus the contents of dirty files.
+
+    Two calls return the same value only if HEAD is the same and every
+    modified or untracked file is unchanged. Returns None outside a git
+    checkout, or in a repository without commits.
+    """
+    try:
+        result = launcher.run(
+            ["git", "rev-parse", "--show-toplevel", "HEAD"], cwd=directory
+        )
+    except OSError:
+        return None
+    lines = result.stdout.splitlines()
+    if result.returncode != 0 or len(lines) != 2:
+        return None
+    root, head = lines
+
+    try:
+        files = changed_files(root)
+    except WorktreeError:
+        return None
+
+    digest = hashlib.sha256(head.encode("utf-8"))
+    for path in sorted(files):
+        digest.update(path.encode("utf-8", errors="surrogateescape") + b"\0")
+        full_path = os.path.join(root, path)
+        try:
+            stat = os.stat(full_path)
+            if stat.st_size > MAX_HASHED_FILE_BYTES:
+                digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+            else:
+                with open(full_path, "rb") as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+        except FileNotFoundError:
+            digest.update(b"deleted")
+        except OSError:
+            # Directories (e.g. submodules) and unreadable files
+            digest.update(b"unreadable")
+    return digest.hexdigest()
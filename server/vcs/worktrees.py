@@ -0,0 +1,408 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..process import launcher
+
+# Worktrees created for parallel runs live outside the user's checkouts
+WORKTREE_ROOT = Path.home() / ".claudecodego" / "worktrees"
+
+DEFAULT_POOL_SIZE = 2  # idle worktrees kept ready per registered repo
+DEFAULT_MAX_PER_REPO = 16  # worktrees, leased or idle, per repo
+DEFAULT_IDLE_TIMEOUT = 3600  # seconds before a spare idle worktree is removed
+GC_INTERVAL = 300  # seconds between janitor passes
+
+# Pool worktrees are named pool-<n> inside the repo's worktree directory
+POOL_PREFIX = "pool-"
+
+
+class WorktreeError(Exception):
+    """A git worktree command failed."""
+
+
+def _git(args: List[str], cwd: str, check: bool = True):
+    result = launcher.run(["git", *args], cwd=cwd)
+    if check and result.returncode != 0:
+        raise WorktreeError(
+            f"git {args[0]} failed: {(result.stderr or result.stdout).strip()}"
+        )
+    return result
+
+
+def repo_root(directory: str) -> Optional[str]:
+    """Top level of the git checkout containing ``directory``, if any."""
+    try:
+        result = _git(["rev-parse", "--show-toplevel"], directory, check=False)
+    except OSError:
+        return None
+    root = result.stdout.strip()
+    return os.path.realpath(root) if result.returncode == 0 and root else None
+
+
+def repo_worktree_dir(root: str, base: Path = WORKTREE_ROOT) -> Path:
+    """Directory holding the worktrees created for one repository."""
+    digest = hashlib.sha1(root.encode("utf-8")).hexdigest()[:8]
+    return base / f"{os.path.basename(root)}-{digest}"
+
+
+def remove_worktree(root: str, path: Path):
+    """Remove a worktree, even if it has uncommitted changes."""
+    result = _git(["worktree", "remove", "--force", str(path)], root, check=False)
+    if result.returncode != 0:
+        shutil.rmtree(path, ignore_errors=True)
+        _git(["worktree", "prune"], root, check=False)
+
+
+def delete_branch(root: str, branch: str):
+    _git(["branch", "-D", branch], root, check=False)
+
+
+def changed_files(directory: str) -> List[str]:
+    """Paths with staged, unstaged or untracked changes, relative to the repo root."""
+    result = _git(
+        ["status", "--porcelain", "-z", "--untracked-files=all"], directory
+    )
+    entries = result.stdout.split("\0")
+    files = []
+    i = 0
+    while i < len(entries):
+        entry = entries[i]
+        i += 1
+        if len(entry) < 4:
+            continue
+        files.append(entry[3:])
+        if entry[0] in "RC":
+            # Renames and copies are followed by the original path
+            i += 1
+    return files
+
+
+def file_states(root: str, paths: List[str]) -> Dict[str, Optional[Tuple[int, ...]]]:
+    """Stat identity of each path under ``root``, or None where it's missing.
+
+    Two snapshots differ for a path once it is edited, replaced, deleted or
+    has its mode changed.
+    """
+    states: Dict[str, Optional[Tuple[int, ...]]] = {}
+    for path in paths:
+        try:
+            info = os.lstat(os.path.join(root, path))
+        except OSError:
+            states[path] = None
+            continue
+        states[path] = (
+            info.st_mtime_ns,
+            info.st_ctime_ns,
+            info.st_size,
+            info.st_ino,
+            info.st_mode,
+        )
+    return states
+
+
+def commit_all(directory: str, message: str) -> str:
+    """Commit every change in a worktree and return the new commit's hash."""
+    _git(["add", "-A"], directory)
+    _git(["commit", "-q", "--no-verify", "-m", message], directory)
+    return _git(["rev-parse", "HEAD"], directory).stdout.strip()
+
+
+def head_commit(directory: str) -> str:
+    return _git(["rev-parse", "HEAD"], directory).stdout.strip()
+
+
+class Worktree:
+    """A pooled checkout of one repository."""
+
+    def __init__(self, root: str, path: Path):
+        self.root = root
+        self.path = path
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.leased = False
+        self.branch: Optional[str] = None
+        self.uses = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "leased": self.leased,
+            "branch": self.branch,
+            "uses": self.uses,
+            "idle": None if self.leased else time.time() - self.last_used,
+        }
+
+
+class WorktreePool:
+    """Pre-created git worktrees per repository, leased to parallel runs.
+
+    Registering a repository creates ``size`` worktrees in the background,
+    adopting any left from a previous server run. ``lease`` hands out an
+    idle worktree checked out at the repository's current HEAD, creating
+    one only if none is free; ``release`` resets it with ``checkout -f`` and
+    ``clean -fd``. Ignored files such as ``node_modules`` survive the reset,
+    which is most of what makes a fresh checkout slow. A janitor removes
+    spare worktrees that sit idle longer than ``idle_timeout``.
+    """
+
+    def __init__(
+        self,
+        base: Path = WORKTREE_ROOT,
+        size: int = DEFAULT_POOL_SIZE,
+        max_per_repo: int = DEFAULT_MAX_PER_REPO,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    ):
+        self.base = Path(base)
+        self.size = size
+        self.max_per_repo = max_per_repo
+        self.idle_timeout = idle_timeout
+        self._repos: Dict[str, List[Worktree]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._janitor: Optional[threading.Thread] = None
+        self.created = 0
+        self.reused = 0
+        self.removed = 0
+
+    def register(self, root: str, size: Optional[int] = None, wait: bool = False):
+        """Keep ``size`` idle worktrees ready for a repository."""
+        root = os.path.realpath(root)
+        with self._lock:
+            self._start_janitor_locked()
+            new = root not in self._repos
+            self._repos.setdefault(root, [])
+            self._sizes[root] = self.size if size is None else size
+        if new:
+            self._adopt(root)
+        if wait:
+            self._fill(root)
+        else:
+            threading.Thread(target=self._fill, args=(root,), daemon=True).start()
+
+    def registered(self, root: str) -> bool:
+        with self._lock:
+            return os.path.realpath(root) in self._sizes
+
+    def unregister(self, root: str) -> int:
+        """Stop pooling a repository and remove its idle worktrees."""
+        root = os.path.realpath(root)
+        with self._lock:
+            self._sizes.pop(root, None)
+            idle = [wt for wt in self._repos.get(root, []) if not wt.leased]
+            for worktree in idle:
+                self._forget_locked(worktree)
+        for worktree in idle:
+            self._remove(worktree)
+        return len(idle)
+
+    def lease(self, root: str, branch: Optional[str] = None) -> Worktree:
+        """Take a worktree at the repository's HEAD, on ``branch`` if given."""
+        root = os.path.realpath(root)
+        with self._lock:
+            self._start_janitor_locked()
+            pool = self._repos.setdefault(root, [])
+            worktree = next((wt for wt in pool if not wt.leased), None)
+            if worktree is None and len(pool) >= self.max_per_repo:
+                raise WorktreeError(
+                    f"All {self.max_per_repo} worktrees of {root} are in use"
+                )
+            if worktree is None:
+                worktree = self._reserve_locked(root)
+            else:
+                self.reused += 1
+            worktree.leased = True
+
+        try:
+            commit = head_commit(root)
+            path = str(worktree.path)
+            if worktree.path.exists():
+                # Adopted worktrees may still hold files from an earlier run
+                _git(["checkout", "-q", "-f", "--detach", commit], path)
+                _git(["clean", "-q", "-fd"], path)
+            else:
+                self._create(worktree, commit)
+            if branch:
+                _git(["checkout", "-q", "-B", branch], path)
+        except Exception:
+            self._discard(worktree)
+            raise
+
+        worktree.branch = branch
+        worktree.uses += 1
+        worktree.last_used = time.time()
+        return worktree
+
+    def release(self, worktree: Worktree, keep: bool = False):
+        """Return a worktree to the pool, discarding uncommitted changes.
+
+        With ``keep`` the worktree is dropped from the pool but left on disk
+        as it is, so changes that couldn't be committed aren't lost.
+        """
+        if keep:
+            with self._lock:
+                self._forget_locked(worktree)
+            return
+
+        path = str(worktree.path)
+        try:
+            _git(["checkout", "-q", "-f", "--detach"], path)
+            _git(["clean", "-q", "-fd"], path)
+        except (WorktreeError, OSError) as e:
+            print(f"Could not reset worktree {path}, removing it: {e}")
+            self._discard(worktree)
+            return
+
+        with self._lock:
+            worktree.leased = False
+            worktree.branch = None
+            worktree.last_used = time.time()
+
+    def gc(self, now: Optional[float] = None) -> int:
+        """Remove idle worktrees beyond each repo's pool size."""
+        now = now or time.time()
+        stale = []
+        with self._lock:
+            for root, pool in self._repos.items():
+                spare = len(pool) - self._sizes.get(root, 0)
+                idle = sorted(
+                    (wt for wt in pool if not wt.leased), key=lambda wt: wt.last_used
+                )
+                for worktree in idle:
+                    if spare <= 0:
+                        break
+                    if now - worktree.last_used > self.idle_timeout:
+                        stale.append(worktree)
+                        spare -= 1
+            for worktree in stale:
+                self._forget_locked(worktree)
+        for worktree in stale:
+            self._remove(worktree)
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "repos": {
+                    root: {
+                        "size": self._sizes.get(root, 0),
+                        "worktrees": [wt.to_dict() for wt in pool],
+                    }
+                    for root, pool in self._repos.items()
+                },
+                "max_per_repo": self.max_per_repo,
+                "idle_timeout": self.idle_timeout,
+                "created": self.created,
+                "reused": self.reused,
+                "removed": self.removed,
+            }
+
+    def _reserve_locked(self, root: str) -> Worktree:
+        """Claim a free pool-<n> name; the caller creates the checkout."""
+        directory = repo_worktree_dir(root, self.base)
+        taken = {wt.path.name for wt in self._repos[root]}
+        n = 0
+        while (
+            f"{POOL_PREFIX}{n}" in taken or (directory / f"{POOL_PREFIX}{n}").exists()
+        ):
+            n += 1
+        worktree = Worktree(root, directory / f"{POOL_PREFIX}{n}")
+        self._repos[root].append(worktree)
+        return worktree
+
+    def _create(self, worktree: Worktree, commit: str):
+        worktree.path.parent.mkdir(parents=True, exist_ok=True)
+        args = ["worktree", "add", "-q", "--detach", str(worktree.path), commit]
+        result = _git(args, worktree.root, check=False)
+        if result.returncode != 0:
+            # The directory may have been deleted while git still lists it;
+            # prune that stale entry and try once more
+            _git(["worktree", "prune"], worktree.root, check=False)
+            _git(args, worktree.root)
+        with self._lock:
+            self.created += 1
+
+    def _adopt(self, root: str):
+        """Take over pool worktrees created by an earlier server run."""
+        # Forget worktrees whose directories were deleted
+        _git(["worktree", "prune"], root, check=False)
+        result = _git(["worktree", "list", "--porcelain"], root, check=False)
+        directory = os.path.realpath(repo_worktree_dir(root, self.base))
+        paths = []
+        # One block of "<key> <value>" lines per worktree
+        for block in result.stdout.split("\n\n"):
+            lines = block.splitlines()
+            if not lines or not lines[0].startswith("worktree "):
+                continue
+            if any(line.startswith("prunable") for line in lines):
+                continue
+            path = Path(lines[0][len("worktree ") :])
+            if path.is_dir():
+                paths.append(path)
+        with self._lock:
+            for path in paths:
+                if (
+                    os.path.dirname(os.path.realpath(path)) == directory
+                    and path.name.startswith(POOL_PREFIX)
+                ):
+                    self._repos[root].append(Worktree(root, path))
+
+    def _fill(self, root: str):
+        with self._lock:
+            missing = self._sizes.get(root, 0) - len(self._repos.get(root, []))
+            reserved = [self._reserve_locked(root) for _ in range(max(0, missing))]
+            for worktree in reserved:
+                worktree.leased = True
+        if not reserved:
+            return
+
+        try:
+            commit = head_commit(root)
+        except (WorktreeError, OSError) as e:
+            print(f"Could not prepare worktrees for {root}: {e}")
+            for worktree in reserved:
+                self._discard(worktree)
+            return
+
+        for worktree in reserved:
+            try:
+                self._create(worktree, commit)
+            except (WorktreeError, OSError) as e:
+                print(f"Could not create worktree {worktree.path}: {e}")
+                self._discard(worktree)
+                continue
+            with self._lock:
+                worktree.leased = False
+        print(f"Prepared {len(reserved)} worktrees for {root}")
+
+    def _discard(self, worktree: Worktree):
+        with self._lock:
+            self._forget_locked(worktree)
+        self._remove(worktree)
+
+    def _forget_locked(self, worktree: Worktree):
+        pool = self._repos.get(worktree.root, [])
+        if worktree in pool:
+            pool.remove(worktree)
+
+    def _remove(self, worktree: Worktree):
+        if worktree.path.exists():
+            remove_worktree(worktree.root, worktree.path)
+        with self._lock:
+            self.removed += 1
+
+    def _start_janitor_locked(self):
+        if self._janitor is None:
+            self._janitor = threading.Thread(target=self._janitor_loop, daemon=True)
+            self._janitor.start()
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(GC_INTERVAL)
+            try:
+                self.gc()
+            except Exception as e:
+                print(f"Worktree janitor error: {e}")